@@ -0,0 +1,73 @@
+"""
+Bulk admin operations from the command line.
+
+Input files are streamed row by row, so they can be arbitrarily large. Use CSV
+with a header row or JSON Lines (one object per line); '-' reads stdin.
+
+    python admin_cli.py create-users users.csv          # username,password,email,phone
+    python admin_cli.py unlock-users locked.jsonl       # {"username": ...}
+    python admin_cli.py resolve-requests ids.csv --status Resolved   # id
+"""
+import argparse
+import csv
+import json
+import sys
+import time
+
+import database as db
+
+
+def read_records(path, file_format=None):
+    """Yield one dict per CSV row or JSONL line."""
+    file_format = file_format or ("jsonl" if path.endswith((".jsonl", ".ndjson")) else "csv")
+    handle = sys.stdin if path == "-" else open(path, newline="", encoding="utf-8")
+    try:
+        if file_format == "jsonl":
+            for line in handle:
+                if line.strip():
+                    yield json.loads(line)
+        else:
+            yield from csv.DictReader(handle)
+    finally:
+        if handle is not sys.stdin:
+            handle.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--db", help=f"database file (default: {db.DB_FILE})")
+    parser.add_argument("--format", choices=("csv", "jsonl"), help="input format (default: from file extension)")
+    parser.add_argument("--chunk-size", type=int, default=db.BULK_CHUNK_SIZE, help="rows per transaction")
+    commands = parser.add_subparsers(dest="command", required=True)
+    commands.add_parser("create-users", help="register users").add_argument("file")
+    commands.add_parser("unlock-users", help="clear lockouts").add_argument("file")
+    resolve = commands.add_parser("resolve-requests", help="set the status of recovery requests")
+    resolve.add_argument("file")
+    resolve.add_argument("--status", default="Resolved")
+    args = parser.parse_args(argv)
+
+    if args.db:
+        db.configure_pool(args.db)
+    db.init_db()
+
+    records = read_records(args.file, args.format)
+    started = time.perf_counter()
+    if args.command == "create-users":
+        count = db.create_users(
+            ((r["username"], r["password"], r.get("email"), r.get("phone")) for r in records),
+            chunk_size=args.chunk_size,
+        )
+        action = "created"
+    elif args.command == "unlock-users":
+        count = db.unlock_users((r["username"] for r in records), chunk_size=args.chunk_size)
+        action = "unlocked"
+    else:
+        count = db.resolve_recovery_requests((int(r["id"]) for r in records), args.status,
+                                             chunk_size=args.chunk_size)
+        action = f"set to {args.status}"
+    elapsed = time.perf_counter() - started
+    print(f"{count} rows {action} in {elapsed:.2f}s ({count / elapsed if elapsed else 0:.0f} rows/s)")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,11 +1,53 @@
+import ipaddress
+import os
+
 import database as db
+from instrumentation import timed
+from passwords import needs_rehash, verify_password
+from rate_limiter import get_limiter
+
+MAX_FAILED_ATTEMPTS = 3
+
+RATE_LIMITED = "Too many attempts. Please wait a minute and try again."
+
+# Comma-separated networks (e.g. from an IP reputation feed) whose logins count as high risk.
+HIGH_RISK_NETWORKS = [
+    ipaddress.ip_network(network.strip(), strict=False)
+    for network in os.getenv("HIGH_RISK_NETWORKS", "").split(",") if network.strip()
+]
+
+
+def source_risk(source):
+    """
+    Classify a login source for the ip_address_risk feature: 'high' inside
+    HIGH_RISK_NETWORKS, 'low' for no source or a private/loopback address, and
+    'medium' for any other (public or unparseable) source.
+    """
+    if not source:
+        return 'low'
+    try:
+        address = ipaddress.ip_address(source)
+    except ValueError:
+        return 'medium'
+    if any(address in network for network in HIGH_RISK_NETWORKS):
+        return 'high'
+    if address.is_private or address.is_loopback:
+        return 'low'
+    return 'medium'
 
 
 class AuthService:
 
     @staticmethod
-    def login_or_register(username, password, email, phone, action):
+    @timed
+    def login_or_register(username, password, email, phone, action, source=None):
+        """
+        ``source`` identifies the caller (e.g. client IP) for rate limiting; attempts
+        over the limit are rejected before any database work.
+        """
         if action == "Register":
+            if source is not None and not get_limiter().allow_source(source):
+                return RATE_LIMITED
             if not email or not phone:
                 return "Email and phone are required for registration."
             if db.create_user(username, password, email, phone):
@@ -13,25 +55,37 @@ class AuthService:
             else:
                 return "Username already exists."
         elif action == "Login":
+            if not get_limiter().allow(username, source):
+                return RATE_LIMITED
             user = db.get_user(username)
-            if not user:
+            # The cached record can lag a lock or unlock made by another process
+            state = db.get_lock_state(username, cached=False) if user else None
+            if not state:
                 return "User not found."
+            failed_attempts, is_locked = state
 
-            _, _, _, _, _, failed_attempts, is_locked = user
             if is_locked:
+                db.record_login_event(username, False, source, source_risk(source))
                 return "ACCOUNT_LOCKED"
 
-            if user[2] == password:
-                db.update_user(username, 0, 0)
+            success = verify_password(password, user.password)
+            db.record_login_event(username, success, source, source_risk(source))
+            if success:
+                if failed_attempts:
+                    db.update_user(username, 0, 0)
+                if needs_rehash(user.password):
+                    # Hash parameters changed since this password was stored; upgrade it now
+                    db.update_user_password(username, password)
                 return f"Welcome, {username}!"
             else:
-                failed_attempts += 1
-                if failed_attempts >= 3:
-                    db.update_user(username, failed_attempts, 1)
+                state = db.record_failed_login(username, MAX_FAILED_ATTEMPTS)
+                if not state:
+                    return "User not found."
+                failed_attempts, is_locked = state
+                if is_locked:
                     return "Too many failed login attempts. Your account is now locked."
                 else:
-                    db.update_user(username, failed_attempts, 0)
-                    return f"Invalid password. You have {3 - failed_attempts} attempts remaining."
+                    return f"Invalid password. You have {MAX_FAILED_ATTEMPTS - failed_attempts} attempts remaining."
 
     @staticmethod
     def unlock_account(username):
@@ -45,10 +99,10 @@ class AuthService:
 
     @staticmethod
     def check_account_status(username):
-        user = db.get_user(username)
-        if not user:
+        state = db.get_lock_state(username)
+        if not state:
             return "not_found"
-        _, _, _, _, _, failed_attempts, is_locked = user
+        _, is_locked = state
         if is_locked:
             return "locked"
         else:
@@ -0,0 +1,89 @@
+import queue
+import threading
+import time
+
+
+class BatchWriter:
+    """
+    Applies queued items in batches on a background thread.
+
+    ``submit`` never blocks: items are handed to ``handler`` as a list, at most
+    ``max_batch`` at a time, once ``flush_interval`` seconds have passed since the
+    first item of the batch arrived or the batch is full. When ``max_queue`` items
+    are already waiting, new ones are dropped and counted instead of slowing the
+    caller down. A failed batch is counted and skipped.
+    """
+
+    def __init__(self, handler, max_batch=500, flush_interval=0.05, max_queue=10000, name="batch-writer"):
+        self.handler = handler
+        self.max_batch = max_batch
+        self.flush_interval = flush_interval
+        self.name = name
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._thread = None
+        self._lock = threading.Lock()
+        self.written = 0
+        self.batches = 0
+        self.dropped = 0
+        self.failed = 0
+
+    def _start(self):
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name=self.name, daemon=True)
+                self._thread.start()
+
+    def submit(self, item):
+        """Queue ``item``; returns False if it was dropped because the queue is full."""
+        if self._thread is None:
+            self._start()
+        try:
+            self._queue.put_nowait(item)
+            return True
+        except queue.Full:
+            self.dropped += 1
+            return False
+
+    def flush(self, timeout=None):
+        """Wait until everything queued so far has been handled. Returns False on timeout."""
+        if self._thread is None:
+            return True
+        done = threading.Event()
+        try:
+            self._queue.put(done, timeout=timeout)
+        except queue.Full:
+            return False
+        return done.wait(timeout)
+
+    def _run(self):
+        while True:
+            batch = [self._queue.get()]
+            deadline = time.monotonic() + self.flush_interval
+            while len(batch) < self.max_batch:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0 or isinstance(batch[-1], threading.Event):
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+            items = [item for item in batch if not isinstance(item, threading.Event)]
+            if items:
+                try:
+                    self.handler(items)
+                    self.written += len(items)
+                except Exception:
+                    self.failed += len(items)
+                self.batches += 1
+            for item in batch:
+                if isinstance(item, threading.Event):
+                    item.set()
+
+    def stats(self):
+        return {
+            "queued": self._queue.qsize(),
+            "written": self.written,
+            "batches": self.batches,
+            "dropped": self.dropped,
+            "failed": self.failed,
+        }
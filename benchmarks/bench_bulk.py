@@ -0,0 +1,75 @@
+"""
+Throughput of the bulk admin helpers vs the per-row functions, in rows/sec.
+
+Password hashing dominates user creation, so it is measured twice: with the
+configured PASSWORD_HASH_ITERATIONS and with cheap hashes to isolate the
+database cost. Runs against a temporary database.
+
+Usage: python benchmarks/bench_bulk.py [--rows N]
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import database as db  # noqa: E402
+import passwords  # noqa: E402
+
+
+def rate(rows, fn):
+    started = time.perf_counter()
+    fn()
+    return rows / (time.perf_counter() - started)
+
+
+def fresh_db():
+    db.configure_pool(os.path.join(tempfile.mkdtemp(), "bench.db"))
+    db.init_db()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=2000)
+    args = parser.parse_args()
+    n = args.rows
+
+    def users(prefix):
+        return [(f"{prefix}{i}", "hunter22", f"{prefix}{i}@example.com", f"555{i:07d}") for i in range(n)]
+
+    results = []
+    for label, iterations in (("cheap hash", 1000), (f"{passwords.ITERATIONS} iterations", passwords.ITERATIONS)):
+        passwords.ITERATIONS = iterations
+        rows = min(n, 200) if iterations > 10_000 else n
+        fresh_db()
+        per_row = rate(rows, lambda: [db.create_user(*u) for u in users("a")[:rows]])
+        bulk = rate(rows, lambda: db.create_users(users("b")[:rows]))
+        results.append((f"create users ({label})", per_row, bulk))
+    passwords.ITERATIONS = 1000
+
+    fresh_db()
+    db.create_users(users("u"))
+    names = [u[0] for u in users("u")]
+    for name in names:
+        db.update_user(name, 3, 1)
+    per_row = rate(n, lambda: [db.update_user(name, 0, 0) for name in names])
+    for name in names:
+        db.update_user(name, 3, 1)
+    bulk = rate(n, lambda: db.unlock_users(names))
+    results.append(("unlock users", per_row, bulk))
+
+    ids = [db.submit_recovery_request_to_db(name, "locked out") for name in names]
+    per_row = rate(n, lambda: [db.update_recovery_request_status_in_db(i, "Resolved") for i in ids])
+    bulk = rate(n, lambda: db.resolve_recovery_requests(ids, "Pending"))
+    results.append(("resolve recovery requests", per_row, bulk))
+
+    print(f"{'operation':<36}{'per-row rows/s':>16}{'bulk rows/s':>14}{'speedup':>9}")
+    for name, per_row, bulk in results:
+        print(f"{name:<36}{per_row:>16.0f}{bulk:>14.0f}{bulk / per_row:>8.1f}x")
+
+
+if __name__ == "__main__":
+    main()
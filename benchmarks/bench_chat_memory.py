@@ -0,0 +1,94 @@
+"""
+Per-turn cost of genai_chat_response over long sessions.
+
+"unbounded history" replays the previous prompt construction (join every turn,
+rescan the history for recovery progress). "rebuilt memory" passes only
+chat_history, so memory is rebuilt each call. "persistent memory" passes one
+ConversationMemory for the whole session, as main.py does. Uses a temporary
+database and the offline stub LLM, so the numbers are prompt-building and
+bookkeeping cost only.
+
+Usage: python benchmarks/bench_chat_memory.py [--turns N] [--budget TOKENS]
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+os.environ.setdefault("LLM_BACKEND", "stub")
+os.environ.setdefault("LLM_STUB_LATENCY", "0")
+
+import database as db  # noqa: E402
+import llm_client  # noqa: E402
+from conversation_memory import ConversationMemory  # noqa: E402
+from login_simulator import LoginSimulator  # noqa: E402
+
+
+class _PromptRecorder(llm_client.StubBackend):
+    """Stub that remembers the size of the last prompt it was sent."""
+
+    last_prompt_chars = 0
+
+    async def generate(self, prompt, temperature=None):
+        self.last_prompt_chars = len(prompt)
+        return "Sure, here is a reasonably long assistant reply that keeps the conversation going for a while."
+
+
+def unbounded_prompt(message, chat_history):
+    any("step 1 complete" in m["content"].lower() for m in chat_history if m["role"] == "assistant")
+    any("step 2 complete" in m["content"].lower() for m in chat_history if m["role"] == "assistant")
+    chat_messages = "\n".join(f"{msg['role'].capitalize()}: {msg['content']}" for msg in chat_history)
+    return f"Conversation so far:\n{chat_messages}\nUser: {message}\nAssistant:"
+
+
+def run_session(turns, mode, budget, backend):
+    history = []
+    memory = ConversationMemory(budget) if mode == "persistent" else None
+    samples = []
+    for turn in range(turns):
+        message = f"Question number {turn}: can you tell me more about my account settings?"
+        history.append({"role": "user", "content": message})
+        started = time.perf_counter()
+        if mode == "unbounded":
+            prompt = unbounded_prompt(message, history)
+            reply = llm_client.get_client().generate(prompt)
+        else:
+            reply = LoginSimulator.genai_chat_response(message, history, "bench_user", memory=memory)
+        samples.append((time.perf_counter() - started, backend.last_prompt_chars))
+        history.append({"role": "assistant", "content": reply})
+    return samples
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--turns", type=int, default=200)
+    parser.add_argument("--budget", type=int, default=1500)
+    args = parser.parse_args()
+
+    db.configure_pool(os.path.join(tempfile.mkdtemp(), "bench.db"))
+    db.init_db()
+    db.create_user("bench_user", "secret", "bench@example.com", "5551234567")
+    backend = _PromptRecorder()
+    llm_client.set_backend(backend)
+
+    checkpoints = sorted({t for t in (1, 10, 50, 100, 200, 500, args.turns) if t <= args.turns})
+    modes = (
+        ("unbounded history (previous behaviour)", "unbounded"),
+        (f"rebuilt memory ({args.budget} tokens)", "rebuilt"),
+        (f"persistent memory ({args.budget} tokens)", "persistent"),
+    )
+    for label, mode in modes:
+        samples = run_session(args.turns, mode, args.budget, backend)
+        print(f"\n{label}")
+        print(f"{'turn':>6}{'ms/turn (avg of 10)':>22}{'prompt chars':>14}")
+        for turn in checkpoints:
+            window = samples[max(0, turn - 10):turn]
+            avg = sum(s for s, _ in window) / len(window)
+            print(f"{turn:>6}{avg * 1000:>22.3f}{samples[turn - 1][1]:>14}")
+
+
+if __name__ == "__main__":
+    main()
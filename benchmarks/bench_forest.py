@@ -0,0 +1,59 @@
+"""
+Parity check and per-prediction latency: sklearn RandomForest vs the compiled
+NumPy forest used by ClassicalAgent at runtime.
+
+Usage: python benchmarks/bench_forest.py [--repeat N]
+"""
+import argparse
+import os
+import sys
+import timeit
+import warnings
+
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import joblib  # noqa: E402
+
+from compiled_forest import CompiledForest, check_parity, compile_forest, parity_grid  # noqa: E402
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeat", type=int, default=200)
+    args = parser.parse_args()
+
+    model_dir = os.path.join(ROOT, "model")
+    forest = joblib.load(os.path.join(model_dir, "classical_agent_model.pkl"))
+    columns = joblib.load(os.path.join(model_dir, "model_columns.pkl"))
+    arrays = compile_forest(forest, columns)
+    compiled = CompiledForest(**arrays)
+    walker = CompiledForest(**{k: v for k, v in arrays.items() if k not in ("split_values", "split_counts", "table")})
+
+    grid = parity_grid(columns)
+    check_parity(forest, compiled, grid)
+    check_parity(forest, walker, grid)
+    print(f"parity: OK on {len(grid)} rows")
+
+    X = grid.to_numpy(dtype=np.float64)
+    single = X[:1]
+    batch = X[:1000]
+    warnings.filterwarnings("ignore", message="X does not have valid feature names")
+    cases = [
+        ("sklearn predict, 1 row", lambda: forest.predict(single), 1),
+        ("tree walk predict, 1 row", lambda: walker.predict(single), 1),
+        ("lookup table predict, 1 row", lambda: compiled.predict(single), 1),
+        ("sklearn predict, 1000 rows", lambda: forest.predict(batch), len(batch)),
+        ("tree walk predict, 1000 rows", lambda: walker.predict(batch), len(batch)),
+        ("lookup table predict, 1000 rows", lambda: compiled.predict(batch), len(batch)),
+    ]
+    print(f"{'case':<34}{'us/call':>12}{'us/prediction':>16}")
+    for name, fn, rows in cases:
+        per_call = min(timeit.repeat(fn, number=args.repeat // 10 or 1, repeat=10)) / (args.repeat // 10 or 1)
+        print(f"{name:<34}{per_call * 1e6:>12.1f}{per_call * 1e6 / rows:>16.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,298 @@
+"""
+Microbenchmarks for every hot path, with JSON baselines and regression checks.
+
+Covers each database.py function, AuthService.login_or_register (success and
+failure), the classical explanation (feature encoding and prediction timed
+separately, then end to end), LoginSimulator.genai_chat_response with the
+offline stub LLM at several history lengths, and the feedback reads at
+several table sizes. Everything runs against temporary databases.
+
+Each benchmark is called repeatedly for at least --min-time seconds; the
+median call time is what gets saved and compared.
+
+Usage:
+    python benchmarks/bench_hot_paths.py --save baseline.json
+    python benchmarks/bench_hot_paths.py --compare baseline.json [--threshold 0.25]
+    python benchmarks/bench_hot_paths.py --filter feedback --feedback-rows 10000,100000
+"""
+import argparse
+import itertools
+import json
+import os
+import platform
+import statistics
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+os.environ.setdefault("LLM_BACKEND", "stub")
+os.environ.setdefault("LLM_STUB_LATENCY", "0")
+
+import classical_agent  # noqa: E402
+import database as db  # noqa: E402
+import passwords  # noqa: E402
+import rate_limiter  # noqa: E402
+from auth_service import AuthService  # noqa: E402
+from classical_agent import ClassicalAgent  # noqa: E402
+from login_simulator import LoginSimulator  # noqa: E402
+from recovery_state import STARTED  # noqa: E402
+
+USERS = 1000
+PASSWORD = "Passw0rd!"
+HISTORY_LENGTHS = (0, 10, 100, 1000)
+DEFAULT_FEEDBACK_ROWS = "10000,100000,1000000"
+
+
+def measure(fn, min_time, min_rounds=5, reset=None):
+    """Call ``fn`` until ``min_time`` seconds and ``min_rounds`` calls have passed; ``reset`` runs untimed."""
+    samples = []
+    deadline = time.perf_counter() + min_time
+    while len(samples) < min_rounds or time.perf_counter() < deadline:
+        if reset is not None:
+            reset()
+        started = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - started)
+    return {
+        "median": statistics.median(samples),
+        "mean": statistics.fmean(samples),
+        "min": min(samples),
+        "stdev": statistics.stdev(samples) if len(samples) > 1 else 0.0,
+        "rounds": len(samples),
+    }
+
+
+def fresh_db(workdir, name):
+    db.configure_pool(os.path.join(workdir, f"{name}.db"))
+    db.init_db()
+
+
+def seed_users(n):
+    db.create_users([(f"user{i}", PASSWORD, f"user{i}@example.com", f"555{i:07d}") for i in range(n)])
+
+
+def seed_feedback(rows, users=USERS):
+    batch = ((f"user{i % users}", i % 5 + 1, f"comment {i}") for i in range(rows))
+    with db.get_connection() as conn:
+        for chunk in db._chunks(batch, 50_000):
+            with conn:
+                conn.executemany("INSERT INTO feedback (username, rating, comment) VALUES (?, ?, ?)", chunk)
+
+
+def database_cases(workdir):
+    fresh_db(workdir, "functions")
+    seed_users(USERS)
+    seed_feedback(USERS)
+    names = [f"user{i}" for i in range(100)]
+    counter = itertools.count()
+    request_ids = [db.submit_recovery_request_to_db(name, "locked out") for name in names]
+    db.start_recovery_session("bench-session", "user0", "locked out", STARTED)
+
+    def get_connection():
+        with db.get_connection() as conn:
+            conn.execute("SELECT 1")
+
+    def new_users(n):
+        return [(f"new{next(counter)}", PASSWORD, "new@example.com", "5550000000") for _ in range(n)]
+
+    return [
+        ("db.init_db (schema current)", db.init_db, None),
+        ("db.get_connection", get_connection, None),
+        ("db.submit_recovery_request_to_db", lambda: db.submit_recovery_request_to_db("user1", "locked out"), None),
+        ("db.get_pending_recovery_requests_from_db", db.get_pending_recovery_requests_from_db, None),
+        ("db.get_pending_recovery_requests_from_db (page of 50)",
+         lambda: db.get_pending_recovery_requests_from_db(limit=50), None),
+        ("db.get_recovery_queue_stats", db.get_recovery_queue_stats, None),
+        ("db.update_recovery_request_status_in_db",
+         lambda: db.update_recovery_request_status_in_db(request_ids[0], "Pending"), None),
+        ("db.resolve_recovery_requests (100 ids)", lambda: db.resolve_recovery_requests(request_ids, "Pending"), None),
+        ("db.start_recovery_session",
+         lambda: db.start_recovery_session(f"s{next(counter)}", "user2", "locked out", STARTED), None),
+        ("db.get_recovery_session", lambda: db.get_recovery_session("bench-session"), None),
+        ("db.advance_recovery_session",
+         lambda: db.advance_recovery_session("bench-session", "user0", STARTED, STARTED), None),
+        ("db.create_user", lambda: db.create_user(*new_users(1)[0]), None),
+        ("db.create_users (100 rows)", lambda: db.create_users(new_users(100)), None),
+        ("db.get_user (cached)", lambda: db.get_user("user3"), None),
+        ("db.get_user (uncached)", lambda: db.get_user("user3"), lambda: db._user_cache.discard("user3")),
+        ("db.get_lock_state (cached)", lambda: db.get_lock_state("user3"), None),
+        ("db.get_lock_state (uncached)", lambda: db.get_lock_state("user3"), lambda: db._user_cache.discard("user3")),
+        (f"db.get_lock_states ({USERS} users)", db.get_lock_states, None),
+        ("db.get_lock_states (10 users)", lambda: db.get_lock_states(names[:10]), None),
+        ("db.update_user", lambda: db.update_user("user4", 0, 0), None),
+        ("db.unlock_users (100 users)", lambda: db.unlock_users(names), None),
+        ("db.record_failed_login", lambda: db.record_failed_login("user5", 3), None),
+        ("db.update_user_password", lambda: db.update_user_password("user6", PASSWORD), None),
+        ("db.submit_feedback_to_db", lambda: db.submit_feedback_to_db("user7", 5, "great"), None),
+        ("db.get_feedback_for_user (first page)", lambda: db.get_feedback_for_user("user8"), None),
+        (f"db.iter_feedback (~{USERS} rows)", lambda: sum(1 for _ in db.iter_feedback()), None),
+        (f"db.get_feedback_from_db (~{USERS} rows)", db.get_feedback_from_db, None),
+    ]
+
+
+def login_cases(workdir):
+    fresh_db(workdir, "login")
+    seed_users(10)
+    # The same few users log in thousands of times; only the last case is throttled
+    unlimited = rate_limiter.RateLimiter(user_rate=1e12, user_burst=10**9)
+    throttled = rate_limiter.RateLimiter(user_rate=1e-9, user_burst=1)
+    throttled.allow("user3")
+
+    def unlock():
+        db.update_user("user1", 0, 0)
+
+    def rate_limited():
+        rate_limiter.set_limiter(throttled)
+        try:
+            AuthService.login_or_register("user3", "wrong", None, None, "Login")
+        finally:
+            rate_limiter.set_limiter(unlimited)
+
+    rate_limiter.set_limiter(unlimited)
+    return [
+        ("login success", lambda: AuthService.login_or_register("user0", PASSWORD, None, None, "Login"), None),
+        ("login failure", lambda: AuthService.login_or_register("user1", "wrong", None, None, "Login"), unlock),
+        ("login locked account", lambda: AuthService.login_or_register("user2", "wrong", None, None, "Login"),
+         lambda: db.update_user("user2", 3, 1)),
+        ("login unknown user", lambda: AuthService.login_or_register("nobody", "wrong", None, None, "Login"), None),
+        ("login rate limited", rate_limited, None),
+    ]
+
+
+def classical_cases(workdir):
+    fresh_db(workdir, "classical")
+    seed_users(10)
+    db.update_user("user0", 3, 1)
+    row = [(3, classical_agent.DEFAULT_TIME_SINCE_LAST_LOGIN, classical_agent.DEFAULT_IP_ADDRESS_RISK)]
+    features = classical_agent.encode_features(row)
+    return [
+        ("classical encode_features (1 row)", lambda: classical_agent.encode_features(row), None),
+        ("classical predict_lock_proba (1 row)", lambda: classical_agent.predict_lock_proba(features), None),
+        ("classical block explanation (locked)", lambda: ClassicalAgent.get_classical_block_explanation("user0"),
+         None),
+    ]
+
+
+def chat_cases(workdir):
+    fresh_db(workdir, "chat")
+    seed_users(1)
+    cases = []
+    for length in HISTORY_LENGTHS:
+        history = [
+            {"role": "user" if i % 2 == 0 else "assistant", "content": f"Message {i} about my account settings."}
+            for i in range(length)
+        ]
+        cases.append((
+            f"genai_chat_response ({length} history)",
+            lambda history=history: LoginSimulator.genai_chat_response("How do I change my email?", history, "user0"),
+            None,
+        ))
+    return cases
+
+
+def feedback_cases(workdir, sizes):
+    cases = []
+    current = {}
+
+    def use_table(rows):
+        # Both benchmarks of one size share a table; it is only built once.
+        if current.get("rows") != rows:
+            fresh_db(workdir, f"feedback_{rows}")
+            seed_users(10)
+            seed_feedback(rows, users=10)
+            current["rows"] = rows
+
+    for rows in sizes:
+        setup = lambda rows=rows: use_table(rows)  # noqa: E731
+        cases.append((f"get_feedback_from_db ({rows} rows)", db.get_feedback_from_db, None, setup))
+        cases.append((f"get_feedback_for_user ({rows} rows)", lambda: db.get_feedback_for_user("user1"), None, setup))
+    return cases
+
+
+def compare(results, baseline, threshold):
+    """Print the change against ``baseline`` and return the names that got slower than ``threshold``."""
+    regressions = []
+    print(f"\n{'benchmark':<48}{'baseline':>12}{'current':>12}{'change':>9}")
+    for name, result in results.items():
+        previous = baseline.get(name)
+        if previous is None:
+            print(f"{name:<48}{'-':>12}{format_time(result['median']):>12}{'new':>9}")
+            continue
+        change = result["median"] / previous["median"] - 1
+        flag = ""
+        if change > threshold:
+            regressions.append(name)
+            flag = "  SLOWER"
+        print(f"{name:<48}{format_time(previous['median']):>12}{format_time(result['median']):>12}"
+              f"{change:>+8.0%}{flag}")
+    return regressions
+
+
+def format_time(seconds):
+    if seconds < 1e-3:
+        return f"{seconds * 1e6:.1f} us"
+    if seconds < 1:
+        return f"{seconds * 1e3:.2f} ms"
+    return f"{seconds:.2f} s"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--min-time", type=float, default=0.5, help="seconds to spend on each benchmark")
+    parser.add_argument("--filter", help="only run benchmarks whose name contains this text")
+    parser.add_argument("--feedback-rows", default=DEFAULT_FEEDBACK_ROWS,
+                        help="comma-separated feedback table sizes")
+    parser.add_argument("--hash-iterations", type=int, default=passwords.ITERATIONS)
+    parser.add_argument("--save", help="write the results to this JSON file")
+    parser.add_argument("--compare", help="compare against a JSON file written by --save")
+    parser.add_argument("--threshold", type=float, default=0.25,
+                        help="flag benchmarks whose median got slower by more than this fraction")
+    args = parser.parse_args()
+    passwords.ITERATIONS = args.hash_iterations
+    sizes = [int(rows) for rows in args.feedback_rows.split(",") if rows]
+
+    workdir = tempfile.mkdtemp(prefix="login_bench_")
+    groups = [
+        lambda: database_cases(workdir),
+        lambda: login_cases(workdir),
+        lambda: classical_cases(workdir),
+        lambda: chat_cases(workdir),
+        lambda: feedback_cases(workdir, sizes),
+    ]
+    results = {}
+    for build in groups:
+        for case in build():
+            name, fn, reset = case[:3]
+            setup = case[3] if len(case) > 3 else None
+            if args.filter and args.filter not in name:
+                continue
+            if setup is not None:
+                setup()
+            results[name] = measure(fn, args.min_time, reset=reset)
+            print(f"{name:<48}{format_time(results[name]['median']):>12}  ({results[name]['rounds']} rounds)")
+
+    if args.save:
+        with open(args.save, "w") as f:
+            json.dump({
+                "meta": {
+                    "python": platform.python_version(),
+                    "machine": platform.machine(),
+                    "cpus": os.cpu_count(),
+                    "hash_iterations": args.hash_iterations,
+                    "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+                },
+                "results": results,
+            }, f, indent=2)
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)["results"]
+        regressions = compare(results, baseline, args.threshold)
+        if regressions:
+            print(f"\n{len(regressions)} benchmark(s) slower than the baseline by more than {args.threshold:.0%}")
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
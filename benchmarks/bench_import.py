@@ -0,0 +1,56 @@
+"""
+Cold-start benchmark for classical_agent.
+
+Each sample is a fresh interpreter, so the numbers include everything a new
+Streamlit process pays. "import" is what importing the module costs now; the
+"load_model()" rows add the first model load, and the sklearn pickle row is what
+the old eager import paid on every start.
+
+Usage: python benchmarks/bench_import.py [--runs N]
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+LOAD = "import classical_agent; classical_agent.load_model()"
+
+CASES = [
+    ("import classical_agent", "import classical_agent", {}),
+    ("load_model() (compiled forest)", LOAD, {}),
+    ("load_model() (sklearn pickle)", LOAD, {"CLASSICAL_MODEL_SKLEARN": "1"}),
+    ("load_model() (sklearn, mmap)", LOAD, {"CLASSICAL_MODEL_SKLEARN": "1", "CLASSICAL_MODEL_MMAP": "1"}),
+]
+
+
+def time_snippet(snippet, runs, env):
+    samples = []
+    for _ in range(runs):
+        started = time.perf_counter()
+        subprocess.run([sys.executable, "-c", snippet], cwd=ROOT, env=env, check=True)
+        samples.append(time.perf_counter() - started)
+    return samples
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=10)
+    args = parser.parse_args()
+
+    baseline = time_snippet("pass", args.runs, os.environ.copy())
+    interpreter = statistics.median(baseline)
+    print(f"{'case':<36}{'median ms':>12}{'p90 ms':>10}  (interpreter start {interpreter * 1000:.1f} ms subtracted)")
+    for name, snippet, overrides in CASES:
+        env = dict(os.environ, CLASSICAL_MODEL_SKLEARN="0", CLASSICAL_MODEL_MMAP="0")
+        env.update(overrides)
+        samples = sorted(s - interpreter for s in time_snippet(snippet, args.runs, env))
+        p90 = samples[min(len(samples) - 1, int(len(samples) * 0.9))]
+        print(f"{name:<36}{statistics.median(samples) * 1000:>12.1f}{p90 * 1000:>10.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,70 @@
+"""
+Password hashing cost vs login latency budget.
+
+For each PBKDF2 iteration count, measures the time of one verify and checks two
+limits: a single login must stay within --budget-ms, and --qps logins per second
+must fit in --cores CPU cores (hashlib releases the GIL, so verifies run in
+parallel across threads). Prints the largest iteration count that satisfies both;
+set it with PASSWORD_HASH_ITERATIONS.
+
+Also times init_db() on an up-to-date database, which main.py runs on every rerun.
+
+Usage: python benchmarks/bench_password_hash.py [--budget-ms 100] [--qps 20] [--cores 2]
+"""
+import argparse
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import database as db  # noqa: E402
+from passwords import hash_password, verify_password  # noqa: E402
+
+CANDIDATES = (10_000, 50_000, 100_000, 200_000, 310_000, 600_000)
+
+
+def time_verify(iterations, samples=5):
+    stored = hash_password("correct horse battery staple", iterations)
+    timings = []
+    for _ in range(samples):
+        started = time.perf_counter()
+        verify_password("correct horse battery staple", stored)
+        timings.append(time.perf_counter() - started)
+    return statistics.median(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--budget-ms", type=float, default=100.0, help="max hashing time per login")
+    parser.add_argument("--qps", type=float, default=20.0, help="target logins per second")
+    parser.add_argument("--cores", type=float, default=float(os.cpu_count() or 1), help="cores available for hashing")
+    args = parser.parse_args()
+
+    print(f"budget {args.budget_ms:.0f} ms/login, {args.qps:.0f} logins/s on {args.cores:.0f} core(s)\n")
+    print(f"{'iterations':>10}{'ms/verify':>12}{'max QPS':>10}{'cpu use':>10}  ok")
+    best = None
+    for iterations in CANDIDATES:
+        seconds = time_verify(iterations)
+        max_qps = args.cores / seconds
+        utilisation = args.qps * seconds / args.cores
+        ok = seconds * 1000 <= args.budget_ms and utilisation <= 1.0
+        if ok:
+            best = iterations
+        print(f"{iterations:>10}{seconds * 1000:>12.1f}{max_qps:>10.0f}{utilisation:>9.0%}  {'yes' if ok else 'no'}")
+    print(f"\nrecommended PASSWORD_HASH_ITERATIONS={best}" if best else "\nno candidate fits the budget")
+
+    db.configure_pool(os.path.join(tempfile.mkdtemp(), "bench.db"))
+    db.init_db()
+    runs = 1000
+    started = time.perf_counter()
+    for _ in range(runs):
+        db.init_db()
+    print(f"init_db() on a current schema: {(time.perf_counter() - started) / runs * 1e6:.1f} us")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,201 @@
+"""
+Throughput of the multi-process server (server.py) as the worker count grows.
+
+For each --workers value a fresh server is started on a temporary copy of the
+database (offline stub LLM, rate limits lifted), then --clients client
+processes with --connections keep-alive connections each send a weighted mix
+of requests for --duration seconds:
+
+    login      /login with the right password for a seeded user
+    bad_login  /login with a wrong password (a write through the group-commit writer)
+    status     /status
+    explain    /explain with the classical agent
+    feedback   /feedback (a write through the group-commit writer)
+
+Requests per second, p50/p99 latency and the speed-up over the first run are
+reported per worker count.
+
+Usage:
+    python benchmarks/bench_server_scaling.py --workers 1,2,4,8 --duration 10
+    python benchmarks/bench_server_scaling.py --mix status=1 --json scaling.json
+"""
+import argparse
+import http.client
+import itertools
+import json
+import multiprocessing
+import os
+import random
+import re
+import shutil
+import signal
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from load_harness import PASSWORD, SEEDED_USERS, percentile, prepare_database  # noqa: E402
+
+DEFAULT_MIX = "login=4,bad_login=1,status=4,explain=2,feedback=1"
+
+REQUESTS = {
+    "login": lambda: ("/login", {"username": f"seed_{random.randrange(SEEDED_USERS)}", "password": PASSWORD}),
+    "bad_login": lambda: ("/login", {"username": f"victim_{random.randrange(SEEDED_USERS)}", "password": "wrong"}),
+    "status": lambda: ("/status", {"username": f"victim_{random.randrange(SEEDED_USERS)}"}),
+    "explain": lambda: ("/explain", {"username": f"seed_{random.randrange(SEEDED_USERS)}"}),
+    "feedback": lambda: ("/feedback", {"username": f"seed_{random.randrange(SEEDED_USERS)}", "rating": 5,
+                                       "comment": "benchmark"}),
+}
+
+
+def start_server(db_file, workers, hash_iterations, llm_latency):
+    env = dict(
+        os.environ,
+        LLM_BACKEND="stub",
+        LLM_STUB_LATENCY=str(llm_latency),
+        PASSWORD_HASH_ITERATIONS=str(hash_iterations),
+        # A few hundred seeded users take thousands of logins a second here
+        RATE_LIMIT_USER_PER_MINUTE="1e15",
+        RATE_LIMIT_USER_BURST=str(10**9),
+        RATE_LIMIT_SOURCE_PER_MINUTE="1e15",
+        RATE_LIMIT_SOURCE_BURST=str(10**9),
+    )
+    process = subprocess.Popen(
+        [sys.executable, os.path.join(ROOT, "server.py"), "--port", "0", "--workers", str(workers), "--db", db_file],
+        cwd=ROOT, env=env, stdout=subprocess.PIPE, text=True,
+    )
+    match = re.search(r":(\d+) with", process.stdout.readline())
+    if not match:
+        process.kill()
+        raise SystemExit("server.py did not start")
+    port = int(match.group(1))
+    for _ in range(100):
+        try:
+            connection = http.client.HTTPConnection("127.0.0.1", port, timeout=5)
+            connection.request("GET", "/health")
+            connection.getresponse().read()
+            return process, port
+        except OSError:
+            time.sleep(0.05)
+    process.kill()
+    raise SystemExit("server.py did not answer /health")
+
+
+def stop_server(process):
+    process.send_signal(signal.SIGTERM)
+    try:
+        process.wait(timeout=15)
+    except subprocess.TimeoutExpired:
+        process.kill()
+
+
+def _client_process(args):
+    port, connections, mix, deadline = args
+    names, weights = zip(*mix.items())
+    results = []
+
+    def run():
+        samples, errors = [], 0
+        connection = http.client.HTTPConnection("127.0.0.1", port, timeout=30)
+        while time.time() < deadline:
+            path, body = REQUESTS[random.choices(names, weights)[0]]()
+            data = json.dumps(body)
+            started = time.perf_counter()
+            try:
+                connection.request("POST", path, data, {"Content-Type": "application/json"})
+                response = connection.getresponse()
+                response.read()
+                if response.status != 200:
+                    errors += 1
+            except (OSError, http.client.HTTPException):
+                errors += 1
+                connection.close()
+                connection = http.client.HTTPConnection("127.0.0.1", port, timeout=30)
+            samples.append(time.perf_counter() - started)
+        connection.close()
+        results.append((samples, errors))
+
+    threads = [threading.Thread(target=run) for _ in range(connections)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return results
+
+
+def run_load(port, clients, connections, mix, duration):
+    deadline = time.time() + duration
+    started = time.perf_counter()
+    with multiprocessing.get_context("spawn").Pool(clients) as pool:
+        per_client = pool.map(_client_process, [(port, connections, mix, deadline)] * clients)
+    wall = time.perf_counter() - started
+    results = list(itertools.chain.from_iterable(per_client))
+    latencies = sorted(itertools.chain.from_iterable(samples for samples, _ in results))
+    return {
+        "requests": len(latencies),
+        "errors": sum(errors for _, errors in results),
+        "requests_per_sec": len(latencies) / wall,
+        "p50_ms": percentile(latencies, 0.50) * 1000,
+        "p99_ms": percentile(latencies, 0.99) * 1000,
+    }
+
+
+def parse_mix(text):
+    mix = {}
+    for part in text.split(","):
+        name, _, weight = part.partition("=")
+        if name.strip() not in REQUESTS:
+            raise SystemExit(f"unknown request in --mix: {name}")
+        mix[name.strip()] = float(weight or 1)
+    return mix
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--workers", default="1,2,4,8", help="comma-separated server worker counts")
+    parser.add_argument("--clients", type=int, default=4, help="client processes")
+    parser.add_argument("--connections", type=int, default=8, help="keep-alive connections per client process")
+    parser.add_argument("--duration", type=float, default=10.0, help="seconds per worker count")
+    parser.add_argument("--mix", default=DEFAULT_MIX, help="comma-separated request=weight list")
+    parser.add_argument("--source-db", default=os.path.join(ROOT, "login_security.db"),
+                        help="database to copy (left untouched)")
+    parser.add_argument("--llm-latency", type=float, default=0.05, help="stub LLM latency in seconds")
+    parser.add_argument("--hash-iterations", type=int, default=int(os.getenv("PASSWORD_HASH_ITERATIONS", "100000")))
+    parser.add_argument("--json", help="also write the results to this file")
+    args = parser.parse_args()
+    mix = parse_mix(args.mix)
+    worker_counts = [int(n) for n in args.workers.split(",") if n]
+
+    report = {}
+    for workers in worker_counts:
+        workdir = tempfile.mkdtemp(prefix="login_scaling_")
+        try:
+            db_file = prepare_database(args.source_db, workdir, args.hash_iterations)
+            process, port = start_server(db_file, workers, args.hash_iterations, args.llm_latency)
+            try:
+                report[workers] = run_load(port, args.clients, args.connections, mix, args.duration)
+            finally:
+                stop_server(process)
+        finally:
+            shutil.rmtree(workdir, ignore_errors=True)
+        row = report[workers]
+        print(f"{workers} worker(s): {row['requests_per_sec']:.0f} req/s, p50 {row['p50_ms']:.1f} ms, "
+              f"p99 {row['p99_ms']:.1f} ms, {row['errors']} errors", flush=True)
+
+    base = report[worker_counts[0]]["requests_per_sec"] or 1.0
+    print(f"\n{'workers':>8}{'requests':>10}{'errors':>8}{'req/s':>10}{'p50 ms':>9}{'p99 ms':>9}{'speed-up':>10}")
+    for workers, row in report.items():
+        print(f"{workers:>8}{row['requests']:>10}{row['errors']:>8}{row['requests_per_sec']:>10.0f}"
+              f"{row['p50_ms']:>9.1f}{row['p99_ms']:>9.1f}{row['requests_per_sec'] / base:>9.2f}x")
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"clients": args.clients, "connections": args.connections, "mix": mix,
+                       "duration": args.duration, "results": report}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
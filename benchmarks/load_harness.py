@@ -0,0 +1,237 @@
+"""
+Headless load generator for the login and recovery flows.
+
+Drives a weighted mix of operations from many threads or processes against a
+temporary copy of the database, with the offline stub LLM, and reports
+p50/p95/p99 latency and throughput per operation:
+
+    register     AuthService.login_or_register(..., "Register")
+    good_login   correct password for a seeded user
+    bad_login    wrong password (the user is unlocked again when it locks)
+    lockout      three wrong passwords on a fresh user, then the classical explanation
+    recovery     lockout followed by the full 3-step chatbot recovery
+    explain      GenAIAgent.get_genai_block_explanation through the stub LLM
+
+Usage:
+    python benchmarks/load_harness.py --workers 8 --duration 10
+    python benchmarks/load_harness.py --mode process --workers 4 --mix good_login=8,bad_login=2
+"""
+import argparse
+import itertools
+import json
+import multiprocessing
+import os
+import random
+import shutil
+import sys
+import tempfile
+import threading
+import time
+import uuid
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+DEFAULT_MIX = "register=1,good_login=6,bad_login=2,lockout=1,recovery=1,explain=1"
+PASSWORD = "Passw0rd!"
+SEEDED_USERS = 200
+
+
+def _setup_worker(db_file, llm_latency, hash_iterations, rate_limit=False):
+    """Point this process at the load-test database and the stub LLM before importing the app."""
+    os.environ["LLM_BACKEND"] = "stub"
+    os.environ["LLM_STUB_LATENCY"] = str(llm_latency)
+    os.environ["PASSWORD_HASH_ITERATIONS"] = str(hash_iterations)
+    import database as db
+    import rate_limiter
+    db.configure_pool(db_file)
+    if not rate_limit:
+        # A handful of seeded users take thousands of logins a second here
+        rate_limiter.set_limiter(rate_limiter.RateLimiter(user_rate=1e12, user_burst=10**9))
+
+
+class Operations:
+    def __init__(self, worker_id):
+        from auth_service import AuthService
+        from classical_agent import ClassicalAgent
+        from gen_ai_agent import GenAIAgent
+        from login_simulator import LoginSimulator
+        import database as db
+        self.auth = AuthService
+        self.classical = ClassicalAgent
+        self.genai = GenAIAgent
+        self.simulator = LoginSimulator
+        self.db = db
+        self.worker_id = worker_id
+        self.counter = itertools.count()
+
+    def _new_user(self):
+        username = f"load_{self.worker_id}_{next(self.counter)}_{uuid.uuid4().hex[:6]}"
+        self.db.create_user(username, PASSWORD, f"{username}@example.com", "5550001111")
+        return username
+
+    def _lock(self, username):
+        for _ in range(3):
+            self.auth.login_or_register(username, "wrong", None, None, "Login")
+
+    def register(self):
+        username = f"reg_{self.worker_id}_{next(self.counter)}_{uuid.uuid4().hex[:6]}"
+        result = self.auth.login_or_register(username, PASSWORD, f"{username}@example.com", "5550001111", "Register")
+        return result.startswith("Registration successful")
+
+    def good_login(self):
+        username = f"seed_{random.randrange(SEEDED_USERS)}"
+        return self.auth.login_or_register(username, PASSWORD, None, None, "Login").startswith("Welcome")
+
+    def bad_login(self):
+        username = f"victim_{random.randrange(SEEDED_USERS)}"
+        result = self.auth.login_or_register(username, "wrong", None, None, "Login")
+        if result in ("ACCOUNT_LOCKED", "Too many failed login attempts. Your account is now locked."):
+            self.auth.unlock_account(username)
+        return result != "User not found."
+
+    def lockout(self):
+        username = self._new_user()
+        self._lock(username)
+        return "locked" in self.classical.get_classical_block_explanation(username)
+
+    def recovery(self):
+        username = self._new_user()
+        self._lock(username)
+        session_id = uuid.uuid4().hex
+        from conversation_memory import ConversationMemory
+        memory = ConversationMemory()
+        for message in ("hi", f"{username}@example.com", "125.50", "NewPassw0rd"):
+            reply = self.simulator.genai_chat_response(message, [], username, memory=memory, session_id=session_id)
+        return "account is now unlocked" in reply and self.auth.check_account_status(username) == "active"
+
+    def explain(self):
+        username = f"seed_{random.randrange(SEEDED_USERS)}"
+        return not self.genai.get_genai_block_explanation(username).startswith("Could not")
+
+
+def _run_worker(worker_id, mix, deadline, max_ops):
+    ops = Operations(worker_id)
+    names, weights = zip(*mix.items())
+    samples = {name: [] for name in names}
+    failures = {name: 0 for name in names}
+    done = 0
+    while time.time() < deadline and (not max_ops or done < max_ops):
+        name = random.choices(names, weights)[0]
+        started = time.perf_counter()
+        try:
+            ok = getattr(ops, name)()
+        except Exception:
+            ok = False
+        samples[name].append(time.perf_counter() - started)
+        if not ok:
+            failures[name] += 1
+        done += 1
+    return samples, failures
+
+
+def _process_worker(args):
+    worker_id, db_file, llm_latency, hash_iterations, rate_limit, mix, deadline, max_ops = args
+    _setup_worker(db_file, llm_latency, hash_iterations, rate_limit)
+    return _run_worker(worker_id, mix, deadline, max_ops)
+
+
+def percentile(sorted_values, q):
+    if not sorted_values:
+        return 0.0
+    return sorted_values[min(len(sorted_values) - 1, int(round(q * (len(sorted_values) - 1))))]
+
+
+def parse_mix(text):
+    mix = {}
+    for part in text.split(","):
+        name, _, weight = part.partition("=")
+        if not hasattr(Operations, name.strip()):
+            raise SystemExit(f"unknown operation in --mix: {name}")
+        mix[name.strip()] = float(weight or 1)
+    return mix
+
+
+def prepare_database(source, workdir, hash_iterations):
+    db_file = os.path.join(workdir, "load.db")
+    if source and os.path.exists(source):
+        shutil.copy(source, db_file)
+    _setup_worker(db_file, 0, hash_iterations)
+    import database as db
+    db.init_db()
+    db.create_users(
+        [(f"seed_{i}", PASSWORD, f"seed_{i}@example.com", "5550001111") for i in range(SEEDED_USERS)]
+        + [(f"victim_{i}", PASSWORD, f"victim_{i}@example.com", "5550001111") for i in range(SEEDED_USERS)]
+    )
+    return db_file
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--mode", choices=("thread", "process"), default="thread")
+    parser.add_argument("--duration", type=float, default=10.0, help="seconds to run")
+    parser.add_argument("--ops", type=int, default=0, help="stop each worker after this many operations")
+    parser.add_argument("--mix", default=DEFAULT_MIX, help="comma-separated operation=weight list")
+    parser.add_argument("--source-db", default=os.path.join(ROOT, "login_security.db"),
+                        help="database to copy (left untouched)")
+    parser.add_argument("--llm-latency", type=float, default=0.05, help="stub LLM latency in seconds")
+    parser.add_argument("--hash-iterations", type=int, default=int(os.getenv("PASSWORD_HASH_ITERATIONS", "100000")))
+    parser.add_argument("--rate-limit", action="store_true",
+                        help="keep the configured login rate limits (off by default: seeded users would be throttled)")
+    parser.add_argument("--json", help="also write the results to this file")
+    args = parser.parse_args()
+    mix = parse_mix(args.mix)
+
+    workdir = tempfile.mkdtemp(prefix="login_load_")
+    try:
+        db_file = prepare_database(args.source_db, workdir, args.hash_iterations)
+        deadline = time.time() + args.duration
+        started = time.perf_counter()
+        if args.mode == "process":
+            jobs = [(i, db_file, args.llm_latency, args.hash_iterations, args.rate_limit, mix, deadline, args.ops)
+                    for i in range(args.workers)]
+            with multiprocessing.get_context("spawn").Pool(args.workers) as pool:
+                results = pool.map(_process_worker, jobs)
+        else:
+            _setup_worker(db_file, args.llm_latency, args.hash_iterations, args.rate_limit)
+            results = [None] * args.workers
+
+            def run(i):
+                results[i] = _run_worker(i, mix, deadline, args.ops)
+
+            threads = [threading.Thread(target=run, args=(i,)) for i in range(args.workers)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        wall = time.perf_counter() - started
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    report = {}
+    for name in mix:
+        latencies = sorted(itertools.chain.from_iterable(samples[name] for samples, _ in results))
+        failures = sum(failed[name] for _, failed in results)
+        report[name] = {
+            "count": len(latencies),
+            "failures": failures,
+            "ops_per_sec": len(latencies) / wall,
+            "p50_ms": percentile(latencies, 0.50) * 1000,
+            "p95_ms": percentile(latencies, 0.95) * 1000,
+            "p99_ms": percentile(latencies, 0.99) * 1000,
+        }
+
+    print(f"{args.workers} {args.mode} workers, {wall:.1f}s wall\n")
+    print(f"{'operation':<12}{'count':>8}{'fail':>6}{'ops/s':>9}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}")
+    for name, row in report.items():
+        print(f"{name:<12}{row['count']:>8}{row['failures']:>6}{row['ops_per_sec']:>9.1f}"
+              f"{row['p50_ms']:>10.1f}{row['p95_ms']:>10.1f}{row['p99_ms']:>10.1f}")
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"workers": args.workers, "mode": args.mode, "wall_seconds": wall, "operations": report}, f,
+                      indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,66 +1,218 @@
-import joblib
-import pandas as pd
+import os
+import threading
+import time
+import warnings
+
+import numpy as np
 
 import database as db
+import model_registry
+from compiled_forest import CompiledForest
+from instrumentation import timed
+from message_catalog import get_catalog
+from rate_limiter import get_limiter
+
+MODEL_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'model')
+MODEL_FILE = os.path.join(MODEL_DIR, 'classical_agent_model.pkl')
+MODEL_COLUMNS_FILE = os.path.join(MODEL_DIR, 'model_columns.pkl')
+COMPILED_FOREST_FILE = os.path.join(MODEL_DIR, 'classical_agent_forest.npz')
+
+# Set CLASSICAL_MODEL_MMAP=1 to memory-map the model's arrays read-only, so several
+# worker processes on one host share the same physical pages.
+MODEL_MMAP = os.getenv('CLASSICAL_MODEL_MMAP', '0') == '1'
+
+# The compiled forest (see compiled_forest.py) is used when present. Set
+# CLASSICAL_MODEL_SKLEARN=1 to force the pickled sklearn model instead.
+USE_SKLEARN = os.getenv('CLASSICAL_MODEL_SKLEARN', '0') == '1'
+
+# When a model version has been published (model/CURRENT, see model_registry.py)
+# that version is used instead of the files above. CURRENT is re-read at most every
+# this many seconds, so activating a new version swaps it in without a restart.
+MODEL_CHECK_INTERVAL = float(os.getenv('CLASSICAL_MODEL_CHECK_INTERVAL', '5'))
+
+# Used for users with no recorded login history (see login_behaviour).
+DEFAULT_TIME_SINCE_LAST_LOGIN = 0.5
+DEFAULT_IP_ADDRESS_RISK = 'low'
+
+
+class _LoadedModel:
+    __slots__ = ('model', 'columns', 'attempts_col', 'time_col', 'risk_cols', 'lock_class', 'version')
+
+    def __init__(self, model, columns, version=None):
+        self.model = model
+        self.version = version
+        self.columns = list(columns)
+        index = {col: i for i, col in enumerate(columns)}
+        self.attempts_col = index['login_attempts']
+        self.time_col = index['time_since_last_login']
+        # One-hot columns look like 'ip_address_risk_low'. The level dropped by
+        # get_dummies(drop_first=True) has no column and encodes as all zeros.
+        self.risk_cols = {
+            col[len('ip_address_risk_'):]: i for col, i in index.items() if col.startswith('ip_address_risk_')
+        }
+        self.lock_class = list(model.classes_).index(1)
+
+
+_loaded = None
+_load_lock = threading.Lock()
+_next_check = 0.0
+
+
+def load_model():
+    """
+    Load the model on first use and keep it until a new version is activated.
+
+    Importing this module does not deserialize anything, so code paths that never
+    score a user (e.g. the GenAI agent) do not pay for it. Between checks of
+    model/CURRENT this is a single clock comparison. A new version is loaded
+    completely before it replaces the old one in one assignment; if it fails to
+    load, the old model stays in use.
+    """
+    global _loaded, _next_check
+    if _loaded is not None and time.monotonic() < _next_check:
+        return _loaded
+    with _load_lock:
+        if _loaded is None or time.monotonic() >= _next_check:
+            version = model_registry.current_version()
+            if _loaded is None or version != _loaded.version:
+                try:
+                    _loaded = _load(version)
+                except (OSError, ValueError):
+                    if _loaded is None:
+                        raise
+            _next_check = time.monotonic() + MODEL_CHECK_INTERVAL
+    return _loaded
+
+
+def reload_model():
+    """Check model/CURRENT on the next call instead of waiting for the interval."""
+    global _next_check
+    _next_check = 0.0
 
-model = joblib.load('model/classical_agent_model.pkl')
-model_columns = joblib.load('model/model_columns.pkl')
+
+def _load(version):
+    if version is not None:
+        path = model_registry.version_dir(version)
+        if not USE_SKLEARN:
+            forest = CompiledForest.load(os.path.join(path, model_registry.FOREST_FILE))
+            return _LoadedModel(forest, forest.columns, version)
+        import joblib
+        model = joblib.load(os.path.join(path, model_registry.MODEL_FILE), mmap_mode='r' if MODEL_MMAP else None)
+        return _LoadedModel(model, joblib.load(os.path.join(path, model_registry.COLUMNS_FILE)), version)
+    if not USE_SKLEARN and os.path.exists(COMPILED_FOREST_FILE):
+        forest = CompiledForest.load(COMPILED_FOREST_FILE)
+        return _LoadedModel(forest, forest.columns)
+    import joblib
+    model = joblib.load(MODEL_FILE, mmap_mode='r' if MODEL_MMAP else None)
+    return _LoadedModel(model, joblib.load(MODEL_COLUMNS_FILE))
+
+
+@timed
+def encode_features(rows, loaded=None):
+    """
+    Encode ``(login_attempts, time_since_last_login, ip_address_risk)`` rows into a
+    matrix laid out exactly like the model's columns, without going through pandas.
+
+    Pass the same ``loaded`` model to ``predict_lock_proba`` so a version swap in
+    between cannot mix two column layouts.
+    """
+    loaded = loaded or load_model()
+    features = np.zeros((len(rows), len(loaded.columns)), dtype=np.float64)
+    for i, (login_attempts, time_since_last_login, ip_address_risk) in enumerate(rows):
+        features[i, loaded.attempts_col] = login_attempts
+        features[i, loaded.time_col] = time_since_last_login
+        risk_col = loaded.risk_cols.get(ip_address_risk)
+        if risk_col is not None:
+            features[i, risk_col] = 1.0
+    return features
+
+
+@timed
+def predict_lock_proba(features, loaded=None):
+    """Return the lock probability for each row of an encoded feature matrix."""
+    loaded = loaded or load_model()
+    if isinstance(loaded.model, CompiledForest):
+        proba = loaded.model.predict_proba(features)
+    else:
+        with warnings.catch_warnings():
+            # The model was fitted on a DataFrame; plain arrays are laid out the same way.
+            warnings.filterwarnings('ignore', message='X does not have valid feature names')
+            proba = loaded.model.predict_proba(features)
+    return proba[:, loaded.lock_class]
+
+
+def login_behaviour(usernames):
+    """
+    Return ``{username: (time_since_last_login, ip_address_risk)}``.
+
+    Both come from the login_features aggregate in one lookup: hours since the last
+    successful login (or the last attempt, if none succeeded) and the highest IP
+    risk in the current window. Users whose events are still queued for writing
+    fall back to the rate limiter's last attempt, then to the defaults.
+    """
+    now = time.time()
+    features = db.get_login_features(usernames)
+    missing = [username for username in usernames if username not in features]
+    hours = get_limiter().hours_since_last_attempt(missing, now) if missing else {}
+    behaviour = {}
+    for username in usernames:
+        if username in features:
+            last_attempt, last_success, _, ip_risk = features[username]
+            behaviour[username] = ((now - (last_success or last_attempt)) / 3600, ip_risk)
+        else:
+            behaviour[username] = (hours.get(username, DEFAULT_TIME_SINCE_LAST_LOGIN), DEFAULT_IP_ADDRESS_RISK)
+    return behaviour
 
 
 class ClassicalAgent:
 
     @staticmethod
+    @timed
+    def score_users(usernames=None):
+        """
+        Score many users with a single query and a single model call.
+
+        Returns ``{username: (prediction, lock_probability)}`` for every user found.
+        ``usernames=None`` scores the whole users table.
+        """
+        users = db.get_lock_states(usernames)
+        if not users:
+            return {}
+        behaviour = login_behaviour([username for username, _, _ in users])
+        model = load_model()
+        features = encode_features([
+            (failed_attempts, *behaviour[username]) for username, failed_attempts, _ in users
+        ], model)
+        probabilities = predict_lock_proba(features, model)
+        return {
+            username: (int(probability > 0.5), float(probability))
+            for (username, _, _), probability in zip(users, probabilities)
+        }
+
+    @staticmethod
+    @timed
     def get_classical_block_explanation(username):
+        catalog = get_catalog()
         user = db.get_user(username)
         if not user:
-            return "User not found.\nप्रयोगकर्ता फेला परेन।"
-
-        _, _, _, _, _, failed_attempts, is_locked = user
-        if not is_locked:
-            return (
-                f"Hello, {username}. Your account is currently active. If you are experiencing issues, please contact "
-                f"support.\n"
-                f"नमस्कार {username}। तपाईंको खाता हाल सक्रिय छ। यदि तपाईंलाई कुनै समस्या छ भने, कृपया सहायता "
-                f"केन्द्रमा सम्पर्क गर्नुहोस्।"
-            )
-
-        login_attempts = failed_attempts
-        time_since_last_login = 0.5  # dummy value
-        ip_address_risk = 'low'  # dummy value
-        features = pd.DataFrame(
-            [[login_attempts, time_since_last_login, ip_address_risk]],
-            columns=['login_attempts', 'time_since_last_login', 'ip_address_risk']
-        )
-        features = pd.get_dummies(features, columns=['ip_address_risk'], drop_first=True)
-        for col in model_columns:
-            if col not in features.columns:
-                features[col] = 0
-        features = features[model_columns]
-        prediction = model.predict(features)[0]
-
-        if prediction == 1:
-            return (
-                f'Hello, {username}. Our system detected unusual activity or too many failed attempts. '
-                f'Your account has been temporarily locked for security reasons. Please contact support to unlock it.\n'
-                f'नमस्कार {username}। हाम्रो प्रणालीले असामान्य गतिविधि वा धेरै पटक गलत प्रयासहरू पत्ता लगाएको छ। '
-                f'तपाईंको खाता सुरक्षाको कारण अस्थायी रूपमा लक गरिएको छ। कृपया खाता अनलक गर्न सहायता केन्द्रमा सम्पर्क गर्नुहोस्।'
-            )
-        else:
-            return (
-                f"Hello, {username}. Your account is currently active. If you are experiencing issues, please contact "
-                f"support.\n"
-                f"नमस्कार {username}। तपाईंको खाता हाल सक्रिय छ। यदि तपाईंलाई कुनै समस्या छ भने, कृपया सहायता "
-                f"केन्द्रमा सम्पर्क गर्नुहोस्।"
-            )
+            return catalog.classical_explanation('not_found', username)
+        if not user.is_locked:
+            return catalog.classical_explanation('active', username)
+
+        model = load_model()
+        features = encode_features([(user.failed_attempts, *login_behaviour([username])[username])], model)
+        prediction = int(predict_lock_proba(features, model)[0] > 0.5)
+        return catalog.classical_explanation('locked' if prediction == 1 else 'active', username)
 
     @staticmethod
+    @timed
     def validate_recovery_info(username, info_type, info_value):
         user = db.get_user(username)
         if not user:
             return False
 
         if info_type == "contact":
-            return info_value in (user[3], user[4])
+            return info_value in (user.email, user.phone)
         elif info_type == "transaction":
             # In a real system, you'd check transaction history.
             # For this simulation, we'll just accept any numeric input as valid.
@@ -0,0 +1,204 @@
+import numpy as np
+
+# sklearn marks leaves with a child index of -1.
+LEAF = -1
+
+# The lookup table has one cell per combination of split intervals across all
+# features. Above this many cells the tree walk is used instead.
+MAX_TABLE_CELLS = 1_000_000
+
+
+def compile_forest(forest, columns):
+    """
+    Flatten a fitted sklearn RandomForestClassifier into plain NumPy arrays.
+
+    All trees share one node table; child indices are rewritten to point into it and
+    ``roots`` holds where each tree starts.
+    """
+    features, thresholds, lefts, rights, values, roots = [], [], [], [], [], []
+    offset = 0
+    max_depth = 0
+    for estimator in forest.estimators_:
+        tree = estimator.tree_
+        n_nodes = tree.node_count
+        roots.append(offset)
+        left = tree.children_left.astype(np.int32)
+        right = tree.children_right.astype(np.int32)
+        is_leaf = left == LEAF
+        features.append(np.where(is_leaf, LEAF, tree.feature).astype(np.int32))
+        thresholds.append(tree.threshold.astype(np.float64))
+        lefts.append(np.where(is_leaf, LEAF, left + offset).astype(np.int32))
+        rights.append(np.where(is_leaf, LEAF, right + offset).astype(np.int32))
+        value = tree.value[:, 0, :].astype(np.float64)
+        values.append(value / value.sum(axis=1, keepdims=True))
+        max_depth = max(max_depth, tree.max_depth)
+        offset += n_nodes
+
+    arrays = {
+        "feature": np.concatenate(features),
+        "threshold": np.concatenate(thresholds),
+        "left": np.concatenate(lefts),
+        "right": np.concatenate(rights),
+        "value": np.concatenate(values),
+        "roots": np.asarray(roots, dtype=np.int32),
+        "max_depth": np.asarray(max_depth, dtype=np.int32),
+        "classes": np.asarray(forest.classes_),
+        "columns": np.asarray(columns, dtype=str),
+    }
+    arrays.update(CompiledForest(**arrays).build_lookup_table())
+    return arrays
+
+
+def save_compiled_forest(path, arrays):
+    np.savez(path, **arrays)
+
+
+def check_parity(forest, compiled, X):
+    """Raise if the compiled forest disagrees with ``forest.predict`` on ``X``."""
+    expected = forest.predict(X)
+    actual = compiled.predict(np.asarray(X))
+    mismatches = int(np.count_nonzero(expected != actual))
+    if mismatches:
+        raise AssertionError(f"Compiled forest disagrees with sklearn on {mismatches} of {len(expected)} rows")
+    if not np.allclose(forest.predict_proba(X), compiled.predict_proba(np.asarray(X))):
+        raise AssertionError("Compiled forest probabilities differ from sklearn")
+
+
+class CompiledForest:
+    """
+    Pure-NumPy evaluator for a forest produced by ``compile_forest``.
+
+    Every sample walks every tree at once: each loop iteration advances all
+    (sample, tree) cursors that have not reached a leaf by one level, so the cost is
+    at most ``max_depth`` vectorized steps instead of a Python loop per tree.
+    """
+
+    def __init__(self, feature, threshold, left, right, value, roots, max_depth, classes, columns,
+                 split_values=None, split_counts=None, table=None):
+        self.feature = feature
+        self.threshold = threshold
+        self.left = left
+        self.right = right
+        self.value = value
+        self.roots = roots
+        self.max_depth = int(max_depth)
+        self.classes_ = classes
+        self.columns = [str(col) for col in columns]
+        self.splits = None
+        self.table = table
+        if table is not None:
+            self.splits = np.split(split_values, np.cumsum(split_counts)[:-1])
+            self.table_shape = tuple(int(count) + 1 for count in split_counts)
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path, allow_pickle=False) as arrays:
+            return cls(**{name: arrays[name] for name in arrays.files})
+
+    def build_lookup_table(self):
+        """
+        Precompute the forest's output for every cell of the split grid.
+
+        With only a handful of distinct thresholds per feature, the forest is a
+        piecewise-constant function over a small grid, so prediction becomes one
+        ``searchsorted`` per feature plus a table read. Returns the extra arrays to
+        store with the compiled forest, or an empty dict if the grid is too large.
+        """
+        internal = self.left != LEAF
+        splits = [np.unique(self.threshold[internal & (self.feature == f)]) for f in range(len(self.columns))]
+        if np.prod([len(values) + 1 for values in splits], dtype=np.float64) > MAX_TABLE_CELLS:
+            return {}
+
+        # One float32 representative per interval (previous split, split], plus one
+        # past the last split.
+        representatives = []
+        for values in splits:
+            below = values.astype(np.float32)
+            below = np.where(below > values, np.nextafter(below, np.float32(-np.inf)), below)
+            above = np.float32(values[-1]) if len(values) else np.float32(0)
+            if len(values) and above <= values[-1]:
+                above = np.nextafter(above, np.float32(np.inf))
+            representatives.append(np.append(below, above).astype(np.float32))
+        grid = np.stack(np.meshgrid(*representatives, indexing='ij'), axis=-1).reshape(-1, len(splits))
+
+        return {
+            "split_values": np.concatenate(splits),
+            "split_counts": np.asarray([len(values) for values in splits], dtype=np.int64),
+            "table": self._walk_trees(grid),
+        }
+
+    def predict_proba(self, X):
+        # sklearn compares float32 inputs against float64 thresholds; do the same so
+        # values sitting exactly on a split go the same way.
+        X = np.asarray(X, dtype=np.float32)
+        if self.table is None:
+            return self._walk_trees(X)
+        cells = [np.searchsorted(values, X[:, f], side='left') for f, values in enumerate(self.splits)]
+        return self.table[np.ravel_multi_index(cells, self.table_shape)]
+
+    def _walk_trees(self, X):
+        n_samples, n_features = X.shape
+        n_trees = len(self.roots)
+        flat_X = X.ravel()
+        # One cursor per (sample, tree); only cursors still on internal nodes advance.
+        nodes = np.tile(self.roots, n_samples)
+        row_offset = np.repeat(np.arange(n_samples) * n_features, n_trees)
+        active = np.arange(nodes.size)
+        for _ in range(self.max_depth):
+            current = nodes[active]
+            go_left = flat_X[row_offset[active] + self.feature[current]] <= self.threshold[current]
+            current = np.where(go_left, self.left[current], self.right[current])
+            nodes[active] = current
+            active = active[self.left[current] != LEAF]
+            if not active.size:
+                break
+        return self.value[nodes].reshape(n_samples, n_trees, -1).mean(axis=1)
+
+    def predict(self, X):
+        return self.classes_[np.argmax(self.predict_proba(X), axis=1)]
+
+
+def export_forest(model_path, columns_path, output_path, X=None):
+    """Compile a pickled forest, verify it against sklearn and write it next to the model."""
+    import joblib
+
+    forest = joblib.load(model_path)
+    columns = joblib.load(columns_path)
+    arrays = compile_forest(forest, columns)
+    if X is None:
+        X = parity_grid(columns)
+    check_parity(forest, CompiledForest(**arrays), X)
+    save_compiled_forest(output_path, arrays)
+    return arrays
+
+
+def parity_grid(columns):
+    """Feature rows covering every attempt count and risk level over a spread of times."""
+    import pandas as pd
+
+    rng = np.random.default_rng(0)
+    times = np.concatenate([np.linspace(0, 80, 161), rng.uniform(0, 80, 200)])
+    rows = []
+    risk_cols = [col for col in columns if col.startswith('ip_address_risk_')]
+    for login_attempts in range(0, 12):
+        for time_since_last_login in times:
+            for hot in [None] + risk_cols:
+                row = dict.fromkeys(columns, 0)
+                row['login_attempts'] = login_attempts
+                row['time_since_last_login'] = time_since_last_login
+                if hot:
+                    row[hot] = 1
+                rows.append(row)
+    return pd.DataFrame(rows, columns=columns)
+
+
+if __name__ == '__main__':
+    import os
+
+    model_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'model')
+    export_forest(
+        os.path.join(model_dir, 'classical_agent_model.pkl'),
+        os.path.join(model_dir, 'model_columns.pkl'),
+        os.path.join(model_dir, 'classical_agent_forest.npz'),
+    )
+    print("Wrote model/classical_agent_forest.npz")
@@ -0,0 +1,87 @@
+import os
+from collections import deque
+
+DEFAULT_TOKEN_BUDGET = int(os.getenv("CHAT_TOKEN_BUDGET", "1500"))
+
+# Evicted turns are kept in the summary as one line of at most this many characters.
+SUMMARY_LINE_CHARS = 160
+
+
+def estimate_tokens(text):
+    """Cheap token estimate (~4 characters per token) that needs no tokenizer."""
+    return len(text) // 4 + 1
+
+
+class ConversationMemory:
+    """
+    Bounded chat memory for building LLM prompts.
+
+    Recent turns are kept verbatim in a sliding window. When the window goes over
+    its share of ``token_budget``, the oldest turns are condensed into one-line
+    summary entries, and the oldest summary entries are dropped in turn. Every
+    operation touches a bounded number of turns, so the cost of a turn stays flat
+    however long the conversation gets.
+
+    Recovery progress is kept as explicit state in ``recovery_step`` (number of
+    completed recovery steps) and is never re-parsed from assistant messages.
+    """
+
+    def __init__(self, token_budget=DEFAULT_TOKEN_BUDGET, summary_share=0.25):
+        self.token_budget = token_budget
+        self.summary_budget = int(token_budget * summary_share)
+        self.window_budget = token_budget - self.summary_budget
+        self.recovery_step = 0
+        self.turn_count = 0
+        self._window = deque()  # (line, tokens)
+        self._window_tokens = 0
+        self._summary = deque()  # (line, tokens)
+        self._summary_tokens = 0
+
+    @classmethod
+    def from_history(cls, chat_history, token_budget=DEFAULT_TOKEN_BUDGET):
+        """
+        Build memory from a list of ``{"role", "content"}`` dicts (one pass over the history).
+
+        ``recovery_step`` starts at 0: a history can come from the caller, so it is
+        never trusted for recovery progress, which only a live memory or the
+        recovery_sessions table can supply.
+        """
+        memory = cls(token_budget)
+        for msg in chat_history:
+            memory.add(msg["role"], msg["content"])
+        return memory
+
+    def add(self, role, content):
+        line = f"{role.capitalize()}: {content}"
+        tokens = estimate_tokens(line)
+        self._window.append((line, tokens))
+        self._window_tokens += tokens
+        self.turn_count += 1
+        # Always keep the latest turn, even if it alone is over budget.
+        while self._window_tokens > self.window_budget and len(self._window) > 1:
+            old_line, old_tokens = self._window.popleft()
+            self._window_tokens -= old_tokens
+            self._add_to_summary(old_line)
+
+    def _add_to_summary(self, line):
+        line = " ".join(line.split())
+        if len(line) > SUMMARY_LINE_CHARS:
+            line = line[:SUMMARY_LINE_CHARS - 3] + "..."
+        tokens = estimate_tokens(line)
+        self._summary.append((line, tokens))
+        self._summary_tokens += tokens
+        while self._summary_tokens > self.summary_budget and self._summary:
+            _, old_tokens = self._summary.popleft()
+            self._summary_tokens -= old_tokens
+
+    @property
+    def tokens(self):
+        return self._window_tokens + self._summary_tokens
+
+    def render(self):
+        """Conversation text for the prompt: condensed earlier turns, then recent turns verbatim."""
+        recent = "\n".join(line for line, _ in self._window)
+        if not self._summary:
+            return recent
+        summary = "\n".join(line for line, _ in self._summary)
+        return f"Summary of earlier conversation:\n{summary}\n\nRecent messages:\n{recent}"
@@ -1,124 +1,678 @@
+import atexit
+import os
 import sqlite3
-import pandas as pd
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
+
+import migrations
+from batch_writer import BatchWriter
+from db_pool import ConnectionPool
+from instrumentation import register_gauges, timed
+from passwords import hash_password
+from ttl_cache import TTLCache
 
 DB_FILE = 'login_security.db'
 
+_pool = ConnectionPool(DB_FILE)
+
+# Rows per transaction for the bulk helpers
+BULK_CHUNK_SIZE = 500
+
+# Callbacks run with a username after that user's row is written, so in-process
+# caches can drop stale entries.
+_user_change_listeners = []
+
+# Read-through cache for get_user. USER_CACHE_SIZE=0 disables it. With
+# USER_CACHE_SHARED=1 the cache is also cleared when another process writes to
+# users, checked against the user_changes counter at most every
+# USER_CACHE_CHECK_INTERVAL seconds. This process's own writes move the counter
+# too; they are noted as they commit (see _note_own_user_changes) so they only
+# drop the rows they touched. Login reads the lock state from the database.
+USER_CACHE_SIZE = int(os.getenv("USER_CACHE_SIZE", "4096"))
+USER_CACHE_TTL = float(os.getenv("USER_CACHE_TTL", "30"))
+USER_CACHE_SHARED = os.getenv("USER_CACHE_SHARED", "1") == "1"
+USER_CACHE_CHECK_INTERVAL = float(os.getenv("USER_CACHE_CHECK_INTERVAL", "1.0"))
+
+_user_cache = TTLCache(maxsize=USER_CACHE_SIZE, ttl=USER_CACHE_TTL)
+_seen_user_version = None
+_next_user_version_check = 0.0
+_user_version_lock = threading.Lock()
+
+# Login events are appended by a background writer in batches, so the login path
+# never waits on their commit. login_features keeps a per-user aggregate of them;
+# attempt counts and IP risk cover a tumbling window of LOGIN_FEATURE_WINDOW seconds.
+IP_RISK_LEVELS = ('low', 'medium', 'high')
+LOGIN_FEATURE_WINDOW = float(os.getenv("LOGIN_FEATURE_WINDOW", "3600"))
+
+
+def configure_pool(db_file=None, **kwargs):
+    """Replace the shared connection pool, e.g. to point at another database file."""
+    global _pool, DB_FILE
+    _login_events.flush(timeout=5)
+    if db_file is not None:
+        DB_FILE = db_file
+    old_pool = _pool
+    _pool = ConnectionPool(DB_FILE, **kwargs)
+    old_pool.close()
+    _reset_user_cache()
+
+
+def get_connection():
+    return _pool.connection()
+
+
+def get_pool_stats():
+    return _pool.stats()
+
+
+def add_user_change_listener(callback):
+    """Register ``callback``; registering the same callback again does nothing."""
+    if callback not in _user_change_listeners:
+        _user_change_listeners.append(callback)
+
+
+def _notify_user_changed(username):
+    _user_cache.discard(username)
+    for callback in _user_change_listeners:
+        callback(username)
+
+
+def get_user_cache_stats():
+    return _user_cache.stats()
+
+
+register_gauges("db_pool", get_pool_stats)
+register_gauges("user_cache", get_user_cache_stats)
+
+
+def _reset_user_cache():
+    global _seen_user_version
+    with _user_version_lock:
+        _seen_user_version = None
+    _user_cache.invalidate()
+
+
+def _user_version(conn):
+    return conn.execute("SELECT version FROM user_changes WHERE id = 1").fetchone()[0]
+
+
+def _note_own_user_changes(version, rows):
+    """
+    Record that a committed transaction of this process wrote ``rows`` users rows,
+    leaving the user_changes counter at ``version``. If nothing else wrote since the
+    last version seen, the counter moves on without clearing the cache.
+    """
+    global _seen_user_version
+    with _user_version_lock:
+        if rows and _seen_user_version is not None and _seen_user_version == version - rows:
+            _seen_user_version = version
+
+
+def _check_remote_user_changes():
+    global _seen_user_version, _next_user_version_check
+    now = time.monotonic()
+    if now < _next_user_version_check:
+        return
+    _next_user_version_check = now + USER_CACHE_CHECK_INTERVAL
+    try:
+        with get_connection() as conn:
+            row = conn.execute("SELECT version FROM user_changes WHERE id = 1").fetchone()
+    except sqlite3.OperationalError:
+        row = None  # schema not migrated yet
+    version = row[0] if row else None
+    with _user_version_lock:
+        if version == _seen_user_version:
+            return
+        _seen_user_version = version
+    _user_cache.invalidate()
+
+
+def _chunks(iterable, size):
+    iterator = iter(iterable)
+    while True:
+        chunk = list(islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
 
+
+@timed
 def init_db():
-    conn = sqlite3.connect(DB_FILE)
-    c = conn.cursor()
-    # Create users table
-    c.execute('''
-        CREATE TABLE IF NOT EXISTS users (
-            id INTEGER PRIMARY KEY,
-            username TEXT UNIQUE,
-            password TEXT,
-            email TEXT,
-            phone TEXT,
-            failed_attempts INTEGER DEFAULT 0,
-            is_locked INTEGER DEFAULT 0
-        )
-    ''')
-    # Create feedback table
-    c.execute('''
-        CREATE TABLE IF NOT EXISTS feedback (
-            id INTEGER PRIMARY KEY,
-            username TEXT,
-            rating INTEGER,
-            comment TEXT
-        )
-    ''')
-    conn.commit()
-
-    # Create recovery_requests table
-    c.execute('''
-        CREATE TABLE IF NOT EXISTS recovery_requests (
-            id INTEGER PRIMARY KEY,
-            username TEXT,
-            issue TEXT,
-            status TEXT DEFAULT 'Pending'
-        )
-    ''')
-    conn.commit()
-    conn.close()
+    """Create or upgrade the schema; a no-op beyond one PRAGMA read when already current."""
+    with get_connection() as conn:
+        migrations.migrate(conn)
 
 
+@timed
 def submit_recovery_request_to_db(username, issue):
-    conn = sqlite3.connect(DB_FILE)
-    c = conn.cursor()
-    c.execute("INSERT INTO recovery_requests (username, issue) VALUES (?, ?)", (username, issue))
-    conn.commit()
-    conn.close()
+    with get_connection() as conn, conn:
+        return conn.execute("INSERT INTO recovery_requests (username, issue, created_at) VALUES (?, ?, ?)",
+                            (username, issue, time.time())).lastrowid
+
+
+@timed
+def get_pending_recovery_requests_from_db(limit=None, after_id=0):
+    """
+    Return ``(id, username, issue, status)`` for pending requests in id order.
+
+    Pass ``limit`` to read a page at a time; the next page starts after the last id returned.
+    """
+    with get_connection() as conn:
+        return conn.execute(
+            "SELECT id, username, issue, status FROM recovery_requests WHERE status = 'Pending' AND id > ? "
+            "ORDER BY id LIMIT ?",
+            (after_id, -1 if limit is None else limit)
+        ).fetchall()
+
+
+@timed
+def claim_recovery_requests(worker_id, limit, lease_seconds):
+    """
+    Claim up to ``limit`` pending requests for ``worker_id`` for ``lease_seconds``, oldest first.
+
+    A single UPDATE ... RETURNING, so two workers can never claim the same request.
+    Requests whose lease has expired are claimed again; requests linked to a
+    chatbot session are left to the chatbot. Returns ``[(id, username, issue), ...]``.
+    """
+    now = time.time()
+    with get_connection() as conn, conn:
+        return conn.execute('''
+            UPDATE recovery_requests SET claimed_by = ?, lease_until = ?
+            WHERE id IN (
+                SELECT r.id FROM recovery_requests r
+                WHERE r.status = 'Pending' AND (r.lease_until IS NULL OR r.lease_until < ?)
+                  AND NOT EXISTS (SELECT 1 FROM recovery_sessions s WHERE s.request_id = r.id)
+                ORDER BY r.id LIMIT ?
+            )
+            RETURNING id, username, issue
+        ''', (worker_id, now + lease_seconds, now, limit)).fetchall()
+
+
+@timed
+def resolve_recovery_requests(request_ids, status, chunk_size=BULK_CHUNK_SIZE, claimed_by=None):
+    """
+    Set ``status`` on many recovery requests, one transaction per chunk. Returns rows updated.
+
+    With ``claimed_by``, only requests still claimed by that worker are updated
+    (a lease that ran out may belong to another worker by now), and the claim is released.
+    """
+    sql = "UPDATE recovery_requests SET status = ? WHERE id = ?"
+    claim = ()
+    if claimed_by is not None:
+        sql = ("UPDATE recovery_requests SET status = ?, claimed_by = NULL, lease_until = NULL "
+               "WHERE id = ? AND claimed_by = ?")
+        claim = (claimed_by,)
+    updated = 0
+    for chunk in _chunks(request_ids, chunk_size):
+        with get_connection() as conn, conn:
+            updated += conn.executemany(sql, [(status, request_id, *claim) for request_id in chunk]).rowcount
+    return updated
 
 
-def get_pending_recovery_requests_from_db():
-    conn = sqlite3.connect(DB_FILE)
-    c = conn.cursor()
-    c.execute("SELECT * FROM recovery_requests WHERE status = 'Pending'")
-    requests = c.fetchall()
-    conn.close()
-    return requests
+def get_recovery_queue_stats():
+    """
+    Pending requests in the worker queue, how many of them are claimed, and the age
+    in seconds of the oldest. Requests owned by a chatbot session are left out, as
+    in claim_recovery_requests: no worker will ever take them.
+    """
+    now = time.time()
+    with get_connection() as conn:
+        pending, claimed, oldest = conn.execute('''
+            SELECT COUNT(*), COALESCE(SUM(r.lease_until >= ?), 0), MIN(r.created_at) FROM recovery_requests r
+            WHERE r.status = 'Pending'
+              AND NOT EXISTS (SELECT 1 FROM recovery_sessions s WHERE s.request_id = r.id)
+        ''', (now,)).fetchone()
+    return {"pending": pending, "claimed": claimed, "oldest_age_seconds": now - oldest if oldest else 0.0}
 
 
+@timed
 def update_recovery_request_status_in_db(request_id, status):
-    conn = sqlite3.connect(DB_FILE)
-    c = conn.cursor()
-    c.execute("UPDATE recovery_requests SET status = ? WHERE id = ?", (status, request_id))
-    conn.commit()
-    conn.close()
+    with get_connection() as conn, conn:
+        conn.execute("UPDATE recovery_requests SET status = ? WHERE id = ?", (status, request_id))
 
 
+@timed
+def start_recovery_session(session_id, username, issue, state):
+    """
+    Open a recovery request and the session that tracks it, in one transaction.
+
+    Restarting an existing session id points it at the new request and resets its
+    state; the request it replaces is marked Abandoned if it was still Pending.
+    """
+    with get_connection() as conn, conn:
+        conn.execute(
+            "UPDATE recovery_requests SET status = 'Abandoned' WHERE status = 'Pending' "
+            "AND id = (SELECT request_id FROM recovery_sessions WHERE session_id = ?)",
+            (session_id,)
+        )
+        request_id = conn.execute("INSERT INTO recovery_requests (username, issue, created_at) VALUES (?, ?, ?)",
+                                  (username, issue, time.time())).lastrowid
+        conn.execute(
+            "INSERT OR REPLACE INTO recovery_sessions (session_id, username, state, request_id, updated_at) "
+            "VALUES (?, ?, ?, ?, ?)",
+            (session_id, username, state, request_id, time.time())
+        )
+        return request_id
+
+
+@timed
+def get_recovery_session(session_id):
+    """Return ``(username, state, request_id)`` for a session, or ``None``."""
+    with get_connection() as conn:
+        return conn.execute("SELECT username, state, request_id FROM recovery_sessions WHERE session_id = ?",
+                            (session_id,)).fetchone()
+
+
+@timed
+def advance_recovery_session(session_id, username, from_state, to_state, request_status=None):
+    """
+    Move ``username``'s session from ``from_state`` to ``to_state`` only if it is
+    still in ``from_state`` (compare-and-set, so concurrent workers cannot skip a
+    step). A session belonging to another user is never moved.
+
+    ``request_status`` also updates the linked recovery request in the same
+    transaction. Returns ``True`` if the transition happened.
+    """
+    with get_connection() as conn, conn:
+        row = conn.execute(
+            "UPDATE recovery_sessions SET state = ?, updated_at = ? "
+            "WHERE session_id = ? AND username = ? AND state = ? RETURNING request_id",
+            (to_state, time.time(), session_id, username, from_state)
+        ).fetchone()
+        if row and request_status is not None:
+            conn.execute("UPDATE recovery_requests SET status = ? WHERE id = ?", (request_status, row[0]))
+        return row is not None
+
+
+@timed
+def complete_password_reset(session_id, username, from_state, to_state, new_password, request_status=None):
+    """
+    Like ``advance_recovery_session``, but also sets ``username``'s new password and
+    unlocks the account, in the same transaction and only if the transition happened.
+    Two concurrent resets of one session can therefore never both change the
+    password. Returns ``True`` if this call made the change.
+    """
+    password_hash = hash_password(new_password)  # hashed before the write lock is taken
+    with get_connection() as conn, conn:
+        row = conn.execute(
+            "UPDATE recovery_sessions SET state = ?, updated_at = ? "
+            "WHERE session_id = ? AND username = ? AND state = ? RETURNING request_id",
+            (to_state, time.time(), session_id, username, from_state)
+        ).fetchone()
+        if row is None:
+            return False
+        rows = conn.execute("UPDATE users SET password = ?, failed_attempts = 0, is_locked = 0 WHERE username = ?",
+                            (password_hash, username)).rowcount
+        if request_status is not None:
+            conn.execute("UPDATE recovery_requests SET status = ? WHERE id = ?", (request_status, row[0]))
+        version = _user_version(conn)
+    _note_own_user_changes(version, rows)
+    _notify_user_changed(username)
+    return True
+
+
+@timed
 def create_user(username, password, email, phone):
-    conn = sqlite3.connect(DB_FILE)
-    c = conn.cursor()
+    with get_connection() as conn:
+        try:
+            with conn:
+                conn.execute("INSERT INTO users (username, password, email, phone) VALUES (?, ?, ?, ?)",
+                             (username, hash_password(password), email, phone))
+                version = _user_version(conn)
+            _note_own_user_changes(version, 1)
+            _notify_user_changed(username)
+            return True
+        except sqlite3.IntegrityError:
+            return False
+
+
+@timed
+def create_users(users, chunk_size=BULK_CHUNK_SIZE, hash_workers=None):
+    """
+    Insert many ``(username, password, email, phone)`` users from any iterable.
+
+    Input is consumed lazily, one chunk at a time, and each chunk is a single
+    transaction. Password hashing (the expensive part) is spread over
+    ``hash_workers`` threads (default: one per CPU), since hashlib releases the
+    GIL. Existing usernames are skipped. Returns rows inserted.
+    """
+    hash_workers = hash_workers or os.cpu_count() or 1
+    executor = ThreadPoolExecutor(max_workers=hash_workers) if hash_workers > 1 else None
+    inserted = 0
     try:
-        c.execute("INSERT INTO users (username, password, email, phone) VALUES (?, ?, ?, ?)",
-                  (username, password, email, phone))
-        conn.commit()
-        return True
-    except sqlite3.IntegrityError:
-        return False
+        for chunk in _chunks(users, chunk_size):
+            passwords = [password for _, password, _, _ in chunk]
+            hashes = executor.map(hash_password, passwords) if executor else map(hash_password, passwords)
+            rows = [(username, hashed, email, phone) for (username, _, email, phone), hashed in zip(chunk, hashes)]
+            with get_connection() as conn, conn:
+                chunk_inserted = conn.executemany(
+                    "INSERT OR IGNORE INTO users (username, password, email, phone) VALUES (?, ?, ?, ?)", rows
+                ).rowcount
+                version = _user_version(conn)
+            _note_own_user_changes(version, chunk_inserted)
+            inserted += chunk_inserted
+            for username, _, _, _ in rows:
+                _notify_user_changed(username)
     finally:
-        conn.close()
+        if executor:
+            executor.shutdown()
+    return inserted
+
+
+# The users writes below also return the user_changes version they left behind,
+# for _note_own_user_changes in the calling process.
+
+def _update_user(conn, username, failed_attempts, is_locked):
+    rows = conn.execute("UPDATE users SET failed_attempts = ?, is_locked = ? WHERE username = ?",
+                        (failed_attempts, is_locked, username)).rowcount
+    return rows, _user_version(conn)
+
+
+def _record_failed_login(conn, username, max_attempts):
+    state = conn.execute(
+        "UPDATE users SET failed_attempts = failed_attempts + 1, "
+        "is_locked = MAX(is_locked, failed_attempts + 1 >= ?) "
+        "WHERE username = ? RETURNING failed_attempts, is_locked",
+        (max_attempts, username)
+    ).fetchone()
+    return state, _user_version(conn)
+
+
+def _submit_feedback(conn, username, rating, comment):
+    conn.execute("INSERT INTO feedback (username, rating, comment) VALUES (?, ?, ?)", (username, rating, comment))
+
+
+# Writes on the request path, by name. They normally run inline in their own
+# transaction; server.py instead hands them to its writer process, which runs many
+# in one transaction (see group_commit.py).
+WRITE_OPS = {
+    'update_user': _update_user,
+    'record_failed_login': _record_failed_login,
+    'submit_feedback': _submit_feedback,
+}
+_write_delegate = None
+
+
+def set_write_delegate(delegate):
+    """Send WRITE_OPS through ``delegate.call(op, *args)`` instead of running them here; None restores inline writes."""
+    global _write_delegate
+    _write_delegate = delegate
+
+
+def _write(op, *args):
+    if _write_delegate is not None:
+        return _write_delegate.call(op, *args)
+    with get_connection() as conn, conn:
+        return WRITE_OPS[op](conn, *args)
+
 
+class UserRecord:
+    """
+    One row of the users table, read by name instead of by position.
 
+    Uses ``__slots__``, so the thousands of records the user cache can hold take
+    less memory than the equivalent tuples and a misspelt field fails loudly.
+    """
+    __slots__ = ('id', 'username', 'password', 'email', 'phone', 'failed_attempts', 'is_locked')
+
+    def __init__(self, id, username, password, email, phone, failed_attempts, is_locked):
+        self.id = id
+        self.username = username
+        self.password = password
+        self.email = email
+        self.phone = phone
+        self.failed_attempts = failed_attempts
+        self.is_locked = is_locked
+
+    def __repr__(self):
+        # The password hash is left out so records can be logged safely
+        return (f"UserRecord(id={self.id!r}, username={self.username!r}, "
+                f"failed_attempts={self.failed_attempts!r}, is_locked={self.is_locked!r})")
+
+
+_USER_COLUMNS = ", ".join(UserRecord.__slots__)
+
+
+@timed
 def get_user(username):
-    conn = sqlite3.connect(DB_FILE)
-    c = conn.cursor()
-    c.execute("SELECT * FROM users WHERE username = ?", (username,))
-    user = c.fetchone()
-    conn.close()
-    return user
+    """Return the user's ``UserRecord``, or ``None`` if there is no such user."""
+    if USER_CACHE_SIZE <= 0:
+        return _fetch_user(username)
+    if USER_CACHE_SHARED:
+        _check_remote_user_changes()
+    return _user_cache.get_or_compute(username, lambda: _fetch_user(username))
+
+
+@timed
+def _fetch_user(username):
+    with get_connection() as conn:
+        row = conn.execute(f"SELECT {_USER_COLUMNS} FROM users WHERE username = ?", (username,)).fetchone()
+    return UserRecord(*row) if row else None
+
+
+@timed
+def get_lock_state(username, cached=True):
+    """
+    Return ``(failed_attempts, is_locked)`` for one user, or ``None`` if there is no such user.
+
+    Answered from the user cache when the full record is already there, unless
+    ``cached`` is false (login must not act on another process's write it has not
+    noticed yet). Otherwise only those two columns are read, and nothing is cached,
+    so status checks do not fill the cache with password hashes and contact details
+    they never use.
+    """
+    if cached and USER_CACHE_SIZE > 0:
+        if USER_CACHE_SHARED:
+            _check_remote_user_changes()
+        user = _user_cache.peek(username)
+        if user is not None:
+            return user.failed_attempts, user.is_locked
+    with get_connection() as conn:
+        return conn.execute("SELECT failed_attempts, is_locked FROM users WHERE username = ?",
+                            (username,)).fetchone()
+
+
+@timed
+def get_lock_states(usernames=None):
+    """
+    Fetch ``(username, failed_attempts, is_locked)`` for many users, one query per
+    BULK_CHUNK_SIZE usernames.
+
+    Passing ``None`` returns every user, which is what the nightly re-scoring sweep uses.
+    """
+    with get_connection() as conn:
+        if usernames is None:
+            return conn.execute("SELECT username, failed_attempts, is_locked FROM users").fetchall()
+        states = []
+        for chunk in _chunks(usernames, BULK_CHUNK_SIZE):
+            placeholders = ", ".join("?" * len(chunk))
+            states.extend(conn.execute(
+                f"SELECT username, failed_attempts, is_locked FROM users WHERE username IN ({placeholders})",
+                chunk
+            ).fetchall())
+        return states
 
 
+@timed
 def update_user(username, failed_attempts, is_locked):
-    conn = sqlite3.connect(DB_FILE)
-    c = conn.cursor()
-    c.execute("UPDATE users SET failed_attempts = ?, is_locked = ? WHERE username = ?",
-              (failed_attempts, is_locked, username))
-    conn.commit()
-    conn.close()
+    rows, version = _write('update_user', username, failed_attempts, is_locked)
+    _note_own_user_changes(version, rows)
+    _notify_user_changed(username)
 
 
+@timed
+def unlock_users(usernames, chunk_size=BULK_CHUNK_SIZE):
+    """Clear failed attempts and unlock many users, one transaction per chunk. Returns rows updated."""
+    updated = 0
+    for chunk in _chunks(usernames, chunk_size):
+        with get_connection() as conn, conn:
+            rows = conn.executemany("UPDATE users SET failed_attempts = 0, is_locked = 0 WHERE username = ?",
+                                    [(username,) for username in chunk]).rowcount
+            version = _user_version(conn)
+        _note_own_user_changes(version, rows)
+        updated += rows
+        for username in chunk:
+            _notify_user_changed(username)
+    return updated
+
+
+@timed
+def record_failed_login(username, max_attempts):
+    """
+    Count a failed login and lock the account once it reaches ``max_attempts``.
+
+    The increment happens inside SQLite, so concurrent bad passwords for the same
+    user never lose updates. Returns the new ``(failed_attempts, is_locked)``, or
+    ``None`` if the user does not exist.
+    """
+    state, version = _write('record_failed_login', username, max_attempts)
+    _note_own_user_changes(version, 1 if state else 0)
+    _notify_user_changed(username)
+    return state
+
+
+@timed
 def submit_feedback_to_db(username, rating, comment):
-    conn = sqlite3.connect(DB_FILE)
-    c = conn.cursor()
-    c.execute("INSERT INTO feedback (username, rating, comment) VALUES (?, ?, ?)", (username, rating, comment))
-    conn.commit()
-    conn.close()
+    _write('submit_feedback', username, rating, comment)
 
 
+@timed
 def update_user_password(username, new_password):
-    conn = sqlite3.connect(DB_FILE)
-    c = conn.cursor()
-    c.execute("UPDATE users SET password = ? WHERE username = ?", (new_password, username))
-    conn.commit()
-    conn.close()
+    password_hash = hash_password(new_password)
+    with get_connection() as conn, conn:
+        rows = conn.execute("UPDATE users SET password = ? WHERE username = ?", (password_hash, username)).rowcount
+        version = _user_version(conn)
+    _note_own_user_changes(version, rows)
+    _notify_user_changed(username)
 
 
+@timed
 def get_feedback_from_db():
-    conn = sqlite3.connect(DB_FILE)
-    try:
+    import pandas as pd  # deferred so importing this module stays cheap
+
+    with get_connection() as conn:
         return pd.read_sql_query("SELECT * FROM feedback", conn)
-    finally:
-        conn.close()
+
+
+@timed
+def get_feedback_for_user(username, limit=50, cursor=None):
+    """
+    Return one page of a user's feedback, newest first, as ``(rows, next_cursor)``.
+
+    Rows are ``(id, rating, comment)`` tuples. Pass ``next_cursor`` back in to get
+    the following page; it is ``None`` on the last page. Uses keyset pagination on
+    the (username, id) index, so every page costs the same regardless of table size.
+    """
+    with get_connection() as conn:
+        if cursor is None:
+            rows = conn.execute(
+                "SELECT id, rating, comment FROM feedback WHERE username = ? ORDER BY id DESC LIMIT ?",
+                (username, limit)
+            ).fetchall()
+        else:
+            rows = conn.execute(
+                "SELECT id, rating, comment FROM feedback WHERE username = ? AND id < ? ORDER BY id DESC LIMIT ?",
+                (username, cursor, limit)
+            ).fetchall()
+    next_cursor = rows[-1][0] if len(rows) == limit else None
+    return rows, next_cursor
+
+
+def iter_feedback(batch_size=1000):
+    """
+    Yield every feedback row ``(id, username, rating, comment)`` in id order.
+
+    Rows are fetched in keyset batches and the connection is returned to the pool
+    between batches, so memory stays flat and a slow consumer never pins a connection.
+    """
+    last_id = 0
+    while True:
+        with get_connection() as conn:
+            rows = conn.execute(
+                "SELECT id, username, rating, comment FROM feedback WHERE id > ? ORDER BY id LIMIT ?",
+                (last_id, batch_size)
+            ).fetchall()
+        yield from rows
+        if len(rows) < batch_size:
+            return
+        last_id = rows[-1][0]
+
+
+@timed
+def write_login_events(events):
+    """
+    Append ``(username, at, success, source, ip_risk)`` events and fold them into
+    login_features, all in one transaction. Normally called by the background
+    writer through ``record_login_event``.
+    """
+    rows = [
+        {"username": username, "at": at, "success": int(bool(success)), "source": source,
+         "risk": IP_RISK_LEVELS.index(ip_risk), "window": LOGIN_FEATURE_WINDOW}
+        for username, at, success, source, ip_risk in events
+    ]
+    with get_connection() as conn, conn:
+        conn.executemany(
+            "INSERT INTO login_events (username, at, success, source, ip_risk) "
+            "VALUES (:username, :at, :success, :source, :risk)",
+            rows
+        )
+        # Every SET expression sees the row as it was, so all of them test the old window
+        conn.executemany('''
+            INSERT INTO login_features
+                (username, last_attempt, last_success, window_start, attempts_in_window, ip_risk)
+            VALUES (:username, :at, CASE WHEN :success THEN :at END, :at, 1, :risk)
+            ON CONFLICT (username) DO UPDATE SET
+                last_attempt = MAX(last_attempt, :at),
+                last_success = CASE WHEN :success THEN MAX(COALESCE(last_success, :at), :at) ELSE last_success END,
+                attempts_in_window = CASE WHEN :at - window_start < :window THEN attempts_in_window + 1 ELSE 1 END,
+                ip_risk = CASE WHEN :at - window_start < :window THEN MAX(ip_risk, :risk) ELSE :risk END,
+                window_start = CASE WHEN :at - window_start < :window THEN window_start ELSE :at END
+        ''', rows)
+
+
+_login_events = BatchWriter(write_login_events, name="login-event-writer")
+atexit.register(_login_events.flush, timeout=2)
+
+
+def record_login_event(username, success, source=None, ip_risk='low'):
+    """Queue a login attempt for the event log without waiting for it to be written."""
+    _login_events.submit((username, time.time(), success, source, ip_risk))
+
+
+def flush_login_events(timeout=None):
+    """Wait until every queued login event is written."""
+    return _login_events.flush(timeout)
+
+
+def get_login_writer_stats():
+    return _login_events.stats()
+
+
+register_gauges("login_events", get_login_writer_stats)
+
+
+@timed
+def get_login_features(usernames):
+    """
+    Return ``{username: (last_attempt, last_success, attempts_in_window, ip_risk)}``
+    from the login_features aggregate, one primary-key lookup per user. Users with no
+    recorded logins are left out; a window that has already ended reads as no
+    attempts and 'low' risk.
+    """
+    now = time.time()
+    features = {}
+    with get_connection() as conn:
+        for chunk in _chunks(usernames, BULK_CHUNK_SIZE):
+            placeholders = ", ".join("?" * len(chunk))
+            rows = conn.execute(
+                "SELECT username, last_attempt, last_success, window_start, attempts_in_window, ip_risk "
+                f"FROM login_features WHERE username IN ({placeholders})",
+                chunk
+            ).fetchall()
+            for username, last_attempt, last_success, window_start, attempts, risk in rows:
+                if now - window_start >= LOGIN_FEATURE_WINDOW:
+                    attempts, risk = 0, 0
+                features[username] = (last_attempt, last_success, attempts, IP_RISK_LEVELS[risk])
+    return features
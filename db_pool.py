@@ -0,0 +1,116 @@
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+
+# Pragmas applied once to every new connection. WAL lets readers run alongside a
+# single writer, and busy_timeout makes writers wait instead of failing with
+# "database is locked".
+DEFAULT_PRAGMAS = (
+    ("journal_mode", "WAL"),
+    ("synchronous", "NORMAL"),
+    ("cache_size", -16000),  # negative value = size in KiB (16 MB)
+    ("mmap_size", 268435456),  # 256 MB
+    ("busy_timeout", 5000),  # milliseconds
+    ("temp_store", "MEMORY"),
+)
+
+
+class ConnectionPool:
+    """
+    Keeps SQLite connections open between calls instead of reconnecting every time.
+
+    Idle connections are reused in LIFO order so the most recently used (warmest)
+    connection is handed out first. A thread that asks for a connection while it
+    already holds one gets the same connection back, so nested helpers share a
+    transaction.
+    """
+
+    def __init__(self, db_file, max_size=8, timeout=10.0, pragmas=DEFAULT_PRAGMAS):
+        self.db_file = db_file
+        self.max_size = max_size
+        self.timeout = timeout
+        self.pragmas = pragmas
+        self._idle = []
+        self._open = 0
+        self._cond = threading.Condition()
+        self._local = threading.local()
+        self._stats = {"hits": 0, "misses": 0, "waits": 0, "wait_time": 0.0, "max_wait_time": 0.0}
+
+    def _connect(self):
+        conn = sqlite3.connect(self.db_file, timeout=self.timeout, check_same_thread=False)
+        for name, value in self.pragmas:
+            conn.execute(f"PRAGMA {name} = {value}")
+        return conn
+
+    def _acquire(self):
+        started = None
+        with self._cond:
+            while not self._idle and self._open >= self.max_size:
+                if started is None:
+                    started = time.perf_counter()
+                    self._stats["waits"] += 1
+                remaining = self.timeout - (time.perf_counter() - started)
+                if remaining <= 0:
+                    raise TimeoutError(f"No SQLite connection available after {self.timeout}s")
+                self._cond.wait(remaining)
+            if started is not None:
+                waited = time.perf_counter() - started
+                self._stats["wait_time"] += waited
+                self._stats["max_wait_time"] = max(self._stats["max_wait_time"], waited)
+            if self._idle:
+                self._stats["hits"] += 1
+                return self._idle.pop()
+            self._stats["misses"] += 1
+            self._open += 1
+        try:
+            return self._connect()
+        except Exception:
+            with self._cond:
+                self._open -= 1
+                self._cond.notify()
+            raise
+
+    def _release(self, conn):
+        if conn.in_transaction:
+            conn.rollback()
+        with self._cond:
+            self._idle.append(conn)
+            self._cond.notify()
+
+    @contextmanager
+    def connection(self):
+        """
+        Check out a connection for the duration of the block.
+
+        Use ``with conn:`` inside the block to commit (or roll back on error).
+        """
+        held = getattr(self._local, "conn", None)
+        if held is not None:
+            yield held
+            return
+
+        conn = self._acquire()
+        self._local.conn = conn
+        try:
+            yield conn
+        finally:
+            self._local.conn = None
+            self._release(conn)
+
+    def stats(self):
+        with self._cond:
+            stats = dict(self._stats)
+            stats["open"] = self._open
+            stats["idle"] = len(self._idle)
+        requests = stats["hits"] + stats["misses"]
+        stats["hit_rate"] = stats["hits"] / requests if requests else 0.0
+        stats["avg_wait_time"] = stats["wait_time"] / stats["waits"] if stats["waits"] else 0.0
+        return stats
+
+    def close(self):
+        with self._cond:
+            idle, self._idle = self._idle, []
+            self._open -= len(idle)
+        for conn in idle:
+            conn.close()
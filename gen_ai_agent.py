@@ -1,41 +1,83 @@
+import asyncio
 import os
-import google.generativeai as genai
+
+import database as db
 from auth_service import AuthService
+from classical_agent import ClassicalAgent
+from instrumentation import register_gauges, timed
+from llm_client import get_client
+from message_catalog import get_catalog
+from ttl_cache import TTLCache
+
+EXPLANATION_STATUSES = ("locked", "active")
+
+# Serve pre-generated variants from the message catalog when it has one for the
+# account status; set GENAI_USE_CATALOG=0 to always ask the LLM.
+USE_CATALOG = os.getenv("GENAI_USE_CATALOG", "1") == "1"
+
+# Explanations only depend on the username and whether the account is locked.
+# A user's entries are dropped as soon as their row is written.
+_explanations = TTLCache(
+    maxsize=int(os.getenv("GENAI_CACHE_SIZE", "1024")),
+    ttl=float(os.getenv("GENAI_CACHE_TTL", "3600")),
+)
+
+
+def _forget_user(username):
+    for status in EXPLANATION_STATUSES:
+        _explanations.discard((status, username))
+
+
+db.add_user_change_listener(_forget_user)
+register_gauges("genai_cache", _explanations.stats)
+
+
+def explanation_prompt(username, account_status):
+    if account_status == "locked":
+        return (
+            f"Explain very concisely why the account '{username}' was locked "
+            f"due to multiple failed login attempts. Provide the explanation in both English and Nepali. "
+            f"Keep it clear and reassuring."
+        )
+    return (
+        f"Explain very concisely that the account '{username}' is currently active and not locked. "
+        f"Provide this information in both English and Nepali. "
+        f"Keep it clear and reassuring."
+    )
 
 
 class GenAIAgent:
 
     @staticmethod
+    @timed
     def get_genai_block_explanation(username):
         account_status = AuthService.check_account_status(username)
 
         if account_status == "not_found":
             return "This username does not exist."
 
+        if USE_CATALOG:
+            explanation = get_catalog().genai_explanation(account_status, username)
+            if explanation is not None:
+                return explanation
+
         try:
-            genai.configure(api_key=os.getenv("GEMINI_API_KEY"))
-            model = genai.GenerativeModel('models/gemma-3-12b-it')
-
-            if account_status == "locked":
-                prompt = (
-                    f"Explain very concisely why the account '{username}' was locked "
-                    f"due to multiple failed login attempts. Provide the explanation in both English and Nepali. "
-                    f"Keep it clear and reassuring."
-                )
-            else:
-                prompt = (
-                    f"Explain very concisely that the account '{username}' is currently active and not locked. "
-                    f"Provide this information in both English and Nepali. "
-                    f"Keep it clear and reassuring."
-                )
-
-            response = model.generate_content(
-                prompt,
-                generation_config=genai.types.GenerationConfig(
-                    temperature=1
-                )
+            return _explanations.get_or_compute(
+                (account_status, username),
+                lambda: GenAIAgent._generate_explanation(username, account_status)
             )
-            explanation = response.text
-            return explanation
+        except asyncio.TimeoutError:
+            # Deadline expired: answer with the deterministic text (never cached).
+            return ClassicalAgent.get_classical_block_explanation(username)
         except Exception as e:
             return f"Could not get explanation from LLM: {e}"
+
+    @staticmethod
+    @timed
+    def _generate_explanation(username, account_status):
+        return get_client().generate(explanation_prompt(username, account_status), temperature=1)
+
+    @staticmethod
+    def get_cache_stats():
+        """Hit rate and LLM time saved by the explanation cache."""
+        return _explanations.stats()
@@ -0,0 +1,121 @@
+"""
+A single writer process that commits many small writes in one transaction.
+
+Worker processes send ``(worker_id, seq, op, args)`` on a shared request queue
+and wait for ``(seq, result, error)`` on their own reply queue. The writer takes
+whatever has queued up (at most ``max_batch`` requests, waiting up to
+``flush_interval`` for more after the first), runs them in order in one
+transaction and answers each caller once it has committed. Callers still see
+their own write as committed when ``call`` returns, but the cost of the commit
+is shared by everyone in the batch, and the frequent writes in ``WRITE_OPS``
+never compete with each other for the database lock. Writes outside
+``WRITE_OPS`` (registration, password changes, recovery sessions) still run in
+the worker processes and take the lock themselves.
+
+Unlike ``BatchWriter`` nothing is dropped: every caller is waiting for its answer.
+"""
+import itertools
+import queue
+import signal
+import threading
+
+# Sent on the request queue to stop the writer
+STOP = None
+
+
+def run_writer(db_file, requests, replies, max_batch=256, flush_interval=0.002):
+    """Writer process main loop. ``replies`` maps worker id to that worker's reply queue."""
+    import database as db
+
+    # Ctrl+C reaches the whole process group; keep going until STOP so queued writes are not lost
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    db.configure_pool(db_file, max_size=1)
+    while True:
+        batch = [requests.get()]
+        if batch[0] is STOP:
+            return
+        stop = False
+        try:
+            while len(batch) < max_batch:
+                item = requests.get(timeout=flush_interval) if len(batch) == 1 else requests.get_nowait()
+                if item is STOP:
+                    stop = True
+                    break
+                batch.append(item)
+        except queue.Empty:
+            pass
+        for (worker_id, seq, _, _), (result, error) in zip(batch, apply_batch(db, batch)):
+            replies[worker_id].put((seq, result, error))
+        if stop:
+            return
+
+
+def apply_batch(db, batch):
+    """Run every write of ``batch`` in one transaction; returns ``[(result, error), ...]`` in order."""
+    with db.get_connection() as conn:
+        try:
+            with conn:
+                return [(db.WRITE_OPS[op](conn, *args), None) for _, _, op, args in batch]
+        except Exception:
+            # One bad write must not fail the others: redo them one transaction each
+            results = []
+            for _, _, op, args in batch:
+                try:
+                    with conn:
+                        results.append((db.WRITE_OPS[op](conn, *args), None))
+                except Exception as e:
+                    results.append((None, f"{type(e).__name__}: {e}"))
+            return results
+
+
+class _Pending:
+    __slots__ = ('done', 'result', 'error')
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class WriterClient:
+    """
+    Worker-process side: ``call`` blocks until the writer has committed the write.
+
+    Install it with ``database.set_write_delegate``. A background thread routes
+    replies to the waiting callers, so any number of request threads can share it.
+    """
+
+    def __init__(self, worker_id, requests, replies, timeout=10.0):
+        self.worker_id = worker_id
+        self.timeout = timeout
+        self._requests = requests
+        self._replies = replies
+        self._seq = itertools.count()
+        self._pending = {}
+        self._lock = threading.Lock()
+        self._thread = threading.Thread(target=self._route_replies, name="writer-replies", daemon=True)
+        self._thread.start()
+
+    def call(self, op, *args):
+        seq = next(self._seq)
+        pending = _Pending()
+        with self._lock:
+            self._pending[seq] = pending
+        self._requests.put((self.worker_id, seq, op, args))
+        if not pending.done.wait(self.timeout):
+            with self._lock:
+                self._pending.pop(seq, None)
+            raise TimeoutError(f"Writer did not answer {op} within {self.timeout}s")
+        if pending.error is not None:
+            raise RuntimeError(f"{op} failed in the writer process: {pending.error}")
+        return pending.result
+
+    def _route_replies(self):
+        while True:
+            seq, result, error = self._replies.get()
+            with self._lock:
+                pending = self._pending.pop(seq, None)
+            if pending is not None:
+                pending.result = result
+                pending.error = error
+                pending.done.set()
@@ -0,0 +1,292 @@
+import bisect
+import inspect
+import os
+import threading
+import time
+from contextlib import contextmanager, nullcontext
+from functools import wraps
+
+# Off unless METRICS_ENABLED=1 when the modules are imported. While off, ``timed``
+# returns the function unchanged and ``timer`` returns a shared no-op context
+# manager, so instrumented code runs exactly as before.
+ENABLED = os.getenv("METRICS_ENABLED", "0") == "1"
+
+# Where ``start_exporter`` publishes the Prometheus text: an HTTP port serving
+# /metrics (0 = no server) and/or a file rewritten every METRICS_FILE_INTERVAL seconds.
+METRICS_PORT = int(os.getenv("METRICS_PORT", "0"))
+METRICS_HOST = os.getenv("METRICS_HOST", "127.0.0.1")
+METRICS_FILE = os.getenv("METRICS_FILE")
+METRICS_FILE_INTERVAL = float(os.getenv("METRICS_FILE_INTERVAL", "10"))
+
+PREFIX = "login_sim"
+
+# Upper bounds in seconds, from cached lookups (µs) to LLM round-trips (s).
+BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class Histogram:
+    """Latency histogram plus call and error counts for one operation."""
+
+    def __init__(self):
+        self.buckets = [0] * (len(BUCKETS) + 1)  # last slot is +Inf
+        self.count = 0
+        self.errors = 0
+        self.total = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, seconds, failed=False):
+        index = bisect.bisect_left(BUCKETS, seconds)
+        with self._lock:
+            self.buckets[index] += 1
+            self.count += 1
+            self.total += seconds
+            if failed:
+                self.errors += 1
+
+    def quantile(self, q):
+        """Upper bound of the bucket holding the ``q`` quantile (None past the last bucket)."""
+        with self._lock:
+            rank = q * self.count
+            seen = 0
+            for bound, n in zip(BUCKETS, self.buckets):
+                seen += n
+                if n and seen >= rank:
+                    return bound
+        return None
+
+
+_histograms = {}
+_histograms_lock = threading.Lock()
+_gauge_sources = {}
+_local = threading.local()
+
+
+def _histogram(name):
+    histogram = _histograms.get(name)
+    if histogram is None:
+        with _histograms_lock:
+            histogram = _histograms.setdefault(name, Histogram())
+    return histogram
+
+
+def _record(name, seconds, failed):
+    _histogram(name).observe(seconds, failed)
+    trace = getattr(_local, "trace", None)
+    if trace is not None:
+        trace.append((name, seconds, failed))
+
+
+def timed(fn=None, *, name=None):
+    """
+    Decorator recording the latency and failures of every call to ``fn``.
+
+    The operation name defaults to ``module.qualname``. Coroutine functions are
+    timed until they return.
+    """
+    if fn is None:
+        return lambda f: timed(f, name=name)
+    if not ENABLED:
+        return fn
+    name = name or f"{fn.__module__}.{fn.__qualname__}"
+
+    if inspect.iscoroutinefunction(fn):
+        @wraps(fn)
+        async def async_wrapper(*args, **kwargs):
+            started = time.perf_counter()
+            failed = False
+            try:
+                return await fn(*args, **kwargs)
+            except Exception:
+                failed = True
+                raise
+            finally:
+                _record(name, time.perf_counter() - started, failed)
+        return async_wrapper
+
+    @wraps(fn)
+    def wrapper(*args, **kwargs):
+        started = time.perf_counter()
+        failed = False
+        try:
+            return fn(*args, **kwargs)
+        except Exception:
+            failed = True
+            raise
+        finally:
+            _record(name, time.perf_counter() - started, failed)
+    return wrapper
+
+
+_NULL_TIMER = nullcontext()
+
+
+def timer(name):
+    """
+    Context manager recording the latency of a block. Only ``Exception`` subclasses
+    count as errors, so a closed generator or a Streamlit rerun does not.
+    """
+    if not ENABLED:
+        return _NULL_TIMER
+    return _timer(name)
+
+
+@contextmanager
+def _timer(name):
+    started = time.perf_counter()
+    failed = False
+    try:
+        yield
+    except Exception:
+        failed = True
+        raise
+    finally:
+        _record(name, time.perf_counter() - started, failed)
+
+
+def start_trace():
+    """
+    Start collecting the calls made by this thread, e.g. for one Streamlit rerun.
+
+    Returns the list the calls are appended to as ``(name, seconds, failed)``;
+    nested calls are recorded as well as their callers. Starting a new trace
+    replaces the previous one.
+    """
+    trace = [] if ENABLED else None
+    _local.trace = trace
+    return trace
+
+
+def stop_trace():
+    _local.trace = None
+
+
+def summarize_trace(trace):
+    """Group a trace by operation: ``[(name, calls, total_seconds, errors)]``, slowest first."""
+    totals = {}
+    for name, seconds, failed in trace or ():
+        calls, total, errors = totals.get(name, (0, 0.0, 0))
+        totals[name] = (calls + 1, total + seconds, errors + failed)
+    return sorted(((name, *values) for name, values in totals.items()), key=lambda row: -row[2])
+
+
+def register_gauges(prefix, stats):
+    """Export the numeric values of ``stats()`` (a dict) as gauges named ``login_sim_<prefix>_<key>``."""
+    _gauge_sources[prefix] = stats
+
+
+def snapshot():
+    """``{operation: {"count", "errors", "error_rate", "mean", "p50", "p95", "p99"}}`` for every operation seen."""
+    result = {}
+    for name, histogram in sorted(_histograms.items()):
+        count = histogram.count
+        result[name] = {
+            "count": count,
+            "errors": histogram.errors,
+            "error_rate": histogram.errors / count if count else 0.0,
+            "mean": histogram.total / count if count else 0.0,
+            "p50": histogram.quantile(0.50),
+            "p95": histogram.quantile(0.95),
+            "p99": histogram.quantile(0.99),
+        }
+    return result
+
+
+def _format_number(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def render_prometheus():
+    """All metrics in the Prometheus text exposition format."""
+    duration = f"{PREFIX}_call_duration_seconds"
+    errors = f"{PREFIX}_call_errors_total"
+    lines = [
+        f"# HELP {duration} Latency of instrumented calls.",
+        f"# TYPE {duration} histogram",
+    ]
+    error_lines = [
+        f"# HELP {errors} Instrumented calls that raised.",
+        f"# TYPE {errors} counter",
+    ]
+    for name, histogram in sorted(_histograms.items()):
+        with histogram._lock:
+            buckets = list(histogram.buckets)
+            count, total, failed = histogram.count, histogram.total, histogram.errors
+        label = f'operation="{name}"'
+        cumulative = 0
+        for bound, n in zip(BUCKETS + (float("inf"),), buckets):
+            cumulative += n
+            lines.append(f'{duration}_bucket{{{label},le="{_format_number(bound)}"}} {cumulative}')
+        lines.append(f"{duration}_sum{{{label}}} {_format_number(total)}")
+        lines.append(f"{duration}_count{{{label}}} {count}")
+        error_lines.append(f"{errors}{{{label}}} {failed}")
+    lines.extend(error_lines)
+
+    for prefix, stats in sorted(_gauge_sources.items()):
+        for key, value in sorted(stats().items()):
+            if isinstance(value, (int, float)) and not isinstance(value, bool):
+                gauge = f"{PREFIX}_{prefix}_{key}"
+                lines.append(f"# TYPE {gauge} gauge")
+                lines.append(f"{gauge} {_format_number(value)}")
+    return "\n".join(lines) + "\n"
+
+
+def write_prometheus(path):
+    """Write the metrics to ``path`` atomically (for node_exporter's textfile collector and the like)."""
+    tmp = f"{path}.tmp"
+    with open(tmp, "w") as f:
+        f.write(render_prometheus())
+    os.replace(tmp, path)
+
+
+def start_http_server(port=METRICS_PORT, host=METRICS_HOST):
+    """Serve the metrics at ``http://host:port/metrics`` from a daemon thread. Returns the server."""
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    class MetricsHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split("?")[0] not in ("/", "/metrics"):
+                self.send_error(404)
+                return
+            body = render_prometheus().encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer((host, port), MetricsHandler)
+    threading.Thread(target=server.serve_forever, name="metrics-http", daemon=True).start()
+    return server
+
+
+_exporter_started = False
+_exporter_lock = threading.Lock()
+
+
+def start_exporter():
+    """Start the HTTP endpoint and/or file writer configured in the environment, once per process."""
+    global _exporter_started
+    if not ENABLED or _exporter_started:
+        return
+    with _exporter_lock:
+        if _exporter_started:
+            return
+        _exporter_started = True
+        if METRICS_PORT:
+            try:
+                start_http_server(METRICS_PORT, METRICS_HOST)
+            except OSError:
+                # Port taken, e.g. by another worker process on this host; it serves its own metrics.
+                pass
+        if METRICS_FILE:
+            def write_forever():
+                while True:
+                    time.sleep(METRICS_FILE_INTERVAL)
+                    write_prometheus(METRICS_FILE)
+
+            threading.Thread(target=write_forever, name="metrics-file", daemon=True).start()
@@ -0,0 +1,254 @@
+import asyncio
+import os
+import queue
+import random
+import threading
+
+from instrumentation import timed, timer
+
+MODEL_NAME = 'models/gemma-3-12b-it'
+
+
+class GeminiBackend:
+    """Google Gemini via the async API of google-generativeai."""
+
+    def __init__(self, model_name=MODEL_NAME):
+        self.model_name = model_name
+        self._model = None
+        self._lock = threading.Lock()
+
+    def _get_model(self):
+        if self._model is None:
+            with self._lock:
+                if self._model is None:
+                    import google.generativeai as genai
+                    genai.configure(api_key=os.getenv("GEMINI_API_KEY"))
+                    self._model = genai.GenerativeModel(self.model_name)
+        return self._model
+
+    async def generate(self, prompt, temperature=None):
+        import google.generativeai as genai
+        generation_config = None
+        if temperature is not None:
+            generation_config = genai.types.GenerationConfig(temperature=temperature)
+        response = await self._get_model().generate_content_async(prompt, generation_config=generation_config)
+        return response.text
+
+    async def stream(self, prompt, temperature=None):
+        import google.generativeai as genai
+        generation_config = None
+        if temperature is not None:
+            generation_config = genai.types.GenerationConfig(temperature=temperature)
+        response = await self._get_model().generate_content_async(
+            prompt, generation_config=generation_config, stream=True
+        )
+        async for chunk in response:
+            yield chunk.text
+
+
+class StubBackend:
+    """
+    Offline backend for load tests: sleeps for ``latency`` (+ up to ``jitter``)
+    seconds and returns a canned reply, failing with probability ``failure_rate``.
+    When streaming, the reply is sent word by word, ``chunk_delay`` seconds apart.
+    """
+
+    def __init__(self, latency=0.0, jitter=0.0, failure_rate=0.0, reply=None, chunk_delay=0.0):
+        self.latency = latency
+        self.jitter = jitter
+        self.failure_rate = failure_rate
+        self.reply = reply
+        self.chunk_delay = chunk_delay
+
+    async def _reply(self, prompt):
+        await asyncio.sleep(self.latency + random.uniform(0, self.jitter))
+        if random.random() < self.failure_rate:
+            raise RuntimeError("stub backend failure")
+        if self.reply is not None:
+            return self.reply
+        return f"[stub reply to {len(prompt)}-char prompt]"
+
+    async def generate(self, prompt, temperature=None):
+        return await self._reply(prompt)
+
+    async def stream(self, prompt, temperature=None):
+        words = (await self._reply(prompt)).split(" ")
+        for i, word in enumerate(words):
+            if i:
+                await asyncio.sleep(self.chunk_delay)
+            yield word if i == len(words) - 1 else word + " "
+
+
+class LLMClient:
+    """
+    Runs LLM calls with a deadline, bounded concurrency and retries.
+
+    Each attempt waits for a concurrency slot; failed attempts are retried with
+    jittered exponential backoff as long as the overall deadline allows. When the
+    deadline expires ``fallback`` is returned (called first if it is callable), or
+    ``TimeoutError`` is raised if there is none.
+    """
+
+    def __init__(self, backend, timeout=15.0, max_concurrency=4, retries=2, backoff=0.5):
+        self.backend = backend
+        self.timeout = timeout
+        self.max_concurrency = max_concurrency
+        self.retries = retries
+        self.backoff = backoff
+        self._semaphores = {}
+
+    def _semaphore(self):
+        loop = asyncio.get_running_loop()
+        semaphore = self._semaphores.get(loop)
+        if semaphore is None:
+            semaphore = self._semaphores[loop] = asyncio.Semaphore(self.max_concurrency)
+        return semaphore
+
+    async def agenerate(self, prompt, fallback=None, timeout=None, **kwargs):
+        try:
+            return await asyncio.wait_for(self._with_retries(prompt, **kwargs), timeout or self.timeout)
+        except asyncio.TimeoutError:
+            if fallback is None:
+                raise
+            if callable(fallback):
+                # Fallbacks may block (e.g. a database read); keep them off the event loop
+                return await asyncio.get_running_loop().run_in_executor(None, fallback)
+            return fallback
+
+    async def _with_retries(self, prompt, **kwargs):
+        semaphore = self._semaphore()
+        for attempt in range(self.retries + 1):
+            try:
+                async with semaphore:
+                    with timer("llm_client.backend.generate"):
+                        return await self.backend.generate(prompt, **kwargs)
+            except Exception:
+                if attempt == self.retries:
+                    raise
+                await asyncio.sleep(random.uniform(0, self.backoff * 2 ** attempt))
+
+    async def astream(self, prompt, **kwargs):
+        """Yield text chunks as they arrive. Retries only happen before the first chunk."""
+        semaphore = self._semaphore()
+        for attempt in range(self.retries + 1):
+            started = False
+            try:
+                async with semaphore:
+                    async for chunk in self.backend.stream(prompt, **kwargs):
+                        started = True
+                        yield chunk
+                return
+            except Exception:
+                if started or attempt == self.retries:
+                    raise
+                await asyncio.sleep(random.uniform(0, self.backoff * 2 ** attempt))
+
+    @timed
+    def generate(self, prompt, fallback=None, timeout=None, **kwargs):
+        """
+        Blocking wrapper for callers outside an event loop, such as Streamlit scripts.
+
+        A callable ``fallback`` runs in the calling thread, so it never blocks the
+        shared event loop that every other in-flight call is waiting on.
+        """
+        future = asyncio.run_coroutine_threadsafe(
+            self.agenerate(prompt, timeout=timeout, **kwargs), _background_loop()
+        )
+        try:
+            return future.result()
+        except asyncio.TimeoutError:
+            if fallback is None:
+                raise
+            return fallback() if callable(fallback) else fallback
+
+    def stream(self, prompt, fallback=None, timeout=None, **kwargs):
+        """
+        Blocking generator over ``astream`` for sync callers.
+
+        The deadline covers the whole stream. If it expires before anything arrived,
+        ``fallback`` is yielded instead; if it expires mid-stream, the stream just ends.
+        """
+        chunks = queue.Queue()
+
+        async def pump():
+            async for chunk in self.astream(prompt, **kwargs):
+                chunks.put(chunk)
+
+        async def run():
+            try:
+                await asyncio.wait_for(pump(), timeout or self.timeout)
+                chunks.put(_END_OF_STREAM)
+            except Exception as e:
+                chunks.put(e)
+
+        future = asyncio.run_coroutine_threadsafe(run(), _background_loop())
+        received = False
+        try:
+            with timer("llm_client.LLMClient.stream"):
+                while True:
+                    item = chunks.get()
+                    if item is _END_OF_STREAM:
+                        return
+                    if isinstance(item, Exception):
+                        if isinstance(item, asyncio.TimeoutError) and fallback is not None:
+                            if not received:
+                                yield fallback() if callable(fallback) else fallback
+                            return
+                        raise item
+                    received = True
+                    yield item
+        finally:
+            future.cancel()
+
+
+_END_OF_STREAM = object()
+
+
+_loop = None
+_loop_lock = threading.Lock()
+
+
+def _background_loop():
+    """One event loop per process, running on a daemon thread, shared by all sync callers."""
+    global _loop
+    if _loop is None:
+        with _loop_lock:
+            if _loop is None:
+                loop = asyncio.new_event_loop()
+                threading.Thread(target=loop.run_forever, name="llm-client-loop", daemon=True).start()
+                _loop = loop
+    return _loop
+
+
+def backend_from_env():
+    """``LLM_BACKEND=stub`` selects the offline stub; anything else uses Gemini."""
+    if os.getenv("LLM_BACKEND", "gemini") == "stub":
+        return StubBackend(
+            latency=float(os.getenv("LLM_STUB_LATENCY", "0.05")),
+            jitter=float(os.getenv("LLM_STUB_JITTER", "0")),
+            failure_rate=float(os.getenv("LLM_STUB_FAILURE_RATE", "0")),
+        )
+    return GeminiBackend()
+
+
+_client = None
+
+
+def get_client():
+    """Return the process-wide client, built from the environment on first use."""
+    global _client
+    if _client is None:
+        with _loop_lock:
+            if _client is None:
+                _client = LLMClient(
+                    backend_from_env(),
+                    timeout=float(os.getenv("LLM_TIMEOUT", "15")),
+                    max_concurrency=int(os.getenv("LLM_MAX_CONCURRENCY", "4")),
+                    retries=int(os.getenv("LLM_RETRIES", "2")),
+                )
+    return _client
+
+
+def set_backend(backend):
+    """Swap the backend of the process-wide client, e.g. to a StubBackend in load tests."""
+    get_client().backend = backend
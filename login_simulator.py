@@ -1,19 +1,41 @@
 import re
-
-import os
-import google.generativeai as genai
+from functools import partial
 
 from auth_service import AuthService
 from classical_agent import ClassicalAgent
+from conversation_memory import ConversationMemory
 from gen_ai_agent import GenAIAgent
+from instrumentation import timed
+from llm_client import get_client
+from recovery_state import PASSWORD_RESET, STARTED, STEPS_COMPLETED, InvalidTransition, RecoveryStateMachine
+
+RECOVERY_START_FALLBACK = (
+    " Step 1 of 3:\n"
+    "Please enter your registered email or phone number."
+)
 
 
 class LoginSimulator:
     @staticmethod
+    @timed
     def start_genai_recovery_chat(user_message, username):
-        genai.configure(api_key=os.getenv("GEMINI_API_KEY"))
-        model = genai.GenerativeModel('models/gemma-3-12b-it')
+        recovery_prompt, fallback = LoginSimulator._recovery_chat_prompt(user_message, username)
+        try:
+            return get_client().generate(recovery_prompt, fallback=fallback)
+        except Exception as e:
+            return f"Could not start GenAI recovery chat: {e}"
+
+    @staticmethod
+    def start_genai_recovery_chat_stream(user_message, username):
+        """Like ``start_genai_recovery_chat`` but yields the reply in chunks as it is generated."""
+        recovery_prompt, fallback = LoginSimulator._recovery_chat_prompt(user_message, username)
+        try:
+            yield from get_client().stream(recovery_prompt, fallback=fallback)
+        except Exception as e:
+            yield f"Could not start GenAI recovery chat: {e}"
 
+    @staticmethod
+    def _recovery_chat_prompt(user_message, username):
         if username:
             account_status = AuthService.check_account_status(username)
         else:
@@ -49,11 +71,11 @@ class LoginSimulator:
             User message: {user_message}
             """
 
-        try:
-            response = model.generate_content(recovery_prompt)
-            return response.text
-        except Exception as e:
-            return f"Could not start GenAI recovery chat: {e}"
+        if account_status == "active":
+            fallback = partial(ClassicalAgent.get_classical_block_explanation, username)
+        else:
+            fallback = RECOVERY_START_FALLBACK
+        return recovery_prompt, fallback
 
     @staticmethod
     def get_block_explanation(username, agent_type):
@@ -63,83 +85,163 @@ class LoginSimulator:
             return GenAIAgent.get_genai_block_explanation(username)
 
     @staticmethod
-    def genai_chat_response(message, chat_history, username):
+    @timed
+    def genai_chat_response(message, chat_history, username, memory=None, session_id=None):
         """
         Simplified 3-step recovery flow with dummy password reset link before unlocking account.
+
+        Pass a ``ConversationMemory`` as ``memory`` to keep prompt size and recovery
+        progress bounded; the user message and the reply are recorded in it. Without
+        it, memory is rebuilt from ``chat_history`` on every call, with no recovery
+        progress: the history says nothing about which steps were really verified.
+
+        With a ``session_id``, recovery progress is read from and written to the
+        recovery_sessions table, so any process can continue the session.
         """
-        if not chat_history:
-            chat_history = []
+        memory = LoginSimulator._memory_for(chat_history, memory)
+        reply, prompt = LoginSimulator._chat_turn(message, memory, username, session_id)
+        if reply is None:
+            try:
+                reply = get_client().generate(
+                    prompt, fallback=partial(ClassicalAgent.get_classical_block_explanation, username)
+                )
+            except Exception as e:
+                reply = f"❌ Error generating response: {e}"
+        memory.add("assistant", reply)
+        return reply
+
+    @staticmethod
+    def genai_chat_response_stream(message, chat_history, username, memory=None, session_id=None):
+        """
+        Like ``genai_chat_response`` but yields the reply in chunks. Scripted recovery
+        steps arrive as a single chunk; LLM replies stream as they are generated.
+        """
+        memory = LoginSimulator._memory_for(chat_history, memory)
+        reply, prompt = LoginSimulator._chat_turn(message, memory, username, session_id)
+        if reply is not None:
+            memory.add("assistant", reply)
+            yield reply
+            return
+        chunks = []
+        try:
+            for chunk in get_client().stream(
+                    prompt, fallback=partial(ClassicalAgent.get_classical_block_explanation, username)):
+                chunks.append(chunk)
+                yield chunk
+        except Exception as e:
+            chunks = [f"❌ Error generating response: {e}"]
+            yield chunks[0]
+        memory.add("assistant", "".join(chunks))
 
+    @staticmethod
+    def _memory_for(chat_history, memory):
+        if memory is not None:
+            return memory
+        history = chat_history or []
+        # main.py appends the current user message before calling; it is added back in _chat_turn
+        if history and history[-1]["role"] == "user":
+            history = history[:-1]
+        return ConversationMemory.from_history(history)
+
+    @staticmethod
+    def _chat_turn(message, memory, username, session_id=None):
+        """
+        Return ``(reply, None)`` when the turn is answered by the scripted recovery
+        flow, or ``(None, prompt)`` when it needs the LLM.
+        """
         account_status = AuthService.check_account_status(username)
         last_user_msg = message.strip().lower()
+        memory.add("user", message)
+
+        if account_status == "locked" and session_id is not None:
+            session = RecoveryStateMachine.get_session(session_id)
+            state = session[1] if session else None
+            if state is None or state == PASSWORD_RESET or session[0] != username:
+                # New session, the account was locked again after a completed recovery, or
+                # the session was verified for another account and proves nothing about this one
+                RecoveryStateMachine.start(session_id, username)
+                state = STARTED
+            memory.recovery_step = STEPS_COMPLETED[state]
 
-        # Track progress from previous assistant messages
-        step1_done = any("step 1 complete" in m["content"].lower() for m in chat_history if m["role"] == "assistant")
-        step2_done = any("step 2 complete" in m["content"].lower() for m in chat_history if m["role"] == "assistant")
+        step1_done = memory.recovery_step >= 1
+        step2_done = memory.recovery_step >= 2
 
         if account_status == "locked":
-            if not step1_done:
-                if re.search(r"@|[\d]{7,}", last_user_msg):  # basic email or phone match
-                    if ClassicalAgent.validate_recovery_info(username, "contact", last_user_msg):
+            try:
+                if not step1_done:
+                    if re.search(r"@|[\d]{7,}", last_user_msg):  # basic email or phone match
+                        if ClassicalAgent.validate_recovery_info(username, "contact", last_user_msg):
+                            memory.recovery_step = 1
+                            if session_id is not None:
+                                RecoveryStateMachine.verify_contact(session_id, username)
+                            return (
+                                "✅ Step 1 complete!\n"
+                                " Step 2 of 3:\n"
+                                "Please enter the amount of your last transaction."
+                            ), None
+                        else:
+                            return (
+                                "❌ That contact doesn't match our records.\n"
+                                "Please try again with your correct email or phone number."
+                            ), None
+                    else:
                         return (
-                            "✅ Step 1 complete!\n"
-                            " Step 2 of 3:\n"
-                            "Please enter the amount of your last transaction."
-                        )
+                            " Step 1 of 3:\n"
+                            "Please enter your registered email or phone number."
+                        ), None
+
+                if step1_done and not step2_done:
+                    if re.search(r"\d+[.,]?\d*", last_user_msg):
+                        if ClassicalAgent.validate_recovery_info(username, "transaction", last_user_msg):
+                            memory.recovery_step = 2
+                            if session_id is not None:
+                                RecoveryStateMachine.verify_transaction(session_id, username)
+                            return (
+                                "✅ Step 2 complete!\n"
+                                " Step 3 of 3:\n"
+                                "Please enter your new password (minimum 6 characters)."
+                            ), None
+                        else:
+                            return (
+                                "❌ That transaction amount couldn't be verified.\n"
+                                "Please try again or contact support."
+                            ), None
                     else:
                         return (
-                            "❌ That contact doesn't match our records.\n"
-                            "Please try again with your correct email or phone number."
-                        )
-                else:
-                    return (
-                        " Step 1 of 3:\n"
-                        "Please enter your registered email or phone number."
-                    )
+                            " Step 2 of 3:\n"
+                            "Please enter the amount of your last transaction."
+                        ), None
 
-            if step1_done and not step2_done:
-                if re.search(r"\d+[.,]?\d*", last_user_msg):
-                    if ClassicalAgent.validate_recovery_info(username, "transaction", last_user_msg):
+                if step2_done:
+                    if len(last_user_msg) >= 6:
+                        if session_id is not None:
+                            # Sets the password and unlocks only if this turn wins the session's transition
+                            RecoveryStateMachine.reset_password(session_id, username, last_user_msg)
+                        else:
+                            AuthService.update_password(username, last_user_msg)
+                            AuthService.unlock_account(username)
+                        memory.recovery_step = 3
                         return (
-                            "✅ Step 2 complete!\n"
-                            " Step 3 of 3:\n"
-                            "Please enter your new password (minimum 6 characters)."
-                        )
+                            "✅ Your password has been successfully updated and your account is now unlocked!\n"
+                            "You can now log in with your new password.\n"
+                            "Let me know if you need any more help."
+                        ), None
                     else:
                         return (
-                            "❌ That transaction amount couldn't be verified.\n"
-                            "Please try again or contact support."
-                        )
-                else:
-                    return (
-                        " Step 2 of 3:\n"
-                        "Please enter the amount of your last transaction."
-                    )
-
-            if step2_done:
-                if len(last_user_msg) >= 6:
-                    AuthService.update_password(username, last_user_msg)
-                    AuthService.unlock_account(username)
-                    return (
-                        "✅ Your password has been successfully updated and your account is now unlocked!\n"
-                        "You can now log in with your new password.\n"
-                        "Let me know if you need any more help."
-                    )
-                else:
-                    return (
-                        "Step 3 of 3:\n"
-                        "Please enter your new password (minimum 6 characters)."
-                    )
-
-            return "I'm here to help! Let's continue the recovery process."
-
-        genai.configure(api_key=os.getenv("GEMINI_API_KEY"))
-        model = genai.GenerativeModel('models/gemma-3-12b-it')
+                            "Step 3 of 3:\n"
+                            "Please enter your new password (minimum 6 characters)."
+                        ), None
 
-        # Build conversation history into prompt
-        chat_messages = "\n".join(
-            f"{msg['role'].capitalize()}: {msg['content']}" for msg in chat_history
-        )
+                return "I'm here to help! Let's continue the recovery process.", None
+            except InvalidTransition:
+                # Another window or request moved this recovery session on first
+                memory.recovery_step = RecoveryStateMachine.steps_completed(session_id)
+                if memory.recovery_step >= 3:
+                    return (
+                        "✅ This recovery was already completed.\n"
+                        "You can log in with the password you set."
+                    ), None
+                return "This recovery was updated from another window. Please send your answer again.", None
 
         prompt = f"""
         You are a helpful assistant. The user's account is active.
@@ -147,13 +249,8 @@ class LoginSimulator:
         Stay concise, friendly, and helpful.
 
         Conversation so far:
-        {chat_messages}
-        User: {message}
+        {memory.render()}
         Assistant:
         """
 
-        try:
-            response = model.generate_content(prompt)
-            return response.text
-        except Exception as e:
-            return f"❌ Error generating response: {e}"
+        return None, prompt
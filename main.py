@@ -1,15 +1,30 @@
+import functools
+import time
+import uuid
+from collections import deque
+
 import streamlit as st
 
-from classical_agent import ClassicalAgent
-from database import create_user, get_user, update_user, submit_feedback_to_db, get_feedback_from_db
-from database import init_db
+import instrumentation
+import ui_cache
+from auth_service import MAX_FAILED_ATTEMPTS, RATE_LIMITED, source_risk
+from conversation_memory import ConversationMemory
+from database import create_user, get_lock_state, get_user, record_failed_login, record_login_event
 from gen_ai_agent import GenAIAgent
 from login_simulator import LoginSimulator
+from passwords import verify_password
+from rate_limiter import get_limiter
+from recovery_state import PASSWORD_RESET, RecoveryStateMachine
 
-init_db()
+# With METRICS_ENABLED=1, every instrumented call made during this rerun is collected
+# for the debug panel at the bottom of the sidebar
+rerun_started = time.perf_counter()
+rerun_trace = instrumentation.start_trace()
 
 st.set_page_config(page_title="Secure Login System", layout="wide", initial_sidebar_state="expanded")
 
+ui_cache.warm_up()
+
 st.markdown("""
 <style>
     .stButton>button { background-color: #4CAF50; color: white; border: none; padding: 10px 20px; border-radius: 5px; }
@@ -27,6 +42,134 @@ st.markdown("""
 </style>
 """, unsafe_allow_html=True)
 
+
+def render_bot_stream(placeholder, chunks):
+    """Render streamed reply chunks into ``placeholder`` as they arrive and return the full text."""
+    response = ""
+    for chunk in chunks:
+        response += chunk
+        placeholder.markdown(f'<div class="chat-message bot-message">Bot: {response}▌</div>',
+                             unsafe_allow_html=True)
+    placeholder.markdown(f'<div class="chat-message bot-message">Bot: {response}</div>', unsafe_allow_html=True)
+    return response
+
+
+def record_rerun(scope, started):
+    st.session_state.rerun_timings.append({"scope": scope, "ms": round((time.perf_counter() - started) * 1000, 1)})
+
+
+def timed_fragment(fn):
+    """
+    ``st.fragment``: interacting with a widget inside it reruns only this function,
+    not the whole script. With metrics enabled those fragment-only reruns are timed
+    for the debug panel.
+    """
+    @functools.wraps(fn)
+    def run(*args, **kwargs):
+        started = time.perf_counter()
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            if instrumentation.ENABLED and not st.session_state.full_rerun:
+                record_rerun(f"fragment: {fn.__name__}", started)
+
+    return st.fragment(run)
+
+
+@timed_fragment
+def explanation_section(username):
+    agent_type = st.selectbox("Select Agent for Status Explanation", ["Classical Agent", "GenAI Agent"])
+
+    if agent_type == "Classical Agent":
+        st.markdown(f"**Classical Agent Explanation**: {ui_cache.classical_explanation(username)}")
+    else:
+        st.markdown(f"**GenAI Agent Explanation**: {GenAIAgent.get_genai_block_explanation(username)}")
+
+
+@timed_fragment
+def feedback_section(username):
+    st.markdown('<div class="subheader">Submit Feedback</div>', unsafe_allow_html=True)
+    with st.form("feedback_form"):
+        rating = st.slider("Rating (1-5)", 1, 5, 3)
+        comment = st.text_area("Comment")
+        feedback_submit = st.form_submit_button("Submit Feedback")
+
+        if feedback_submit:
+            ui_cache.submit_feedback(username, rating, comment)
+            st.success("Feedback submitted successfully!")
+
+    st.markdown('<div class="subheader">Previous Feedback</div>', unsafe_allow_html=True)
+    feedback = ui_cache.feedback_page(username)
+    if feedback:
+        st.dataframe(feedback)
+    else:
+        st.info("No feedback available.")
+
+
+@timed_fragment
+def chat_section():
+    if 'processing_message' not in st.session_state:
+        st.session_state.processing_message = False
+
+    chat_container = st.container()
+    with chat_container:
+        for msg in st.session_state.chat_history:
+            if msg['role'] == 'user':
+                st.markdown(f'<div class="chat-message user-message">You: {msg["content"]}</div>',
+                            unsafe_allow_html=True)
+            else:
+                st.markdown(f'<div class="chat-message bot-message">Bot: {msg["content"]}</div>',
+                            unsafe_allow_html=True)
+
+    bot_response_placeholder = st.empty()
+
+    with st.form(key=f"chat_form_{st.session_state.recovery_step}", clear_on_submit=True):
+        user_message = st.text_input("Your message",
+                                     key=f"chat_input_{st.session_state.recovery_step}",
+                                     placeholder="Type your message and press Enter")
+        submit = st.form_submit_button("Send", use_container_width=True)
+
+        if submit and user_message and not st.session_state.processing_message:
+            st.session_state.processing_message = True
+
+            if not (st.session_state.chat_history and
+                    st.session_state.chat_history[-1]["role"] == "user" and
+                    st.session_state.chat_history[-1]["content"] == user_message):
+                st.session_state.chat_history.append({"role": "user", "content": user_message})
+
+                with chat_container:
+                    st.markdown(f'<div class="chat-message user-message">You: {user_message}</div>',
+                                unsafe_allow_html=True)
+
+                with bot_response_placeholder:
+                    st.markdown('<div class="chat-message loading-bubble">Bot: Thinking...</div>',
+                                unsafe_allow_html=True)
+
+                # Stream the reply into the placeholder; history is only updated once it is complete
+                response = render_bot_stream(
+                    bot_response_placeholder,
+                    LoginSimulator.genai_chat_response_stream(user_message, st.session_state.chat_history,
+                                                              st.session_state.username,
+                                                              memory=st.session_state.chat_memory,
+                                                              session_id=st.session_state.recovery_session_id)
+                )
+
+                st.session_state.chat_history.append({"role": "assistant", "content": response})
+
+                st.session_state.recovery_step += 1
+
+                if st.session_state.chat_mode == "recovery" and "account is now unlocked" in response.lower():
+                    st.session_state.recovery_step = 0
+                    st.session_state.chat_mode = "normal"
+                    st.session_state.insights_username = st.session_state.username
+                    st.success("Recovery complete! You can now log in or continue chatting.")
+
+                st.session_state.processing_message = False
+
+                # scope="fragment" is only allowed while the fragment reruns on its own
+                st.rerun(scope="app" if st.session_state.full_rerun else "fragment")
+
+
 # Initialize session state
 if 'page' not in st.session_state:
     st.session_state.page = 'login'
@@ -34,6 +177,8 @@ if 'username' not in st.session_state:
     st.session_state.username = None
 if 'chat_history' not in st.session_state:
     st.session_state.chat_history = []
+if 'chat_memory' not in st.session_state:
+    st.session_state.chat_memory = ConversationMemory()
 if 'recovery_step' not in st.session_state:
     st.session_state.recovery_step = 0
 if 'chat_mode' not in st.session_state:
@@ -42,196 +187,168 @@ if 'last_message' not in st.session_state:
     st.session_state.last_message = None
 if 'insights_username' not in st.session_state:
     st.session_state.insights_username = None
+if 'rerun_timings' not in st.session_state:
+    st.session_state.rerun_timings = deque(maxlen=20)
+if 'recovery_session_id' not in st.session_state:
+    st.session_state.recovery_session_id = st.query_params.get("recovery_session")
+    # Resume an unfinished recovery carried over in the URL (after a reload, or on another worker)
+    session = (RecoveryStateMachine.get_session(st.session_state.recovery_session_id)
+               if st.session_state.recovery_session_id else None)
+    if session and session[1] != PASSWORD_RESET:
+        st.session_state.username = session[0]
+        st.session_state.chat_mode = "recovery"
+        st.session_state.recovery_step = 1
+        st.session_state.chat_history = [{"role": "assistant", "content": "Welcome back! Let's continue your recovery."}]
+# Fragments check this to tell their own reruns apart from a full one
+st.session_state.full_rerun = True
+
+# The flag is cleared even when the page stops early for st.rerun()
+try:
+    # Sidebar navigation
+    st.sidebar.title("Navigation")
+    page = st.sidebar.radio("Go to", ["Login/Register", "Account Insights", "Recovery Chatbot"])
+    st.session_state.page = page
+
+    # Main content
+    st.markdown('<div class="main">', unsafe_allow_html=True)
+
+    if st.session_state.page == "Login/Register":
+        st.markdown('<div class="header">Welcome to Secure Login System</div>', unsafe_allow_html=True)
+
+        # Tabs for Login and Register
+        tab1, tab2 = st.tabs(["Login", "Register"])
+
+        with tab1:
+            st.markdown('<div class="subheader">Login</div>', unsafe_allow_html=True)
+            with st.form("login_form"):
+                username = st.text_input("Username")
+                password = st.text_input("Password", type="password")
+                submit = st.form_submit_button("Login")
+
+                if submit and not get_limiter().allow(username, st.context.ip_address):
+                    st.error(RATE_LIMITED)
+                elif submit:
+                    user = get_user(username)
+                    # The cached record can lag a lock or unlock made by another process
+                    lock_state = get_lock_state(username, cached=False) if user else None
+                    user = user if lock_state else None
+                    locked = bool(lock_state and lock_state[1])
+                    success = bool(user) and not locked and verify_password(password, user.password)
+                    if user:
+                        record_login_event(username, success, st.context.ip_address, source_risk(st.context.ip_address))
+                    if success:
+                        st.session_state.username = username
+                        st.session_state.insights_username = username
+                        st.success(f"Welcome back, {username}!")
+                        st.session_state.page = "Account Insights"
+                    elif user and locked:
+                        st.error("Account is locked. Please use the Recovery Chatbot.")
+                    else:
+                        if user:
+                            record_failed_login(username, MAX_FAILED_ATTEMPTS)
+                        st.error("Invalid credentials or account locked.")
+
+        with tab2:
+            st.markdown('<div class="subheader">Register</div>', unsafe_allow_html=True)
+            with st.form("register_form"):
+                new_username = st.text_input("New Username")
+                new_password = st.text_input("New Password", type="password")
+                email = st.text_input("Email")
+                phone = st.text_input("Phone")
+                register = st.form_submit_button("Register")
+
+                if register and st.context.ip_address and not get_limiter().allow_source(st.context.ip_address):
+                    st.error(RATE_LIMITED)
+                elif register:
+                    if create_user(new_username, new_password, email, phone):
+                        st.success("Registration successful! Please log in.")
+                    else:
+                        st.error("Username already exists.")
 
-# Sidebar navigation
-st.sidebar.title("Navigation")
-page = st.sidebar.radio("Go to", ["Login/Register", "Account Insights", "Recovery Chatbot"])
-st.session_state.page = page
-
-# Main content
-st.markdown('<div class="main">', unsafe_allow_html=True)
-
-if st.session_state.page == "Login/Register":
-    st.markdown('<div class="header">Welcome to Secure Login System</div>', unsafe_allow_html=True)
-
-    # Tabs for Login and Register
-    tab1, tab2 = st.tabs(["Login", "Register"])
-
-    with tab1:
-        st.markdown('<div class="subheader">Login</div>', unsafe_allow_html=True)
-        with st.form("login_form"):
-            username = st.text_input("Username")
-            password = st.text_input("Password", type="password")
-            submit = st.form_submit_button("Login")
-
-            if submit:
-                user = get_user(username)
-                if user and user[2] == password and not user[6]:
-                    st.session_state.username = username
-                    st.session_state.insights_username = username
-                    st.success(f"Welcome back, {username}!")
-                    st.session_state.page = "Account Insights"
-                elif user and user[6]:
-                    st.error("Account is locked. Please use the Recovery Chatbot.")
-                else:
-                    update_user(username, user[5] + 1 if user else 1, 1 if user and user[5] >= 2 else 0)
-                    st.error("Invalid credentials or account locked.")
-
-    with tab2:
-        st.markdown('<div class="subheader">Register</div>', unsafe_allow_html=True)
-        with st.form("register_form"):
-            new_username = st.text_input("New Username")
-            new_password = st.text_input("New Password", type="password")
-            email = st.text_input("Email")
-            phone = st.text_input("Phone")
-            register = st.form_submit_button("Register")
-
-            if register:
-                if create_user(new_username, new_password, email, phone):
-                    st.success("Registration successful! Please log in.")
-                else:
-                    st.error("Username already exists.")
-
-elif st.session_state.page == "Account Insights":
-    st.markdown('<div class="header">Account Insights</div>', unsafe_allow_html=True)
-
-    insights_username = st.text_input("Enter your username", key="insights_username_input")
-    if st.button("Check Account Status"):
-        if insights_username:
-            st.session_state.insights_username = insights_username
-        else:
-            st.error("Please enter a username.")
-
-    if st.session_state.insights_username:
-        user = get_user(st.session_state.insights_username)
-        if user:
-            st.markdown(f'<div class="subheader">Account Status for {st.session_state.insights_username}</div>',
-                        unsafe_allow_html=True)
-
-            agent_type = st.selectbox("Select Agent for Status Explanation", ["Classical Agent", "GenAI Agent"])
+    elif st.session_state.page == "Account Insights":
+        st.markdown('<div class="header">Account Insights</div>', unsafe_allow_html=True)
 
-            if agent_type == "Classical Agent":
-                explanation = ClassicalAgent.get_classical_block_explanation(st.session_state.insights_username)
-                st.markdown(f"**Classical Agent Explanation**: {explanation}")
-            else:
-                genai_explanation = GenAIAgent.get_genai_block_explanation(st.session_state.insights_username)
-                st.markdown(f"**GenAI Agent Explanation**: {genai_explanation}")
-
-            st.markdown('<div class="subheader">Submit Feedback</div>', unsafe_allow_html=True)
-            with st.form("feedback_form"):
-                rating = st.slider("Rating (1-5)", 1, 5, 3)
-                comment = st.text_area("Comment")
-                feedback_submit = st.form_submit_button("Submit Feedback")
-
-                if feedback_submit:
-                    submit_feedback_to_db(st.session_state.insights_username, rating, comment)
-                    st.success("Feedback submitted successfully!")
-
-            st.markdown('<div class="subheader">Previous Feedback</div>', unsafe_allow_html=True)
-            feedback = get_feedback_from_db()
-            if not feedback.empty:
-                st.dataframe(
-                    feedback[feedback['username'] == st.session_state.insights_username][['rating', 'comment']])
+        insights_username = st.text_input("Enter your username", key="insights_username_input")
+        if st.button("Check Account Status"):
+            if insights_username:
+                st.session_state.insights_username = insights_username
             else:
-                st.info("No feedback available.")
-        else:
-            st.error("Username not found.")
-
-elif st.session_state.page == "Recovery Chatbot":
-    st.markdown('<div class="header">Account Recovery Chatbot</div>', unsafe_allow_html=True)
-
-    # Username input
-    username_input = st.text_input("Enter your username", key="chat_username")
-    if st.button("Check Account"):
-        if username_input:
-            st.session_state.username = username_input
-            user = get_user(username_input)
-            if user:
-                if user[6]:
-                    st.session_state.chat_mode = "recovery"
-                    st.session_state.chat_history = []
-                    st.session_state.recovery_step = 1
-                    response = LoginSimulator.start_genai_recovery_chat("", username_input)
-                    st.session_state.chat_history.append({"role": "assistant", "content": response})
-                else:
-                    st.session_state.chat_mode = "normal"
-                    st.session_state.chat_history = []
-                    st.session_state.recovery_step = 1
-                    st.session_state.chat_history.append({
-                        "role": "assistant",
-                        "content": f"Hello, {username_input}! <b>Your account is active.</b><br> How can I assist you "
-                                   f"today?"
-                    })
-                st.session_state.last_message = None
-                st.rerun()
+                st.error("Please enter a username.")
+
+        if st.session_state.insights_username:
+            if ui_cache.account_status(st.session_state.insights_username) != "not_found":
+                st.markdown(f'<div class="subheader">Account Status for {st.session_state.insights_username}</div>',
+                            unsafe_allow_html=True)
+                explanation_section(st.session_state.insights_username)
+                feedback_section(st.session_state.insights_username)
             else:
                 st.error("Username not found.")
-        else:
-            st.error("Please enter a username.")
-
-    if st.session_state.username and st.session_state.chat_mode:
-        if 'processing_message' not in st.session_state:
-            st.session_state.processing_message = False
-
-        chat_container = st.container()
-        with chat_container:
-            for msg in st.session_state.chat_history:
-                if msg['role'] == 'user':
-                    st.markdown(f'<div class="chat-message user-message">You: {msg["content"]}</div>',
-                                unsafe_allow_html=True)
-                else:
-                    st.markdown(f'<div class="chat-message bot-message">Bot: {msg["content"]}</div>',
-                                unsafe_allow_html=True)
-
-        bot_response_placeholder = st.empty()
-
-        with st.form(key=f"chat_form_{st.session_state.recovery_step}", clear_on_submit=True):
-            user_message = st.text_input("Your message",
-                                         key=f"chat_input_{st.session_state.recovery_step}",
-                                         placeholder="Type your message and press Enter")
-            submit = st.form_submit_button("Send", use_container_width=True)
 
-            if submit and user_message and not st.session_state.processing_message:
-                st.session_state.processing_message = True
-
-                if not (st.session_state.chat_history and
-                        st.session_state.chat_history[-1]["role"] == "user" and
-                        st.session_state.chat_history[-1]["content"] == user_message):
-                    st.session_state.chat_history.append({"role": "user", "content": user_message})
-
-                    with chat_container:
-                        st.markdown(f'<div class="chat-message user-message">You: {user_message}</div>',
-                                    unsafe_allow_html=True)
-
-                    with bot_response_placeholder:
-                        st.markdown('<div class="chat-message loading-bubble">Bot: Thinking...</div>',
-                                    unsafe_allow_html=True)
-
-                    if st.session_state.chat_mode == "recovery":
-                        response = LoginSimulator.genai_chat_response(user_message, st.session_state.chat_history,
-                                                                      st.session_state.username)
+    elif st.session_state.page == "Recovery Chatbot":
+        st.markdown('<div class="header">Account Recovery Chatbot</div>', unsafe_allow_html=True)
+
+        # Username input
+        username_input = st.text_input("Enter your username", key="chat_username")
+        if st.button("Check Account"):
+            if username_input:
+                st.session_state.username = username_input
+                # A session belongs to the account it was started for; never carry it over
+                st.session_state.recovery_session_id = None
+                st.query_params.pop("recovery_session", None)
+                status = ui_cache.account_status(username_input)
+                if status != "not_found":
+                    if status == "locked":
+                        st.session_state.chat_mode = "recovery"
+                        st.session_state.chat_history = []
+                        st.session_state.chat_memory = ConversationMemory()
+                        st.session_state.recovery_step = 1
+                        # Recovery progress lives in SQLite under this id; keep it in the URL so a
+                        # reload (or another worker) picks the same session back up
+                        st.session_state.recovery_session_id = uuid.uuid4().hex
+                        st.query_params["recovery_session"] = st.session_state.recovery_session_id
+                        RecoveryStateMachine.start(st.session_state.recovery_session_id, username_input)
+                        response = render_bot_stream(
+                            st.empty(), LoginSimulator.start_genai_recovery_chat_stream("", username_input))
+                        st.session_state.chat_history.append({"role": "assistant", "content": response})
+                        st.session_state.chat_memory.add("assistant", response)
                     else:
-                        response = LoginSimulator.genai_chat_response(
-                            user_message,
-                            st.session_state.chat_history,
-                            st.session_state.username
-                        )
-
-                    st.session_state.chat_history.append({"role": "assistant", "content": response})
-
-                    with bot_response_placeholder:
-                        st.markdown(f'<div class="chat-message bot-message">Bot: {response}</div>',
-                                    unsafe_allow_html=True)
-
-                    st.session_state.recovery_step += 1
-
-                    if st.session_state.chat_mode == "recovery" and "account is now unlocked" in response.lower():
-                        st.session_state.recovery_step = 0
                         st.session_state.chat_mode = "normal"
-                        st.session_state.insights_username = st.session_state.username
-                        st.success("Recovery complete! You can now log in or continue chatting.")
-
-                    st.session_state.processing_message = False
-
+                        st.session_state.chat_history = []
+                        st.session_state.chat_memory = ConversationMemory()
+                        st.session_state.recovery_step = 1
+                        st.session_state.chat_history.append({
+                            "role": "assistant",
+                            "content": f"Hello, {username_input}! <b>Your account is active.</b><br> "
+                                       f"How can I assist you today?"
+                        })
+                        st.session_state.chat_memory.add("assistant", st.session_state.chat_history[-1]["content"])
+                    st.session_state.last_message = None
                     st.rerun()
-st.markdown('</div>', unsafe_allow_html=True)
+                else:
+                    st.error("Username not found.")
+            else:
+                st.error("Please enter a username.")
+
+        if st.session_state.username and st.session_state.chat_mode:
+            chat_section()
+    st.markdown('</div>', unsafe_allow_html=True)
+
+    if instrumentation.ENABLED:
+        instrumentation.stop_trace()
+        record_rerun("full", rerun_started)
+        with st.sidebar.expander("Debug: rerun timings"):
+            st.caption(f"This rerun took {(time.perf_counter() - rerun_started) * 1000:.1f} ms. "
+                       f"Nested calls are also counted in their callers.")
+            st.dataframe([
+                {"operation": name, "calls": calls, "total ms": round(total * 1000, 2), "errors": errors}
+                for name, calls, total, errors in instrumentation.summarize_trace(rerun_trace)
+            ])
+            # Fragment reruns do not redraw the sidebar, so they show up here on the next full rerun
+            by_scope = {}
+            for timing in st.session_state.rerun_timings:
+                by_scope.setdefault(timing["scope"], []).append(timing["ms"])
+            st.caption("Recent reruns, average wall-clock ms: " + ", ".join(
+                f"{scope} {sum(values) / len(values):.1f} ({len(values)})" for scope, values in by_scope.items()))
+            st.dataframe(list(st.session_state.rerun_timings))
+finally:
+    st.session_state.full_rerun = False
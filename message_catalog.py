@@ -0,0 +1,150 @@
+"""
+Bilingual (English/Nepali) account-status explanations, compiled once and
+rendered by joining the username into pre-split template parts.
+
+The classical agent's texts are built in. The GenAI agent serves variants that
+were generated offline with
+
+    python message_catalog.py generate --variants 5
+
+which asks the LLM for each status with a placeholder instead of a real
+username and stores the replies in MESSAGE_CATALOG_FILE. Statuses with no stored
+variant (or a missing file) fall through to a live LLM call.
+"""
+import json
+import os
+import threading
+import zlib
+
+CATALOG_FILE = os.getenv(
+    "MESSAGE_CATALOG_FILE",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', 'message_catalog.json'),
+)
+
+# Marks where the username goes in a template
+PLACEHOLDER = '{username}'
+
+CLASSICAL_TEMPLATES = {
+    'not_found': "User not found.\nप्रयोगकर्ता फेला परेन।",
+    'active': (
+        "Hello, {username}. Your account is currently active. If you are experiencing issues, please contact "
+        "support.\n"
+        "नमस्कार {username}। तपाईंको खाता हाल सक्रिय छ। यदि तपाईंलाई कुनै समस्या छ भने, कृपया सहायता "
+        "केन्द्रमा सम्पर्क गर्नुहोस्।"
+    ),
+    'locked': (
+        'Hello, {username}. Our system detected unusual activity or too many failed attempts. '
+        'Your account has been temporarily locked for security reasons. Please contact support to unlock it.\n'
+        'नमस्कार {username}। हाम्रो प्रणालीले असामान्य गतिविधि वा धेरै पटक गलत प्रयासहरू पत्ता लगाएको छ। '
+        'तपाईंको खाता सुरक्षाको कारण अस्थायी रूपमा लक गरिएको छ। कृपया खाता अनलक गर्न सहायता केन्द्रमा सम्पर्क गर्नुहोस्।'
+    ),
+}
+
+
+class Template:
+    """A template split around its placeholders, so rendering is a single join."""
+    __slots__ = ('parts',)
+
+    def __init__(self, text):
+        self.parts = text.split(PLACEHOLDER)
+
+    def render(self, username):
+        return username.join(self.parts)
+
+
+class MessageCatalog:
+
+    def __init__(self, classical, genai):
+        self.classical = {outcome: Template(text) for outcome, text in classical.items()}
+        self.genai = {status: [Template(text) for text in texts] for status, texts in genai.items() if texts}
+
+    @classmethod
+    def load(cls, path=CATALOG_FILE):
+        """Built-in classical texts, overlaid with whatever ``path`` holds (if it exists)."""
+        try:
+            with open(path, encoding='utf-8') as f:
+                stored = json.load(f)
+        except FileNotFoundError:
+            stored = {}
+        return cls({**CLASSICAL_TEMPLATES, **stored.get('classical', {})}, stored.get('genai', {}))
+
+    def classical_explanation(self, outcome, username):
+        return self.classical[outcome].render(username)
+
+    def genai_explanation(self, status, username):
+        """
+        A stored LLM variant for ``status``, or None if there is none. The same user
+        always gets the same variant, so the text does not change between page loads.
+        """
+        variants = self.genai.get(status)
+        if not variants:
+            return None
+        return variants[zlib.crc32(username.encode('utf-8')) % len(variants)].render(username)
+
+
+_catalog = None
+_catalog_lock = threading.Lock()
+
+
+def get_catalog():
+    """The catalog, loaded on first use and then shared."""
+    global _catalog
+    if _catalog is None:
+        with _catalog_lock:
+            if _catalog is None:
+                _catalog = MessageCatalog.load()
+    return _catalog
+
+
+def reload_catalog():
+    """Drop the loaded catalog so the next call re-reads the file."""
+    global _catalog
+    _catalog = None
+
+
+def save_genai_variants(variants, path=CATALOG_FILE):
+    """Store ``{status: [template, ...]}``, replacing only the statuses given."""
+    try:
+        with open(path, encoding='utf-8') as f:
+            stored = json.load(f)
+    except FileNotFoundError:
+        stored = {}
+    stored['genai'] = {**stored.get('genai', {}), **variants}
+    tmp = f'{path}.tmp'
+    with open(tmp, 'w', encoding='utf-8') as f:
+        json.dump(stored, f, ensure_ascii=False, indent=2)
+    os.replace(tmp, path)
+    reload_catalog()
+
+
+if __name__ == '__main__':
+    import argparse
+
+    from gen_ai_agent import EXPLANATION_STATUSES, explanation_prompt
+    from llm_client import get_client
+
+    parser = argparse.ArgumentParser(description="Pre-generate GenAI explanation variants into the catalog.")
+    sub = parser.add_subparsers(dest='command', required=True)
+    generate = sub.add_parser('generate', help="ask the LLM for VARIANTS texts per account status")
+    generate.add_argument('--variants', type=int, default=5)
+    sub.add_parser('show', help="print the stored variants")
+    args = parser.parse_args()
+
+    if args.command == 'show':
+        for status, templates in get_catalog().genai.items():
+            for template in templates:
+                print(f"[{status}] {PLACEHOLDER.join(template.parts)}\n")
+    else:
+        # A marker the LLM copies verbatim; replies that lose it cannot be personalised and are skipped.
+        marker = 'USER_4F7A'
+        variants = {}
+        for status in EXPLANATION_STATUSES:
+            texts = []
+            for _ in range(args.variants):
+                reply = get_client().generate(explanation_prompt(marker, status), temperature=1)
+                if marker in reply:
+                    texts.append(reply.replace(marker, PLACEHOLDER))
+            if texts:
+                variants[status] = texts
+            print(f"{status}: kept {len(texts)} of {args.variants} variants")
+        save_genai_variants(variants)
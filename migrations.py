@@ -0,0 +1,209 @@
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+from passwords import hash_password, is_hashed
+
+# Plaintext passwords hashed per transaction by hash_plaintext_passwords
+HASH_CHUNK_SIZE = 500
+
+
+def _create_base_schema(conn):
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS users (
+            id INTEGER PRIMARY KEY,
+            username TEXT UNIQUE,
+            password TEXT,
+            email TEXT,
+            phone TEXT,
+            failed_attempts INTEGER DEFAULT 0,
+            is_locked INTEGER DEFAULT 0
+        )
+    ''')
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS feedback (
+            id INTEGER PRIMARY KEY,
+            username TEXT,
+            rating INTEGER,
+            comment TEXT
+        )
+    ''')
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS recovery_requests (
+            id INTEGER PRIMARY KEY,
+            username TEXT,
+            issue TEXT,
+            status TEXT DEFAULT 'Pending'
+        )
+    ''')
+    # One row per chatbot recovery, see recovery_state.py
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS recovery_sessions (
+            session_id TEXT PRIMARY KEY,
+            username TEXT,
+            state TEXT,
+            request_id INTEGER REFERENCES recovery_requests(id),
+            updated_at REAL
+        )
+    ''')
+
+
+def _add_lookup_indexes(conn):
+    # id is included so per-user feedback pages come straight off the index
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_feedback_username ON feedback (username, id)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_recovery_requests_username ON recovery_requests (username)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_recovery_requests_status ON recovery_requests (status)")
+
+
+def _hash_plaintext_passwords(conn):
+    # migrate() has already hashed everything with hash_plaintext_passwords; this
+    # only catches rows written in between, under the write lock
+    rows = conn.execute("SELECT id, password FROM users WHERE password IS NOT NULL").fetchall()
+    conn.executemany(
+        "UPDATE users SET password = ? WHERE id = ?",
+        [(hash_password(password), user_id) for user_id, password in rows if not is_hashed(password)]
+    )
+
+
+def hash_plaintext_passwords(conn, chunk_size=HASH_CHUNK_SIZE, hash_workers=None):
+    """
+    Hash every plaintext password outside of any long transaction.
+
+    Rows are read ``chunk_size`` at a time, hashed on ``hash_workers`` threads
+    (default: one per CPU; hashlib releases the GIL) with no lock held, and
+    written back in one short transaction per chunk. A row whose password changed
+    meanwhile is left alone. Returns the number of passwords hashed.
+    """
+    if not conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'users'").fetchone():
+        return 0
+    hash_workers = hash_workers or os.cpu_count() or 1
+    executor = ThreadPoolExecutor(max_workers=hash_workers) if hash_workers > 1 else None
+    hashed, last_id = 0, -1
+    try:
+        while True:
+            rows = conn.execute(
+                "SELECT id, password FROM users WHERE id > ? AND password IS NOT NULL ORDER BY id LIMIT ?",
+                (last_id, chunk_size)
+            ).fetchall()
+            if not rows:
+                return hashed
+            last_id = rows[-1][0]
+            plaintext = [(user_id, password) for user_id, password in rows if not is_hashed(password)]
+            passwords = [password for _, password in plaintext]
+            hashes = list(executor.map(hash_password, passwords) if executor else map(hash_password, passwords))
+            with conn:
+                hashed += conn.executemany(
+                    "UPDATE users SET password = ? WHERE id = ? AND password = ?",
+                    [(new, user_id, old) for (user_id, old), new in zip(plaintext, hashes)]
+                ).rowcount
+    finally:
+        if executor:
+            executor.shutdown()
+
+
+def _add_user_change_counter(conn):
+    # Bumped by triggers on every users write; processes compare it to know when
+    # their in-memory user caches are stale (see database.get_user)
+    conn.execute("CREATE TABLE IF NOT EXISTS user_changes (id INTEGER PRIMARY KEY CHECK (id = 1), version INTEGER)")
+    conn.execute("INSERT OR IGNORE INTO user_changes (id, version) VALUES (1, 0)")
+    for event in ("INSERT", "UPDATE", "DELETE"):
+        conn.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS users_after_{event.lower()} AFTER {event} ON users
+            BEGIN
+                UPDATE user_changes SET version = version + 1 WHERE id = 1;
+            END
+        ''')
+
+
+def _add_rate_limit_tables(conn):
+    # Shared state for rate_limiter.SQLiteStore (RATE_LIMIT_SHARED=1)
+    conn.execute(
+        "CREATE TABLE IF NOT EXISTS rate_limits (key TEXT PRIMARY KEY, arrival REAL NOT NULL) WITHOUT ROWID"
+    )
+    conn.execute(
+        "CREATE TABLE IF NOT EXISTS last_attempts (username TEXT PRIMARY KEY, at REAL NOT NULL) WITHOUT ROWID"
+    )
+
+
+def _add_login_events(conn):
+    # Append-only log written by database.write_login_events; ip_risk is an index
+    # into database.IP_RISK_LEVELS
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS login_events (
+            id INTEGER PRIMARY KEY,
+            username TEXT NOT NULL,
+            at REAL NOT NULL,
+            success INTEGER NOT NULL,
+            source TEXT,
+            ip_risk INTEGER NOT NULL DEFAULT 0
+        )
+    ''')
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_login_events_username ON login_events (username, at)")
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS login_features (
+            username TEXT PRIMARY KEY,
+            last_attempt REAL NOT NULL,
+            last_success REAL,
+            window_start REAL NOT NULL,
+            attempts_in_window INTEGER NOT NULL,
+            ip_risk INTEGER NOT NULL DEFAULT 0
+        ) WITHOUT ROWID
+    ''')
+
+
+def _add_recovery_request_claims(conn):
+    # recovery_worker.py claims pending requests by setting claimed_by and a
+    # lease_until deadline; a request whose lease has run out can be claimed again.
+    # created_at is only known for requests submitted from now on.
+    conn.execute("ALTER TABLE recovery_requests ADD COLUMN claimed_by TEXT")
+    conn.execute("ALTER TABLE recovery_requests ADD COLUMN lease_until REAL")
+    conn.execute("ALTER TABLE recovery_requests ADD COLUMN created_at REAL")
+    # Pending requests are claimed oldest id first, straight off this index
+    conn.execute("DROP INDEX IF EXISTS idx_recovery_requests_status")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_recovery_requests_status ON recovery_requests (status, id)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_recovery_sessions_request ON recovery_sessions (request_id)")
+
+
+# Append only: the position of a migration is the schema version it produces.
+MIGRATIONS = [
+    _create_base_schema,
+    _add_lookup_indexes,
+    _hash_plaintext_passwords,
+    _add_user_change_counter,
+    _add_rate_limit_tables,
+    _add_login_events,
+    _add_recovery_request_claims,
+]
+
+LATEST_VERSION = len(MIGRATIONS)
+
+
+def get_version(conn):
+    return conn.execute("PRAGMA user_version").fetchone()[0]
+
+
+def migrate(conn):
+    """
+    Bring the schema up to ``LATEST_VERSION``, tracked in ``PRAGMA user_version``.
+
+    An up-to-date database costs a single PRAGMA read. Pending migrations run in
+    one write transaction, and the version is re-read after taking the write lock
+    so concurrent processes never apply the same migration twice. Plaintext
+    passwords are hashed before that transaction (see hash_plaintext_passwords).
+    """
+    version = get_version(conn)
+    if version >= LATEST_VERSION:
+        return LATEST_VERSION
+    if version < MIGRATIONS.index(_hash_plaintext_passwords) + 1:
+        # Slow, so done up front in short parallel chunks rather than under the write lock
+        hash_plaintext_passwords(conn)
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        version = get_version(conn)
+        for target, migration in enumerate(MIGRATIONS[version:], start=version + 1):
+            migration(conn)
+            conn.execute(f"PRAGMA user_version = {target}")
+        conn.commit()
+    except BaseException:
+        conn.rollback()
+        raise
+    return LATEST_VERSION
@@ -3,8 +3,16 @@ from sklearn.model_selection import train_test_split
 from sklearn.ensemble import RandomForestClassifier
 from sklearn.metrics import accuracy_score
 import joblib
+import os
+import sys
 
-df = pd.read_csv('../data/login_attempts.csv')
+MODEL_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(MODEL_DIR, '..'))
+from compiled_forest import export_forest, parity_grid  # noqa: E402
+
+# Loads the whole CSV at once; for large or SQLite-backed training data use
+# train_pipeline.py, which streams it in chunks and publishes versioned models.
+df = pd.read_csv(os.path.join(MODEL_DIR, '..', 'data', 'login_attempts.csv'))
 
 # Convert categorical 'ip_address_risk' to numerical using one-hot encoding
 df = pd.get_dummies(df, columns=['ip_address_risk'], drop_first=True)
@@ -28,7 +36,13 @@ accuracy = accuracy_score(y_test, y_pred)
 print(f"Model Accuracy: {accuracy:.2f}")
 
 # Save the trained model
-joblib.dump(model, 'classical_agent_model.pkl')
+joblib.dump(model, os.path.join(MODEL_DIR, 'classical_agent_model.pkl'))
 
 # Save the columns used for training
-joblib.dump(X.columns.tolist(), 'model_columns.pkl')
\ No newline at end of file
+joblib.dump(X.columns.tolist(), os.path.join(MODEL_DIR, 'model_columns.pkl'))
+
+# Compile the forest into flat NumPy arrays for the runtime evaluator, checking it
+# against model.predict on the held-out set and a grid over the feature space
+export_forest(os.path.join(MODEL_DIR, 'classical_agent_model.pkl'), os.path.join(MODEL_DIR, 'model_columns.pkl'),
+              os.path.join(MODEL_DIR, 'classical_agent_forest.npz'),
+              X=pd.concat([X_test, parity_grid(X.columns.tolist())], ignore_index=True))
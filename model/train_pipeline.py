@@ -0,0 +1,204 @@
+"""
+Streaming training pipeline for the classical agent's model.
+
+Reads labelled rows in chunks from a CSV file, a Parquet file, or the app's
+SQLite database (users joined with their login_features aggregate), so the
+whole dataset never has to fit in memory. Each chunk grows the forest by
+--trees-per-chunk trees (sklearn warm start), fitted with --n-jobs workers.
+--base-version continues from an existing version instead of starting empty.
+
+The result is compiled for the runtime evaluator, checked against sklearn on
+a held-out sample, and published as a new version under model/versions/
+with its metadata. Unless --no-activate is given, model/CURRENT is switched
+to it and running ClassicalAgent processes pick it up without a restart.
+
+Usage:
+    python model/train_pipeline.py --source data/login_attempts.csv
+    python model/train_pipeline.py --source login_security.db --chunk-size 100000 --n-jobs -1
+    python model/train_pipeline.py --source history.parquet --base-version 20261018T120000Z
+"""
+import argparse
+import os
+import sqlite3
+import sys
+import time
+
+import joblib
+import numpy as np
+import pandas as pd
+import sklearn
+from sklearn.ensemble import RandomForestClassifier
+from sklearn.metrics import accuracy_score
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+import model_registry  # noqa: E402
+from compiled_forest import (  # noqa: E402
+    CompiledForest, check_parity, compile_forest, parity_grid, save_compiled_forest
+)
+from database import IP_RISK_LEVELS, LOGIN_FEATURE_WINDOW  # noqa: E402
+
+# Same layout as get_dummies(drop_first=True) produced in train_model.py, so every
+# chunk encodes to identical columns whichever risk levels it happens to contain.
+FEATURE_COLUMNS = ['login_attempts', 'time_since_last_login', 'ip_address_risk_low', 'ip_address_risk_medium']
+TARGET_COLUMN = 'is_locked'
+
+
+def iter_csv(path, chunk_size):
+    yield from pd.read_csv(path, chunksize=chunk_size)
+
+
+def iter_parquet(path, chunk_size):
+    import pyarrow.parquet as pq
+
+    for batch in pq.ParquetFile(path).iter_batches(batch_size=chunk_size):
+        yield batch.to_pandas()
+
+
+def iter_sqlite(path, chunk_size):
+    """
+    One row per user with recorded logins, in keyset pages over users.id: failed
+    attempts and lock state from users, time since last login and IP risk from
+    login_features (as ClassicalAgent computes them at scoring time).
+    """
+    conn = sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+    try:
+        last_id = 0
+        while True:
+            rows = conn.execute('''
+                SELECT u.id, u.failed_attempts, f.last_attempt, f.last_success, f.window_start, f.ip_risk,
+                       u.is_locked
+                FROM users u JOIN login_features f ON f.username = u.username
+                WHERE u.id > ? ORDER BY u.id LIMIT ?
+            ''', (last_id, chunk_size)).fetchall()
+            if not rows:
+                return
+            last_id = rows[-1][0]
+            now = time.time()
+            yield pd.DataFrame({
+                'login_attempts': [row[1] or 0 for row in rows],
+                'time_since_last_login': [(now - (row[3] or row[2])) / 3600 for row in rows],
+                'ip_address_risk': [
+                    IP_RISK_LEVELS[row[5]] if now - row[4] < LOGIN_FEATURE_WINDOW else IP_RISK_LEVELS[0]
+                    for row in rows
+                ],
+                TARGET_COLUMN: [row[6] or 0 for row in rows],
+            })
+    finally:
+        conn.close()
+
+
+def iter_chunks(source, chunk_size):
+    extension = os.path.splitext(source)[1].lower()
+    if extension == '.csv':
+        return iter_csv(source, chunk_size)
+    if extension in ('.parquet', '.pq'):
+        return iter_parquet(source, chunk_size)
+    if extension in ('.db', '.sqlite', '.sqlite3'):
+        return iter_sqlite(source, chunk_size)
+    raise SystemExit(f"Unsupported source {source!r}: expected .csv, .parquet or a SQLite .db file")
+
+
+def encode(chunk):
+    """Return ``(X, y)`` for a raw chunk, with X laid out as FEATURE_COLUMNS."""
+    risk = chunk['ip_address_risk']
+    X = pd.DataFrame({
+        'login_attempts': chunk['login_attempts'].astype(np.float64),
+        'time_since_last_login': chunk['time_since_last_login'].astype(np.float64),
+        'ip_address_risk_low': (risk == 'low').astype(np.uint8),
+        'ip_address_risk_medium': (risk == 'medium').astype(np.uint8),
+    }, columns=FEATURE_COLUMNS)
+    return X, chunk[TARGET_COLUMN].astype(np.int64)
+
+
+def train(chunks, model, trees_per_chunk, holdout=0.2, max_holdout_rows=100_000, seed=42):
+    """
+    Grow ``model`` (a warm-start forest) by ``trees_per_chunk`` trees per chunk.
+
+    A random ``holdout`` share of every chunk is set aside for evaluation, up to
+    ``max_holdout_rows`` rows. Chunks holding a single class are merged into the
+    next one, since a warm-started forest must see every class in each fit.
+    """
+    rng = np.random.default_rng(seed)
+    held_X, held_y = [], []
+    held_rows = rows = fits = 0
+    pending = None
+    for chunk in chunks:
+        X, y = encode(chunk)
+        if held_rows < max_holdout_rows:
+            mask = rng.random(len(X)) < holdout
+            held_X.append(X[mask])
+            held_y.append(y[mask])
+            held_rows += int(mask.sum())
+            X, y = X[~mask], y[~mask]
+        if pending is not None:
+            X, y = pd.concat([pending[0], X], ignore_index=True), pd.concat([pending[1], y], ignore_index=True)
+            pending = None
+        if y.nunique() < 2:
+            pending = (X, y)
+            continue
+        model.n_estimators = (len(model.estimators_) if hasattr(model, 'estimators_') else 0) + trees_per_chunk
+        model.fit(X, y)
+        rows += len(X)
+        fits += 1
+    if not fits:
+        raise SystemExit("No chunk contained both locked and unlocked examples; nothing to train on.")
+    if not held_X:
+        return pd.DataFrame(columns=FEATURE_COLUMNS), pd.Series(dtype=np.int64), rows, fits
+    return pd.concat(held_X, ignore_index=True), pd.concat(held_y, ignore_index=True), rows, fits
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--source', required=True, help=".csv, .parquet or SQLite .db file")
+    parser.add_argument('--chunk-size', type=int, default=50_000)
+    parser.add_argument('--trees-per-chunk', type=int, default=100)
+    parser.add_argument('--n-jobs', type=int, default=-1, help="parallel workers for fitting (-1 = all CPUs)")
+    parser.add_argument('--base-version', help="continue training this version instead of starting empty")
+    parser.add_argument('--holdout', type=float, default=0.2, help="share of each chunk kept for evaluation")
+    parser.add_argument('--no-activate', action='store_true', help="publish without switching CURRENT")
+    args = parser.parse_args()
+
+    started = time.time()
+    if args.base_version:
+        model = joblib.load(os.path.join(model_registry.version_dir(args.base_version), model_registry.MODEL_FILE))
+        model.set_params(warm_start=True, n_jobs=args.n_jobs)
+    else:
+        model = RandomForestClassifier(n_estimators=0, warm_start=True, n_jobs=args.n_jobs, random_state=42)
+
+    X_test, y_test, rows, fits = train(iter_chunks(args.source, args.chunk_size), model, args.trees_per_chunk,
+                                       holdout=args.holdout)
+    accuracy = float(accuracy_score(y_test, model.predict(X_test))) if len(X_test) else None
+
+    version, staging = model_registry.new_staging_dir()
+    joblib.dump(model, os.path.join(staging, model_registry.MODEL_FILE))
+    joblib.dump(FEATURE_COLUMNS, os.path.join(staging, model_registry.COLUMNS_FILE))
+    arrays = compile_forest(model, FEATURE_COLUMNS)
+    parity_rows = parity_grid(FEATURE_COLUMNS)
+    check_parity(model, CompiledForest(**arrays),
+                 pd.concat([X_test, parity_rows], ignore_index=True) if len(X_test) else parity_rows)
+    save_compiled_forest(os.path.join(staging, model_registry.FOREST_FILE), arrays)
+
+    model_registry.publish(version, staging, {
+        'version': version,
+        'created_at': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+        'source': os.path.abspath(args.source),
+        'base_version': args.base_version,
+        'rows': rows,
+        'holdout_rows': len(X_test),
+        'chunks_fitted': fits,
+        'n_estimators': len(model.estimators_),
+        'trees_per_chunk': args.trees_per_chunk,
+        'n_jobs': args.n_jobs,
+        'accuracy': accuracy,
+        'columns': FEATURE_COLUMNS,
+        'sklearn_version': sklearn.__version__,
+        'training_seconds': round(time.time() - started, 2),
+    }, activate=not args.no_activate)
+
+    accuracy_text = f"{accuracy:.3f}" if accuracy is not None else "n/a"
+    print(f"Published model version {version}: {rows} rows, {len(model.estimators_)} trees, "
+          f"holdout accuracy {accuracy_text}" + ("" if args.no_activate else " (now current)"))
+
+
+if __name__ == '__main__':
+    main()
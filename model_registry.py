@@ -0,0 +1,99 @@
+import json
+import os
+import shutil
+import time
+
+MODEL_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'model')
+VERSIONS_DIR = os.path.join(MODEL_DIR, 'versions')
+
+# Holds the name of the active version. It is only ever replaced whole with
+# os.replace, so readers see either the old or the new name, never a partial write.
+CURRENT_FILE = os.path.join(MODEL_DIR, 'CURRENT')
+
+# Files inside each version directory
+FOREST_FILE = 'forest.npz'
+MODEL_FILE = 'model.pkl'
+COLUMNS_FILE = 'columns.pkl'
+METADATA_FILE = 'metadata.json'
+
+
+def version_dir(version, versions_dir=VERSIONS_DIR):
+    return os.path.join(versions_dir, version)
+
+
+def list_versions(versions_dir=VERSIONS_DIR):
+    if not os.path.isdir(versions_dir):
+        return []
+    return sorted(name for name in os.listdir(versions_dir) if not name.startswith('.'))
+
+
+def current_version(current_file=CURRENT_FILE):
+    """Name of the active version, or None if none has been published."""
+    try:
+        with open(current_file) as f:
+            return f.read().strip() or None
+    except FileNotFoundError:
+        return None
+
+
+def load_metadata(version, versions_dir=VERSIONS_DIR):
+    with open(os.path.join(version_dir(version, versions_dir), METADATA_FILE)) as f:
+        return json.load(f)
+
+
+def new_staging_dir(versions_dir=VERSIONS_DIR):
+    """
+    Return ``(version, path)`` for a fresh version. Artifacts are written to the
+    hidden ``path`` and only appear under ``version`` once ``publish`` renames it.
+    """
+    os.makedirs(versions_dir, exist_ok=True)
+    version = time.strftime('%Y%m%dT%H%M%SZ', time.gmtime())
+    suffix = 1
+    while os.path.exists(version_dir(version, versions_dir)):
+        suffix += 1
+        version = f"{time.strftime('%Y%m%dT%H%M%SZ', time.gmtime())}-{suffix}"
+    path = os.path.join(versions_dir, f'.staging-{version}')
+    shutil.rmtree(path, ignore_errors=True)
+    os.makedirs(path)
+    return version, path
+
+
+def publish(version, staging_path, metadata, activate=True, versions_dir=VERSIONS_DIR, current_file=CURRENT_FILE):
+    """Write the metadata, move the staged artifacts into place and (by default) make them current."""
+    with open(os.path.join(staging_path, METADATA_FILE), 'w') as f:
+        json.dump(metadata, f, indent=2)
+    os.rename(staging_path, version_dir(version, versions_dir))
+    if activate:
+        set_current(version, versions_dir, current_file)
+
+
+def set_current(version, versions_dir=VERSIONS_DIR, current_file=CURRENT_FILE):
+    """Point CURRENT at ``version`` (also used to roll back). Running processes pick it up on their next check."""
+    if not os.path.exists(os.path.join(version_dir(version, versions_dir), FOREST_FILE)):
+        raise FileNotFoundError(f"Model version {version!r} not found in {versions_dir}")
+    tmp = f'{current_file}.tmp'
+    with open(tmp, 'w') as f:
+        f.write(version + '\n')
+    os.replace(tmp, current_file)
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description="List model versions or switch the active one.")
+    sub = parser.add_subparsers(dest='command', required=True)
+    sub.add_parser('list', help="list versions, marking the current one")
+    activate = sub.add_parser('activate', help="make VERSION the current model")
+    activate.add_argument('version')
+    args = parser.parse_args()
+
+    if args.command == 'list':
+        current = current_version()
+        for name in list_versions():
+            metadata = load_metadata(name)
+            marker = '*' if name == current else ' '
+            print(f"{marker} {name}  rows={metadata.get('rows')}  trees={metadata.get('n_estimators')}  "
+                  f"accuracy={metadata.get('accuracy')}")
+    else:
+        set_current(args.version)
+        print(f"Current model is now {args.version}")
@@ -0,0 +1,44 @@
+import base64
+import hashlib
+import hmac
+import os
+
+from instrumentation import timed
+
+ALGORITHM = "pbkdf2_sha256"
+
+# Tune with benchmarks/bench_password_hash.py: more iterations cost more CPU per login.
+ITERATIONS = int(os.getenv("PASSWORD_HASH_ITERATIONS", "100000"))
+SALT_BYTES = 16
+
+
+@timed
+def hash_password(password, iterations=None):
+    """Return a salted hash encoded as ``pbkdf2_sha256$<iterations>$<salt>$<hash>``."""
+    iterations = iterations or ITERATIONS
+    salt = os.urandom(SALT_BYTES)
+    digest = hashlib.pbkdf2_hmac("sha256", password.encode("utf-8"), salt, iterations)
+    return "$".join((ALGORITHM, str(iterations), _b64(salt), _b64(digest)))
+
+
+def is_hashed(stored):
+    return isinstance(stored, str) and stored.startswith(ALGORITHM + "$")
+
+
+@timed
+def verify_password(password, stored):
+    """Check ``password`` against a value produced by ``hash_password`` in constant time."""
+    if not is_hashed(stored) or password is None:
+        return False
+    _, iterations, salt, expected = stored.split("$")
+    digest = hashlib.pbkdf2_hmac("sha256", password.encode("utf-8"), base64.b64decode(salt), int(iterations))
+    return hmac.compare_digest(digest, base64.b64decode(expected))
+
+
+def needs_rehash(stored):
+    """True when ``stored`` was hashed with different parameters than the current ones."""
+    return not is_hashed(stored) or int(stored.split("$")[1]) != ITERATIONS
+
+
+def _b64(raw):
+    return base64.b64encode(raw).decode("ascii")
@@ -0,0 +1,164 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+
+import database as db
+
+# Login attempts allowed per minute, and how many may arrive back to back, for
+# one username and for one source (client IP or other caller identifier).
+USER_RATE_PER_MINUTE = float(os.getenv("RATE_LIMIT_USER_PER_MINUTE", "10"))
+USER_BURST = int(os.getenv("RATE_LIMIT_USER_BURST", "5"))
+SOURCE_RATE_PER_MINUTE = float(os.getenv("RATE_LIMIT_SOURCE_PER_MINUTE", "60"))
+SOURCE_BURST = int(os.getenv("RATE_LIMIT_SOURCE_BURST", "30"))
+
+# RATE_LIMIT_SHARED=1 keeps limiter state in SQLite so every process on the host
+# enforces the same limits; otherwise it lives in this process's memory.
+SHARED = os.getenv("RATE_LIMIT_SHARED", "0") == "1"
+
+# Keys remembered by the in-memory store before the least recently used is dropped.
+MAX_KEYS = int(os.getenv("RATE_LIMIT_MAX_KEYS", "100000"))
+
+
+class MemoryStore:
+    """
+    Limiter state in a bounded LRU dict: a theoretical arrival time per key (see
+    ``RateLimiter``) and the time of each username's last attempt.
+    """
+
+    def __init__(self, max_keys=MAX_KEYS):
+        self.max_keys = max_keys
+        self._arrivals = OrderedDict()
+        self._last_attempts = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _put(self, table, key, value):
+        table[key] = value
+        table.move_to_end(key)
+        if len(table) > self.max_keys:
+            table.popitem(last=False)
+
+    def consume(self, key, now, interval, tolerance):
+        with self._lock:
+            arrival = max(self._arrivals.get(key, now), now)
+            if arrival - now > tolerance:
+                return False
+            self._put(self._arrivals, key, arrival + interval)
+            return True
+
+    def record_attempt(self, username, now):
+        with self._lock:
+            self._put(self._last_attempts, username, now)
+
+    def last_attempts(self, usernames):
+        with self._lock:
+            return {name: self._last_attempts[name] for name in usernames if name in self._last_attempts}
+
+
+class SQLiteStore:
+    """
+    The same state in the rate_limits and last_attempts tables, shared by every
+    process using the database. Each check is a single upsert.
+    """
+
+    # Expired rows are deleted after about this many checks.
+    PRUNE_EVERY = 1000
+
+    def __init__(self):
+        self._checks = 0
+
+    def consume(self, key, now, interval, tolerance):
+        with db.get_connection() as conn:
+            with conn:
+                # The update is skipped (and no row returned) when the key is over its limit
+                row = conn.execute('''
+                    INSERT INTO rate_limits (key, arrival) VALUES (:key, :now + :interval)
+                    ON CONFLICT (key) DO UPDATE SET arrival = MAX(arrival, :now) + :interval
+                    WHERE MAX(arrival, :now) - :now <= :tolerance
+                    RETURNING arrival
+                ''', {"key": key, "now": now, "interval": interval, "tolerance": tolerance}).fetchone()
+                self._checks += 1
+                if self._checks % self.PRUNE_EVERY == 0:
+                    conn.execute("DELETE FROM rate_limits WHERE arrival < ?", (now,))
+        return row is not None
+
+    def record_attempt(self, username, now):
+        with db.get_connection() as conn:
+            with conn:
+                conn.execute(
+                    "INSERT INTO last_attempts (username, at) VALUES (?, ?) "
+                    "ON CONFLICT (username) DO UPDATE SET at = excluded.at",
+                    (username, now)
+                )
+
+    def last_attempts(self, usernames):
+        result = {}
+        with db.get_connection() as conn:
+            for chunk in db._chunks(usernames, db.BULK_CHUNK_SIZE):
+                placeholders = ",".join("?" * len(chunk))
+                result.update(conn.execute(
+                    f"SELECT username, at FROM last_attempts WHERE username IN ({placeholders})", chunk
+                ).fetchall())
+        return result
+
+
+class RateLimiter:
+    """
+    Login throttling keyed by username and by source.
+
+    Each key gets the generic cell rate algorithm (a token bucket kept as one
+    timestamp): an attempt is allowed when the key's theoretical arrival time is
+    at most ``(burst - 1)`` intervals ahead of now, and then pushes it one
+    interval further. A check is one O(1) update, with no per-attempt history.
+    The source is checked first so a flood from one client is turned away without
+    touching the per-user state.
+    """
+
+    def __init__(self, store=None, user_rate=USER_RATE_PER_MINUTE, user_burst=USER_BURST,
+                 source_rate=SOURCE_RATE_PER_MINUTE, source_burst=SOURCE_BURST):
+        self.store = store or MemoryStore()
+        self.user_interval = 60.0 / user_rate
+        self.user_tolerance = self.user_interval * (user_burst - 1)
+        self.source_interval = 60.0 / source_rate
+        self.source_tolerance = self.source_interval * (source_burst - 1)
+
+    def allow(self, username, source=None, now=None):
+        """Count one login attempt; return False if it should be rejected."""
+        now = time.time() if now is None else now
+        if source is not None and not self.store.consume(
+                f"source:{source}", now, self.source_interval, self.source_tolerance):
+            return False
+        if not self.store.consume(f"user:{username}", now, self.user_interval, self.user_tolerance):
+            return False
+        self.store.record_attempt(username, now)
+        return True
+
+    def allow_source(self, source, now=None):
+        """Count one request from ``source`` that is not tied to a username (e.g. a registration)."""
+        now = time.time() if now is None else now
+        return self.store.consume(f"source:{source}", now, self.source_interval, self.source_tolerance)
+
+    def hours_since_last_attempt(self, usernames, now=None):
+        """``{username: hours}`` since each user's last allowed login attempt; users never seen are left out."""
+        now = time.time() if now is None else now
+        return {name: (now - at) / 3600 for name, at in self.store.last_attempts(list(usernames)).items()}
+
+
+_limiter = None
+_limiter_lock = threading.Lock()
+
+
+def get_limiter():
+    """Return the process-wide limiter, built from the environment on first use."""
+    global _limiter
+    if _limiter is None:
+        with _limiter_lock:
+            if _limiter is None:
+                _limiter = RateLimiter(SQLiteStore() if SHARED else MemoryStore())
+    return _limiter
+
+
+def set_limiter(limiter):
+    """Replace the process-wide limiter, e.g. with different limits in load tests."""
+    global _limiter
+    _limiter = limiter
@@ -0,0 +1,82 @@
+import database as db
+
+STARTED = "started"
+CONTACT_VERIFIED = "contact_verified"
+TRANSACTION_VERIFIED = "transaction_verified"
+PASSWORD_RESET = "password_reset"
+
+# Allowed forward transitions; each state has exactly one successor.
+NEXT_STATE = {
+    STARTED: CONTACT_VERIFIED,
+    CONTACT_VERIFIED: TRANSACTION_VERIFIED,
+    TRANSACTION_VERIFIED: PASSWORD_RESET,
+}
+
+# Number of the three chatbot recovery steps completed in each state.
+STEPS_COMPLETED = {
+    STARTED: 0,
+    CONTACT_VERIFIED: 1,
+    TRANSACTION_VERIFIED: 2,
+    PASSWORD_RESET: 3,
+}
+
+RECOVERY_ISSUE = "Account locked - chatbot recovery"
+
+
+class InvalidTransition(Exception):
+    pass
+
+
+class RecoveryStateMachine:
+    """
+    Chatbot recovery progress stored in the recovery_sessions table.
+
+    Every lookup and transition is a single primary-key statement, so any
+    process that shares the database can continue a session.
+    """
+
+    @staticmethod
+    def start(session_id, username):
+        """Open a recovery request for ``username`` and (re)start the session at STARTED."""
+        return db.start_recovery_session(session_id, username, RECOVERY_ISSUE, STARTED)
+
+    @staticmethod
+    def get_session(session_id):
+        """Return ``(username, state, request_id)`` or ``None``."""
+        return db.get_recovery_session(session_id)
+
+    @staticmethod
+    def get_state(session_id):
+        session = db.get_recovery_session(session_id)
+        return session[1] if session else None
+
+    @staticmethod
+    def steps_completed(session_id):
+        return STEPS_COMPLETED.get(RecoveryStateMachine.get_state(session_id), 0)
+
+    @staticmethod
+    def verify_contact(session_id, username):
+        RecoveryStateMachine._advance(session_id, username, STARTED)
+
+    @staticmethod
+    def verify_transaction(session_id, username):
+        RecoveryStateMachine._advance(session_id, username, CONTACT_VERIFIED)
+
+    @staticmethod
+    def reset_password(session_id, username, new_password):
+        """Set the new password and unlock the account, only as part of a successful transition."""
+        if not db.complete_password_reset(session_id, username, TRANSACTION_VERIFIED, PASSWORD_RESET, new_password,
+                                          request_status="Resolved"):
+            RecoveryStateMachine._invalid(session_id, TRANSACTION_VERIFIED)
+
+    @staticmethod
+    def _advance(session_id, username, from_state, request_status=None):
+        if not db.advance_recovery_session(session_id, username, from_state, NEXT_STATE[from_state], request_status):
+            RecoveryStateMachine._invalid(session_id, from_state)
+
+    @staticmethod
+    def _invalid(session_id, from_state):
+        raise InvalidTransition(
+            f"Recovery session {session_id} is in state {RecoveryStateMachine.get_state(session_id)!r}, "
+            f"expected {from_state!r}"
+        )
@@ -0,0 +1,209 @@
+"""
+Background processing of submitted recovery requests.
+
+Each round claims up to --batch-size pending requests with a lease (see
+database.claim_recovery_requests), so any number of workers, in any number of
+processes, can share the queue without processing a request twice. The checks
+for a batch run concurrently on a thread pool: account status and contact
+details (ClassicalAgent.validate_recovery_info) per request, and one lock-model
+call for the whole batch. Results are written back with one bulk update per
+outcome. A request whose checks fail keeps its claim until the lease runs out
+and is then retried.
+
+Outcomes:
+    Resolved      the account is not locked, nothing to recover
+    Verified      the issue text contains the account's email or phone and the
+                  lock model does not consider the account risky; ready to unlock
+    Needs Review  locked, but the automated checks were not enough
+    Rejected      no such user
+
+Queue depth, claimed requests, the age of the oldest pending request and the
+processing rate are exported as ``login_sim_recovery_queue_*`` gauges.
+
+Usage:
+    python recovery_worker.py --threads 8 --batch-size 100
+    python recovery_worker.py --once
+"""
+import argparse
+import collections
+import logging
+import os
+import socket
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+import database as db
+from auth_service import AuthService
+from classical_agent import ClassicalAgent
+from instrumentation import register_gauges, start_exporter
+
+RESOLVED = "Resolved"
+VERIFIED = "Verified"
+NEEDS_REVIEW = "Needs Review"
+REJECTED = "Rejected"
+
+# Processing rate is averaged over this many seconds
+RATE_WINDOW = 60.0
+
+log = logging.getLogger(__name__)
+
+# Characters stripped from the ends of words when looking for contact details in an issue
+_TOKEN_PUNCTUATION = ".,;:!?()[]<>\"'"
+
+
+def contact_candidates(issue):
+    return {word.strip(_TOKEN_PUNCTUATION) for word in (issue or "").split()} - {""}
+
+
+class RecoveryWorker:
+
+    def __init__(self, worker_id=None, batch_size=50, lease_seconds=60.0, threads=4, poll_interval=1.0):
+        self.worker_id = worker_id or f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:6]}"
+        self.batch_size = batch_size
+        self.lease_seconds = lease_seconds
+        self.poll_interval = poll_interval
+        self._pool = ThreadPoolExecutor(max_workers=threads, thread_name_prefix="recovery-check")
+        self._lock = threading.Lock()
+        self._recent = collections.deque()  # (finished_at, requests) per batch within RATE_WINDOW
+        self.processed = 0
+        self.failed = 0
+        self.batches = 0
+        self.outcomes = collections.Counter()
+        self.errors = 0
+        self.started = time.monotonic()
+
+    def check(self, username, issue):
+        """Status for one request from the per-user checks, or None when the lock model has to decide."""
+        status = AuthService.check_account_status(username)
+        if status == "not_found":
+            return REJECTED
+        if status == "active":
+            return RESOLVED
+        if not any(ClassicalAgent.validate_recovery_info(username, "contact", value)
+                   for value in contact_candidates(issue)):
+            return NEEDS_REVIEW
+        return None
+
+    def run_once(self):
+        """Claim and process one batch. Returns the number of requests claimed."""
+        claimed = db.claim_recovery_requests(self.worker_id, self.batch_size, self.lease_seconds)
+        if not claimed:
+            return 0
+        scores = self._pool.submit(ClassicalAgent.score_users, sorted({username for _, username, _ in claimed}))
+        checks = [(request_id, username, self._pool.submit(self.check, username, issue))
+                  for request_id, username, issue in claimed]
+
+        by_status = collections.defaultdict(list)
+        failed = 0
+        try:
+            predictions = scores.result()
+        except Exception:
+            predictions = {}
+        for request_id, username, future in checks:
+            try:
+                status = future.result()
+            except Exception:
+                failed += 1
+                continue
+            if status is None:
+                if username not in predictions:
+                    failed += 1
+                    continue
+                status = VERIFIED if predictions[username][0] == 0 else NEEDS_REVIEW
+            by_status[status].append(request_id)
+
+        for status, request_ids in by_status.items():
+            db.resolve_recovery_requests(request_ids, status, claimed_by=self.worker_id)
+        self._record(len(claimed) - failed, failed, by_status)
+        return len(claimed)
+
+    def run(self, stop=None):
+        """
+        Process batches until ``stop`` (a threading.Event) is set, polling while the
+        queue is empty. A round that fails (e.g. the database is busy) is logged and
+        retried after ``poll_interval``.
+        """
+        stop = stop or threading.Event()
+        while not stop.is_set():
+            try:
+                claimed = self.run_once()
+            except Exception:
+                log.exception("Recovery worker %s: round failed, retrying in %.1fs", self.worker_id,
+                              self.poll_interval)
+                with self._lock:
+                    self.errors += 1
+                claimed = 0
+            if not claimed:
+                stop.wait(self.poll_interval)
+
+    def _record(self, processed, failed, by_status):
+        now = time.monotonic()
+        with self._lock:
+            self.processed += processed
+            self.failed += failed
+            self.batches += 1
+            for status, request_ids in by_status.items():
+                self.outcomes[status] += len(request_ids)
+            self._recent.append((now, processed))
+            while self._recent and self._recent[0][0] < now - RATE_WINDOW:
+                self._recent.popleft()
+
+    def stats(self):
+        now = time.monotonic()
+        with self._lock:
+            recent = sum(count for finished_at, count in self._recent if finished_at >= now - RATE_WINDOW)
+            # A worker younger than RATE_WINDOW has only been processing for that long
+            window = min(RATE_WINDOW, now - self.started)
+            stats = {
+                "processed": self.processed,
+                "failed": self.failed,
+                "batches": self.batches,
+                "errors": self.errors,
+                "processed_per_second": recent / window if window > 0 else 0.0,
+            }
+            stats.update({f"outcome_{status.lower().replace(' ', '_')}": count
+                          for status, count in self.outcomes.items()})
+        stats.update(db.get_recovery_queue_stats())
+        return stats
+
+    def close(self):
+        self._pool.shutdown()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--db", help=f"database file (default: {db.DB_FILE})")
+    parser.add_argument("--batch-size", type=int, default=50, help="requests claimed per round")
+    parser.add_argument("--threads", type=int, default=4, help="threads running the checks")
+    parser.add_argument("--lease", type=float, default=60.0, help="seconds a claim lasts before others may retry it")
+    parser.add_argument("--poll-interval", type=float, default=1.0, help="seconds to wait when the queue is empty")
+    parser.add_argument("--once", action="store_true", help="drain the queue once and exit")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+
+    if args.db:
+        db.configure_pool(args.db)
+    db.init_db()
+    worker = RecoveryWorker(batch_size=args.batch_size, lease_seconds=args.lease, threads=args.threads,
+                            poll_interval=args.poll_interval)
+    register_gauges("recovery_queue", worker.stats)
+    start_exporter()
+    try:
+        if args.once:
+            while worker.run_once():
+                pass
+        else:
+            worker.run()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        worker.close()
+        stats = worker.stats()
+        print(f"Processed {stats['processed']} request(s) in {stats['batches']} batch(es), {stats['failed']} failed; "
+              f"{stats['pending']} still pending")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,241 @@
+"""
+Headless multi-process serving mode: a small HTTP/JSON API in front of
+AuthService, ClassicalAgent and LoginSimulator.
+
+The listening socket is opened once and shared by --workers forked processes,
+each answering requests on its own threads, so reads scale across cores over
+WAL. The frequent request-path writes (update_user, record_failed_login,
+submit_feedback_to_db) are not run by the workers themselves: they go to one
+writer process that commits whatever has queued up in a single transaction
+(see group_commit.py) and answers each caller once it is durable. Rarer writes
+(registration, password changes, recovery sessions) still run in the worker
+that handles them, so they can briefly wait on the writer's lock.
+
+Workers run without the per-process user cache: with several of them, each
+would serve the others' writes late.
+
+With more than one worker, set RATE_LIMIT_SHARED=1 so login limits are enforced
+across all of them rather than per worker.
+
+Endpoints (all POST with a JSON body, except /health):
+
+    GET  /health
+    POST /login      {"username", "password"}
+    POST /register   {"username", "password", "email", "phone"}
+    POST /status     {"username"}
+    POST /explain    {"username", "agent": "classical" | "genai"}
+    POST /score      {"usernames": [...]}          at most MAX_SCORE_USERNAMES names
+    POST /recovery   {"username"}                  starts recovery of a locked account
+    POST /chat       {"username", "message", "history": [...], "session_id"}
+
+Recovery of a locked account only goes through /chat with the session_id that
+/recovery returned; progress is read from the recovery_sessions table, never
+from the caller's history, which is only used for chats with active accounts.
+    POST /feedback   {"username", "rating", "comment"}
+
+Usage:
+    python server.py --port 8000 --workers 4
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import signal
+import socket
+import sys
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import database as db
+from auth_service import AuthService
+from classical_agent import ClassicalAgent
+from gen_ai_agent import GenAIAgent
+from group_commit import STOP, WriterClient, run_writer
+from login_simulator import LoginSimulator
+from recovery_state import RecoveryStateMachine
+
+# Largest /score request; re-scoring the whole table is left to admin_cli.py
+MAX_SCORE_USERNAMES = 1000
+
+
+def login(body, source):
+    return {"message": AuthService.login_or_register(body["username"], body["password"], None, None, "Login",
+                                                     source=source)}
+
+
+def register(body, source):
+    return {"message": AuthService.login_or_register(body["username"], body["password"], body.get("email"),
+                                                     body.get("phone"), "Register", source=source)}
+
+
+def status(body, source):
+    return {"status": AuthService.check_account_status(body["username"])}
+
+
+def explain(body, source):
+    if body.get("agent", "classical") == "genai":
+        return {"explanation": GenAIAgent.get_genai_block_explanation(body["username"])}
+    return {"explanation": ClassicalAgent.get_classical_block_explanation(body["username"])}
+
+
+def score(body, source):
+    usernames = body["usernames"]
+    if not isinstance(usernames, list) or len(usernames) > MAX_SCORE_USERNAMES:
+        raise ValueError(f"usernames must be a list of at most {MAX_SCORE_USERNAMES} names")
+    scores = ClassicalAgent.score_users(usernames)
+    return {"scores": {username: {"prediction": prediction, "probability": probability}
+                       for username, (prediction, probability) in scores.items()}}
+
+
+def recovery(body, source):
+    username = body["username"]
+    if AuthService.check_account_status(username) != "locked":
+        raise ValueError(f"{username!r} is not a locked account")
+    session_id = uuid.uuid4().hex
+    RecoveryStateMachine.start(session_id, username)
+    return {"session_id": session_id, "reply": LoginSimulator.start_genai_recovery_chat("", username)}
+
+
+def chat(body, source):
+    username = body["username"]
+    session_id = body.get("session_id")
+    history = body.get("history", [])
+    if AuthService.check_account_status(username) == "locked":
+        session = RecoveryStateMachine.get_session(session_id) if session_id else None
+        if not session or session[0] != username:
+            raise ValueError("Locked accounts are recovered with the session_id from /recovery")
+        history = []
+    return {"reply": LoginSimulator.genai_chat_response(body["message"], history, username, session_id=session_id)}
+
+
+def feedback(body, source):
+    db.submit_feedback_to_db(body["username"], int(body["rating"]), body.get("comment", ""))
+    return {"ok": True}
+
+
+ROUTES = {
+    "/login": login,
+    "/register": register,
+    "/status": status,
+    "/explain": explain,
+    "/score": score,
+    "/recovery": recovery,
+    "/chat": chat,
+    "/feedback": feedback,
+}
+
+
+class Handler(BaseHTTPRequestHandler):
+    # Keep-alive, so clients are not paying for a TCP handshake per request
+    protocol_version = "HTTP/1.1"
+    # Headers and body are written separately; without this Nagle's algorithm holds
+    # the body back until the client's delayed ACK (~40 ms per response)
+    disable_nagle_algorithm = True
+    access_log = False
+
+    def do_GET(self):
+        if self.path == "/health":
+            self._send(200, {"status": "ok", "pid": os.getpid()})
+        else:
+            self._send(404, {"error": f"Unknown endpoint {self.path}"})
+
+    def do_POST(self):
+        route = ROUTES.get(self.path)
+        if route is None:
+            self._send(404, {"error": f"Unknown endpoint {self.path}"})
+            return
+        try:
+            body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+        except ValueError:
+            self._send(400, {"error": "Request body is not valid JSON"})
+            return
+        try:
+            self._send(200, route(body, self.client_address[0]))
+        except (KeyError, TypeError, ValueError) as e:
+            self._send(400, {"error": f"Bad request: {e!r}"})
+        except Exception as e:
+            self._send(500, {"error": f"{type(e).__name__}: {e}"})
+
+    def _send(self, code, payload):
+        data = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+        self.send_response(code)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        if self.access_log:
+            super().log_message(format, *args)
+
+
+def serve_worker(worker_id, sock, requests, replies):
+    # Exit through SystemExit so atexit handlers (e.g. the login event flush) run
+    signal.signal(signal.SIGTERM, lambda *_: sys.exit(0))
+    db.set_write_delegate(WriterClient(worker_id, requests, replies))
+    # Every other worker writes to the same users; a per-process cache would lag them
+    db.USER_CACHE_SIZE = 0
+    server = ThreadingHTTPServer(sock.getsockname()[:2], Handler, bind_and_activate=False)
+    server.socket.close()
+    server.socket = sock
+    server.daemon_threads = True
+    try:
+        server.serve_forever()
+    finally:
+        server.server_close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--db", help=f"database file (default: {db.DB_FILE})")
+    parser.add_argument("--max-batch", type=int, default=256, help="most writes committed in one transaction")
+    parser.add_argument("--flush-interval", type=float, default=0.002,
+                        help="seconds the writer waits for more writes after the first")
+    parser.add_argument("--access-log", action="store_true", help="log every request to stderr")
+    args = parser.parse_args()
+    Handler.access_log = args.access_log
+
+    if "fork" not in multiprocessing.get_all_start_methods():
+        raise SystemExit("server.py shares its listening socket with forked workers; this platform cannot fork.")
+    ctx = multiprocessing.get_context("fork")
+
+    if args.db:
+        db.configure_pool(args.db)
+    db.init_db()
+    # Start every child with an empty pool: SQLite connections must not cross a fork
+    db.configure_pool()
+
+    requests = ctx.Queue()
+    replies = [ctx.Queue() for _ in range(args.workers)]
+    writer = ctx.Process(target=run_writer, name="sqlite-writer",
+                         args=(db.DB_FILE, requests, replies, args.max_batch, args.flush_interval))
+    writer.start()
+
+    sock = socket.create_server((args.host, args.port), backlog=1024)
+    workers = [ctx.Process(target=serve_worker, name=f"http-worker-{i}", args=(i, sock, requests, replies[i]))
+               for i in range(args.workers)]
+    for worker in workers:
+        worker.start()
+    print(f"Serving on http://{args.host}:{sock.getsockname()[1]} with {args.workers} worker(s)", flush=True)
+
+    signal.signal(signal.SIGTERM, lambda *_: sys.exit(0))
+    try:
+        for worker in workers:
+            worker.join()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        for worker in workers:
+            worker.terminate()
+        for worker in workers:
+            worker.join()
+        requests.put(STOP)
+        writer.join(timeout=10)
+        sock.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,122 @@
+import threading
+import time
+from collections import OrderedDict
+
+
+class _InFlight:
+    __slots__ = ('done', 'value', 'error')
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.value = None
+        self.error = None
+
+
+class TTLCache:
+    """
+    Thread-safe TTL + LRU cache with request coalescing.
+
+    ``get_or_compute`` runs ``compute`` at most once per key at a time: callers that
+    ask for a key while it is being computed wait for that result instead of
+    starting their own call (e.g. an LLM request or a database read). Failures are
+    never cached. A result computed while its key was invalidated is returned to
+    its callers but not stored, so a read racing a write cannot cache stale data.
+    """
+
+    def __init__(self, maxsize=256, ttl=3600.0):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._entries = OrderedDict()  # key -> (value, expires_at, compute_seconds)
+        self._in_flight = {}
+        self._generation = 0
+        self._lock = threading.Lock()
+        self._stats = {"hits": 0, "misses": 0, "coalesced": 0, "evictions": 0, "saved_seconds": 0.0}
+
+    def get_or_compute(self, key, compute):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                value, expires_at, compute_seconds = entry
+                if expires_at > time.monotonic():
+                    self._entries.move_to_end(key)
+                    self._stats["hits"] += 1
+                    self._stats["saved_seconds"] += compute_seconds
+                    return value
+                del self._entries[key]
+            flight = self._in_flight.get(key)
+            if flight is not None:
+                self._stats["coalesced"] += 1
+                leader = False
+            else:
+                flight = self._in_flight[key] = _InFlight()
+                self._stats["misses"] += 1
+                leader = True
+                generation = self._generation
+
+        if not leader:
+            flight.done.wait()
+            if flight.error is not None:
+                raise flight.error
+            return flight.value
+
+        started = time.perf_counter()
+        try:
+            flight.value = compute()
+        except BaseException as e:
+            flight.error = e
+            raise
+        finally:
+            with self._lock:
+                if self._in_flight.get(key) is flight:
+                    del self._in_flight[key]
+                if flight.error is None and generation == self._generation:
+                    self._store(key, flight.value, time.perf_counter() - started)
+            flight.done.set()
+        return flight.value
+
+    def peek(self, key):
+        """Return the cached value for ``key``, or None, without computing or waiting for it."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[1] <= time.monotonic():
+                return None
+            self._entries.move_to_end(key)
+            self._stats["hits"] += 1
+            self._stats["saved_seconds"] += entry[2]
+            return entry[0]
+
+    def _store(self, key, value, compute_seconds):
+        self._entries[key] = (value, time.monotonic() + self.ttl, compute_seconds)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+            self._stats["evictions"] += 1
+
+    def discard(self, key):
+        """Drop a single key."""
+        with self._lock:
+            self._generation += 1
+            self._entries.pop(key, None)
+            self._in_flight.pop(key, None)
+
+    def invalidate(self, predicate=None):
+        """Drop every entry whose key matches ``predicate`` (all entries if omitted)."""
+        with self._lock:
+            self._generation += 1
+            if predicate is None:
+                self._entries.clear()
+                self._in_flight.clear()
+                return
+            for key in [key for key in self._entries if predicate(key)]:
+                del self._entries[key]
+            # Later callers start a fresh computation instead of joining one that may be stale
+            for key in [key for key in self._in_flight if predicate(key)]:
+                del self._in_flight[key]
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats["size"] = len(self._entries)
+        lookups = stats["hits"] + stats["misses"] + stats["coalesced"]
+        stats["hit_rate"] = (stats["hits"] + stats["coalesced"]) / lookups if lookups else 0.0
+        return stats
@@ -0,0 +1,63 @@
+"""
+Streamlit caches used by main.py.
+
+main.py is re-executed on every rerun, so anything that must happen once per
+process (schema migration, model and LLM client warm-up, registering the change
+listener that invalidates these caches) lives here instead.
+"""
+import os
+
+import streamlit as st
+
+import database as db
+import instrumentation
+from auth_service import AuthService
+from classical_agent import ClassicalAgent, load_model
+from llm_client import get_client
+
+FEEDBACK_PAGE_SIZE = 50
+
+# Writes made in this process invalidate entries immediately (see forget_user);
+# this bounds how long a change made by another process can go unnoticed.
+UI_CACHE_TTL = float(os.getenv("UI_CACHE_TTL", "10"))
+
+
+@st.cache_resource(show_spinner=False)
+def warm_up():
+    """Migrate the schema, load the model and build the LLM client once per process, not once per rerun."""
+    db.init_db()
+    load_model()
+    get_client()
+    instrumentation.start_exporter()
+    db.add_user_change_listener(forget_user)  # a no-op when a rebuilt cache entry registers it again
+
+
+@st.cache_data(ttl=UI_CACHE_TTL, show_spinner=False)
+def account_status(username):
+    """``"locked"``, ``"active"`` or ``"not_found"``, from the lean lock-state lookup."""
+    return AuthService.check_account_status(username)
+
+
+# GenAI explanations are not cached here: GenAIAgent has its own cache, which
+# (unlike st.cache_data) never keeps a failed LLM call.
+@st.cache_data(ttl=UI_CACHE_TTL, show_spinner=False)
+def classical_explanation(username):
+    return ClassicalAgent.get_classical_block_explanation(username)
+
+
+@st.cache_data(ttl=UI_CACHE_TTL, show_spinner=False)
+def feedback_page(username):
+    """The user's latest FEEDBACK_PAGE_SIZE feedback entries as table rows."""
+    feedback, _ = db.get_feedback_for_user(username, limit=FEEDBACK_PAGE_SIZE)
+    return [{"rating": rating, "comment": comment} for _, rating, comment in feedback]
+
+
+def submit_feedback(username, rating, comment):
+    db.submit_feedback_to_db(username, rating, comment)
+    feedback_page.clear(username)
+
+
+def forget_user(username):
+    """Called by database.py after every write to ``username``'s row."""
+    account_status.clear(username)
+    classical_explanation.clear(username)